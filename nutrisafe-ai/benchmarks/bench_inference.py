@@ -0,0 +1,276 @@
+# file name: bench_inference.py
+"""Latency/throughput benchmarks for the inference hot paths
+
+Runs each function over generated payloads for a grid of ingredient-list
+lengths and condition counts, with the ingredient cache cold (cleared
+before every call) and warm, plus end-to-end throughput at several
+concurrency levels (which is what the micro-batchers see), the chunked
+bulk paths at several batch sizes, ml_api's ingredient tagging with and
+without its cache, and the cost of turning /analyze results into
+response bytes. ml_api/main.py is timed with a 9-feature
+stand-in model when the shipped one doesn't take its rows (see
+stand_in_model.py). Usage:
+
+    python bench_inference.py                      # results/<git rev>.json
+    python bench_inference.py --quick --out base.json
+    python compare.py base.json results/<rev>.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+ROOT = Path(__file__).parent.parent.absolute()
+os.environ.setdefault("NUTRISAFE_MODEL_DIR", str(ROOT / "ml_api" / "models"))
+os.environ.setdefault("NUTRISAFE_DATASET_DIR", str(ROOT / "ml" / "datasets"))
+sys.path.insert(0, str(ROOT / "ml_api"))
+sys.path.insert(0, str(ROOT / "ml"))
+warnings.filterwarnings("ignore")
+
+import stand_in_model
+from ingredient_parser import parse_ingredients
+from payloads import PayloadGenerator
+
+
+def summarize(latencies: List[float], wall: float, items: int = 1) -> Dict:
+    """Latency per call; ops_per_s counts payloads, `items` per call"""
+    ms = np.array(latencies) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "ops_per_s": len(ms) * items / wall if wall > 0 else 0.0
+    }
+
+
+def measure(fn: Callable, inputs: List, before: Callable = None, items: int = 1) -> Dict:
+    """Call fn(*args) for each args tuple; `before` runs untimed ahead of every call"""
+    latencies = []
+    timed = 0.0
+    for args in inputs:
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - started
+        latencies.append(elapsed)
+        timed += elapsed
+    return summarize(latencies, timed, items)
+
+
+def checked_chunks(fn: Callable) -> Callable:
+    """A chunk function that raises on per-payload errors instead of returning them"""
+    def run(payloads):
+        errors = [result["error"] for result in fn(payloads) if "error" in result]
+        if errors:
+            raise RuntimeError(f"{len(errors)}/{len(payloads)} payloads failed: {errors[0]}")
+    return run
+
+
+def measure_concurrent(fn: Callable, inputs: List, workers: int) -> Dict:
+    """Throughput with `workers` callers at once; latency is per call"""
+    def timed_call(args):
+        started = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(timed_call, inputs[:workers]))  # spin up threads
+        started = time.perf_counter()
+        latencies = list(pool.map(timed_call, inputs))
+        wall = time.perf_counter() - started
+    return summarize(latencies, wall)
+
+
+def record(results: Dict, name: str, run: Callable):
+    try:
+        results[name] = run()
+    except Exception as e:
+        results[name] = {"error": f"{type(e).__name__}: {e}"}
+    summary = results[name]
+    if "error" in summary:
+        print(f"{name:72s} ERROR {summary['error'][:60]}")
+    else:
+        print(f"{name:72s} p50={summary['p50_ms']:8.3f}ms p99={summary['p99_ms']:8.3f}ms "
+              f"{summary['ops_per_s']:9.1f}/s")
+
+
+def ingredient_tokens(payload: Dict) -> List[str]:
+    """The tokens main.prepare_payload tags for one payload"""
+    text = payload["product"]["ingredients"].lower()
+    return [text[span.start:span.end] for span in parse_ingredients(text) if span.end - span.start >= 3]
+
+
+def serializers(app, path: str = "/analyze"):
+    """(untyped, typed) result -> body functions for one route
+
+    untyped is FastAPI's path without a response model: jsonable_encoder and
+    the stock JSONResponse. typed is what serialize_response does with the
+    route's declared model, rendered by the app's response class.
+    """
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    route = next(r for r in app.routes if getattr(r, "path", None) == path and "POST" in r.methods)
+
+    def untyped(result):
+        return JSONResponse(jsonable_encoder(result)).body
+
+    def typed(result):
+        value, errors = route.response_field.validate(result, {}, loc=("response",))
+        if errors:
+            raise ValueError(f"Response does not match {route.response_model.__name__}: {errors}")
+        content = route.response_field.serialize(value, exclude_unset=route.response_model_exclude_unset)
+        return route.response_class(content).body
+
+    return untyped, typed
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(n: int, ingredient_counts: List[int], condition_counts: List[int],
+                   concurrency: List[int], batch_sizes: List[int], seed: int) -> Dict:
+    import ml_inference
+    import main
+
+    stand_in_model.install(main, seed)
+
+    analyzer = ml_inference.analyzer
+    generator = PayloadGenerator(seed)
+    results = {}
+
+    def clear_caches():
+        analyzer.ingredient_cache.clear()
+        main.ingredient_cache.clear()
+
+    for ingredients in ingredient_counts:
+        for conditions in condition_counts:
+            payloads = generator.payloads(n, ingredients, conditions)
+            requests = [ml_inference.AnalysisRequest(**p) for p in payloads]
+            case = f"ing={ingredients},cond={conditions}"
+
+            for cache in ("cold", "warm"):
+                before = clear_caches if cache == "cold" else None
+                if cache == "warm":
+                    for request in requests:
+                        ml_inference.run_analysis(request)
+
+                record(results, f"ml_inference.analyze_ingredients[{case},cache={cache}]",
+                       lambda: measure(analyzer.analyze_ingredients,
+                                       [(r.product.ingredients, r.userConditions) for r in requests], before))
+                record(results, f"ml_inference.run_analysis[{case},cache={cache}]",
+                       lambda: measure(ml_inference.run_analysis, [(r,) for r in requests], before))
+                record(results, f"ml_api.analyze[{case},cache={cache}]",
+                       lambda: measure(main.analyze_payload, [(p,) for p in payloads], before))
+
+            record(results, f"ml_inference.predict_risk_score[{case}]",
+                   lambda: measure(analyzer.predict_risk_score,
+                                   [(r.product, r.userConditions) for r in requests]))
+
+            # Whether main.ingredient_cache beats just re-running tag_ingredient
+            tokens = [(ingredient_tokens(p),) for p in payloads]
+            record(results, f"ml_api.tag_ingredient[{case},direct]",
+                   lambda: measure(lambda ings: [main.tag_ingredient(ing) for ing in ings], tokens))
+            for cache in ("cold", "warm"):
+                before = clear_caches if cache == "cold" else None
+                if cache == "warm":
+                    for ings, in tokens:
+                        main.ingredient_cache.warm(ings)
+                record(results, f"ml_api.tag_ingredient[{case},cache={cache}]",
+                       lambda: measure(lambda ings: [main.ingredient_cache.get(ing) for ing in ings],
+                                       tokens, before))
+
+    payloads = generator.payloads(n)
+    requests = [ml_inference.AnalysisRequest(**p) for p in payloads]
+    record(results, "ml_inference.get_healthy_alternatives",
+           lambda: measure(analyzer.get_healthy_alternatives,
+                           [(r.product, r.userConditions) for r in requests]))
+    record(results, "ml_api.detect_product_category[name]",
+           lambda: measure(main.detect_product_category, [(p["product"]["name"],) for p in payloads]))
+    record(results, "ml_api.detect_product_category[name,tags]",
+           lambda: measure(main.detect_product_category,
+                           [(p["product"]["name"], p["product"]["category_tags"]) for p in payloads]))
+
+    bodies = {
+        "ml_inference": (ml_inference.app, [ml_inference.run_analysis(r) for r in requests]),
+        "ml_api": (main.app, [main.analyze_payload(p) for p in payloads])
+    }
+    for app_name, (app, app_results) in bodies.items():
+        untyped, typed = serializers(app)
+        record(results, f"{app_name}.serialize[untyped]", lambda: measure(untyped, [(r,) for r in app_results]))
+        record(results, f"{app_name}.serialize[typed]", lambda: measure(typed, [(r,) for r in app_results]))
+
+    for workers in concurrency:
+        batch_requests = [ml_inference.AnalysisRequest(**p) for p in generator.payloads(max(n, workers * 20))]
+        record(results, f"ml_inference.run_analysis[concurrency={workers}]",
+               lambda: measure_concurrent(ml_inference.run_analysis, [(r,) for r in batch_requests], workers))
+
+    # Bulk paths (/analyze/stream, batch_score.py): one model pass per chunk
+    for size in batch_sizes:
+        chunk_payloads = generator.payloads(max(n, size * 20))
+        chunks = [(chunk_payloads[i:i + size],) for i in range(0, len(chunk_payloads) - size + 1, size)]
+        record(results, f"ml_inference.run_analysis_chunk[batch={size}]",
+               lambda: measure(checked_chunks(ml_inference.run_analysis_chunk), chunks, items=size))
+        record(results, f"ml_api.analyze_chunk[batch={size}]",
+               lambda: measure(checked_chunks(main.analyze_chunk), chunks, items=size))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the NutriSafe inference hot paths")
+    parser.add_argument("--n", type=int, default=300, help="payloads per case")
+    parser.add_argument("--ingredients", type=int, nargs="+", default=[5, 20, 60])
+    parser.add_argument("--conditions", type=int, nargs="+", default=[1, 3, 6])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64],
+                        help="payloads per analyze_chunk / run_analysis_chunk call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--quick", action="store_true", help="small grid for a fast smoke run")
+    parser.add_argument("--out", help="output JSON (default results/<git rev>.json)")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.n, args.ingredients, args.conditions, args.concurrency = 50, [10], [2], [1, 8]
+        args.batch_sizes = [1, 16]
+
+    revision = git_revision()
+    results = run_benchmarks(
+        args.n, args.ingredients, args.conditions, args.concurrency, args.batch_sizes, args.seed
+    )
+
+    out = Path(args.out) if args.out else Path(__file__).parent / "results" / f"{revision}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({
+            "meta": {
+                "revision": revision,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "cpus": os.cpu_count(),
+                "n": args.n,
+                "seed": args.seed,
+                "ml_api_model": "stand-in" if stand_in_model.active(sys.modules["main"]) else "shipped"
+            },
+            "results": results
+        }, f, indent=2)
+    print(f"\nResults saved to {out}")
@@ -0,0 +1,311 @@
+# file name: bench_memory.py
+"""Memory-footprint regression benchmarks for serving and training
+
+Every measurement runs in its own subprocess so peaks don't leak between
+cases:
+
+    serving   RSS after importing each app, tracemalloc peak per request,
+              bytes retained per request and RSS growth over the run
+              (main.py runs with stand_in_model.py when the shipped
+              models don't take its rows; "model" says which)
+    training  FoodSafetyModel.train_full_pipeline on a synthetic OFF sample
+              of --rows rows, with RSS and tracemalloc peaks per phase
+              (load, label, extract, fit, save)
+
+Usage:
+
+    python bench_memory.py --rows 1000 10000 100000
+    python bench_memory.py --rows 1000000 10000000 --no-tracemalloc
+    python bench_memory.py --baseline results/memory-abc123.json --tolerance 15
+
+Exits with status 1 when a value exceeds memory_thresholds.json or grows
+more than --tolerance percent over the baseline.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+ROOT = Path(__file__).parent.parent.absolute()
+DATASET_DIR = ROOT / "ml" / "datasets"
+THRESHOLDS = Path(__file__).parent / "memory_thresholds.json"
+sys.path.insert(0, str(ROOT / "ml_api"))
+warnings.filterwarnings("ignore")
+
+from process_memory import rss_mb, peak_rss_mb
+
+OFF_NUTRIENTS = {
+    "sugars_100g": (0, 60),
+    "carbohydrates_100g": (0, 90),
+    "salt_100g": (0, 4),
+    "fat_100g": (0, 50),
+    "saturated-fat_100g": (0, 20),
+    "fiber_100g": (0, 15),
+    "proteins_100g": (0, 40),
+    "energy-kcal_100g": (20, 700)
+}
+
+
+class PhaseTracker:
+    """Context manager factory recording peak RSS / traced memory per named phase"""
+
+    def __init__(self, trace: bool, interval: float = 0.005):
+        self.trace = trace
+        self.interval = interval
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self._peak_rss = 0.0
+        threading.Thread(target=self._sample, name="rss-sampler", daemon=True).start()
+
+    def _sample(self):
+        while True:
+            self._peak_rss = max(self._peak_rss, rss_mb())
+            time.sleep(self.interval)
+
+    @contextmanager
+    def __call__(self, name: str):
+        if self.trace:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        self._peak_rss = rss_mb()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase = self.phases.setdefault(
+                name, {"peak_rss_mb": 0.0, "peak_traced_mb": 0.0, "seconds": 0.0}
+            )
+            phase["seconds"] += time.perf_counter() - started
+            phase["peak_rss_mb"] = max(phase["peak_rss_mb"], self._peak_rss, rss_mb())
+            if self.trace:
+                peak = (tracemalloc.get_traced_memory()[1] - traced_before) / 1024 / 1024
+                phase["peak_traced_mb"] = max(phase["peak_traced_mb"], peak)
+
+
+def write_off_sample(path: Path, rows: int, seed: int = 42, chunk: int = 100000):
+    """Synthetic OpenFoodFacts export, written in chunks so 10M rows fit in memory"""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(pd.read_csv(DATASET_DIR / "training_data.csv")["ingredient"].dropna().unique())
+
+    for start in range(0, rows, chunk):
+        n = min(chunk, rows - start)
+        picks = rng.choice(vocabulary, size=(n, 8))
+        frame = pd.DataFrame({
+            "product_name": [f"Product {i}" for i in range(start, start + n)],
+            "ingredients_text": [", ".join(row) for row in picks]
+        })
+        for column, (low, high) in OFF_NUTRIENTS.items():
+            frame[column] = rng.uniform(low, high, n)
+        frame.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+
+
+def train_worker(rows: int, trace: bool) -> Dict:
+    workdir = Path(tempfile.mkdtemp(prefix="nutrisafe-membench-"))
+    try:
+        shutil.copytree(DATASET_DIR, workdir / "datasets",
+                        ignore=shutil.ignore_patterns("__pycache__", "openfoodfacts_sample.csv"))
+        write_off_sample(workdir / "datasets" / "openfoodfacts_sample.csv", rows)
+        os.chdir(workdir)
+        sys.path.insert(0, str(ROOT / "ml"))
+        from train_model import FoodSafetyModel
+
+        baseline = rss_mb()
+        if trace:
+            tracemalloc.start()
+        tracker = PhaseTracker(trace)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            FoodSafetyModel(phase=tracker).train_full_pipeline()
+
+        return {
+            "baseline_rss_mb": baseline,
+            "max_rss_mb": peak_rss_mb(),
+            "phases": tracker.phases
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def serve_worker(app: str, requests: int, trace: bool) -> Dict:
+    os.environ.setdefault("NUTRISAFE_MODEL_DIR", str(ROOT / "ml_api" / "models"))
+    os.environ.setdefault("NUTRISAFE_DATASET_DIR", str(DATASET_DIR))
+    sys.path.insert(0, str(ROOT / "ml"))
+
+    baseline = rss_mb()
+    stand_in = False
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        if app == "ml_inference":
+            import ml_inference
+            handler = lambda payload: ml_inference.run_analysis(ml_inference.AnalysisRequest(**payload))
+        else:
+            import main
+            import stand_in_model
+            # The shipped models don't take main's 9-feature rows
+            stand_in = stand_in_model.install(main)
+            handler = main.analyze_payload
+    imported = rss_mb()
+
+    # Imported afterwards so its pandas import isn't counted against the app
+    from payloads import PayloadGenerator
+    payloads = PayloadGenerator().payloads(requests + 20)
+    try:
+        for payload in payloads[:20]:
+            handler(payload)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+    if trace:
+        tracemalloc.start()
+    before = rss_mb()
+    peaks, retained = [], []
+    for payload in payloads[20:]:
+        if trace:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+        handler(payload)
+        if trace:
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - current) / 1024)
+            retained.append((after - current) / 1024)
+
+    result = {
+        "model": "stand-in" if stand_in else "shipped",
+        "baseline_rss_mb": baseline,
+        "import_rss_mb": imported - baseline,
+        "rss_growth_mb": rss_mb() - before,
+        "max_rss_mb": peak_rss_mb()
+    }
+    if trace:
+        result.update({
+            "request_peak_kb_p50": float(np.percentile(peaks, 50)),
+            "request_peak_kb_p99": float(np.percentile(peaks, 99)),
+            "request_peak_kb_max": float(np.max(peaks)),
+            "retained_kb_per_request": float(np.mean(retained))
+        })
+    return result
+
+
+def run_worker(args: List[str]) -> Dict:
+    """Run one measurement in a fresh interpreter and parse its JSON result"""
+    proc = subprocess.run(
+        [sys.executable, __file__, "--worker"] + args,
+        capture_output=True, text=True, cwd=Path(__file__).parent
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def errors(results: Dict, prefix: str = "") -> List[str]:
+    """Messages for every benchmark that failed instead of producing figures"""
+    messages = []
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if "error" in value:
+                messages.append(f"{name} failed: {value['error']}")
+            else:
+                messages.extend(errors(value, name + "."))
+    return messages
+
+
+def check(flat: Dict[str, float], thresholds: Dict[str, float], baseline: Dict[str, float],
+          tolerance: float) -> List[str]:
+    """Messages for every value over its absolute threshold or grown past the baseline"""
+    failures = []
+    for key, limit in thresholds.items():
+        if key in flat and flat[key] > limit:
+            failures.append(f"{key} = {flat[key]:.1f} exceeds threshold {limit:.1f}")
+    for key, old in baseline.items():
+        # Only memory figures; timings are covered by bench_inference.py
+        if key not in flat or not key.endswith(("_mb", "_kb")) or key.endswith("baseline_rss_mb"):
+            continue
+        allowed = old * (1 + tolerance / 100) + 1.0  # +1 MB/KB absorbs allocator noise
+        if flat[key] > allowed:
+            failures.append(f"{key} = {flat[key]:.1f} grew from {old:.1f} (allowed {allowed:.1f})")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory benchmarks for NutriSafe serving and training")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000],
+                        help="synthetic OFF sample sizes for the training benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests per serving benchmark")
+    parser.add_argument("--apps", nargs="+", default=["ml_inference", "ml_api"])
+    parser.add_argument("--no-tracemalloc", action="store_true",
+                        help="RSS only; tracemalloc slows large training runs several times over")
+    parser.add_argument("--skip-training", action="store_true")
+    parser.add_argument("--thresholds", default=str(THRESHOLDS))
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=15.0, help="allowed growth over baseline in percent")
+    parser.add_argument("--out", help="output JSON (default results/memory-<git rev>.json)")
+    parser.add_argument("--worker", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    trace = not args.no_tracemalloc
+
+    if args.worker:
+        kind, value = args.worker[0], args.worker[1]
+        trace = args.worker[2] == "trace"
+        result = train_worker(int(value), trace) if kind == "train" else serve_worker(value, args.requests, trace)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    from bench_inference import git_revision
+
+    mode = "trace" if trace else "rss"
+    results = {"serving": {}, "training": {}}
+    for app in args.apps:
+        results["serving"][app] = run_worker(["serve", app, mode, "--requests", str(args.requests)])
+        print(f"serving {app}: {results['serving'][app]}")
+    if not args.skip_training:
+        for rows in args.rows:
+            results["training"][f"rows={rows}"] = run_worker(["train", str(rows), mode])
+            print(f"training rows={rows}: {results['training'][f'rows={rows}']}")
+
+    revision = git_revision()
+    out = Path(args.out) if args.out else Path(__file__).parent / "results" / f"memory-{revision}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": {"revision": revision, "tracemalloc": trace}, "results": results}, f, indent=2)
+    print(f"\nResults saved to {out}")
+
+    thresholds = {}
+    if Path(args.thresholds).exists():
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = flatten(json.load(f)["results"])
+
+    # A failed benchmark has no figures to check, so it must not pass silently
+    failures = errors(results) + check(flatten(results), thresholds, baseline, args.tolerance)
+    if failures:
+        print(f"\n{len(failures)} failed benchmark(s) or memory regression(s):")
+        for message in failures:
+            print(f"  {message}")
+        sys.exit(1)
+    print("\nNo memory regressions")
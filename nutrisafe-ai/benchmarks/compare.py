@@ -0,0 +1,76 @@
+# file name: compare.py
+"""Diff two benchmark result files and flag regressions
+
+    python compare.py results/abc123.json results/def456.json --threshold 10
+
+Exits with status 1 when any case's p50/p99 got slower, or its throughput
+dropped, by more than the threshold percentage, and when any case errored
+in head, even if it errored in base too: a case that never runs must not
+pass unnoticed.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List
+
+# metric -> True when larger is better
+METRICS = {"p50_ms": False, "p99_ms": False, "ops_per_s": True}
+
+
+def load(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base: Dict, head: Dict, threshold: float) -> List[str]:
+    """Print a per-case table; returns the regressed and erroring case names"""
+    regressions = []
+    base_results, head_results = base["results"], head["results"]
+
+    print(f"{'case':72s} " + " ".join(f"{m:>18s}" for m in METRICS))
+    for name in sorted(set(base_results) | set(head_results)):
+        old, new = base_results.get(name), head_results.get(name)
+        if old is None or new is None:
+            print(f"{name:72s} {'only in ' + ('head' if old is None else 'base'):>18s}")
+            continue
+        if "error" in new:
+            status = "still error" if "error" in old else "error"
+            print(f"{name:72s} {status:>18s}  {new['error'][:60]}")
+            regressions.append(name)
+            continue
+        if "error" in old:
+            print(f"{name:72s} {'fixed':>18s}")
+            continue
+
+        cells = []
+        regressed = False
+        for metric, higher_is_better in METRICS.items():
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            worse = -change if higher_is_better else change
+            flag = "!" if worse > threshold else " "
+            regressed |= worse > threshold
+            cells.append(f"{new[metric]:9.3f} {change:+6.1f}%{flag}")
+        print(f"{name:72s} " + " ".join(cells))
+        if regressed:
+            regressions.append(name)
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+    args = parser.parse_args()
+
+    base, head = load(args.base), load(args.head)
+    print(f"base {base['meta']['revision']}  ->  head {head['meta']['revision']}\n")
+    regressions = compare(base, head, args.threshold)
+
+    if regressions:
+        print(f"\n{len(regressions)} error(s) or regression(s) over {args.threshold:.0f}%:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
+    print("\nNo regressions")
@@ -0,0 +1,463 @@
+# file name: load_test.py
+"""Offline load test of /analyze behind a local OpenFoodFacts stand-in
+
+    python load_test.py run --serve ml_inference --rate 50 --concurrency 16 --duration 30
+    python load_test.py run --ml-url http://localhost:8000 --rate 0 --concurrency 32
+    python load_test.py off-server --port 8090
+
+Each simulated scan does what server.js does for a barcode: GET the product
+from the OFF stand-in, then POST it to the ML service's /analyze. The
+stand-in is a threaded stdlib HTTP server answering the two OFF endpoints
+server.js calls (product by barcode, search) with canned JSON. Products come
+from a fixture OFF JSONL/CSV dump (--fixture) or are generated from the
+training data. `off-server` runs only the stand-in, for driving the Node
+server with OFF_BASE_URL=http://localhost:8090.
+
+Arrivals are open-loop Poisson at --rate scans/s (0 = closed loop: every
+worker starts its next scan as soon as the last one ends), served by
+--concurrency workers. Products are drawn Zipf(--zipf) by popularity rank.
+Open-loop latency counts from the scheduled arrival, so time spent queued
+behind a saturated service is not hidden. Everything runs on localhost.
+"""
+import argparse
+import bisect
+import http.client
+import json
+import queue
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, quote, urlsplit
+
+import numpy as np
+
+ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(ROOT / "ml_api"))
+
+STAGES = ("queue_wait", "off_fetch", "analyze", "end_to_end")
+
+
+# ---------------- FIXTURE CATALOG ----------------
+def generated_catalog(n: int, seed: int, missing_nutriments: float) -> List[Dict]:
+    """OFF-shaped products from the training data (see payloads.py)"""
+    from payloads import PayloadGenerator
+
+    generator = PayloadGenerator(seed)
+    catalog = []
+    for i in range(n):
+        payload = generator.payload(generator.random.randint(3, 25), 0)
+        product = payload["product"]
+        catalog.append({
+            "code": str(2000000000000 + i),
+            "product_name": product["name"],
+            "brands": "Load Test",
+            "ingredients_text": product["ingredients"],
+            "categories": product["category_tags"][0][3:],
+            "categories_tags": product["category_tags"],
+            "nutriments": {} if generator.random.random() < missing_nutriments else product["nutriments"]
+        })
+    return catalog
+
+
+def fixture_catalog(path: Path, n: int) -> List[Dict]:
+    """The first n products of an OFF dump that have a barcode"""
+    from off_dump import read_chunks, with_aliases
+
+    catalog = []
+    for chunk in read_chunks(path, 10000):
+        for record in chunk:
+            if str(record["code"]).strip():
+                record["nutriments"] = with_aliases(record["nutriments"])
+                catalog.append(record)
+                if len(catalog) >= n:
+                    return catalog
+    return catalog
+
+
+# ---------------- OFF STAND-IN ----------------
+class OffStandIn(ThreadingHTTPServer):
+    """GET /api/v0/product/<code>.json and /cgi/search.pl?search_terms=...&json=1"""
+
+    daemon_threads = True
+
+    def __init__(self, catalog: List[Dict], port: int = 0, latency_ms: float = 0):
+        # Canned once: serving a product is a dict lookup and a write
+        self.products = {
+            p["code"]: json.dumps({"code": p["code"], "status": 1, "product": p}).encode()
+            for p in catalog
+        }
+        self.names = [(p["product_name"].lower(), p) for p in catalog]
+        self.latency = latency_ms / 1000
+        self.requests = 0
+        super().__init__(("127.0.0.1", port), _OffHandler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def search(self, terms: str, page_size: int) -> bytes:
+        terms = terms.lower()
+        products = [p for name, p in self.names if terms in name][:page_size]
+        return json.dumps({"count": len(products), "products": products}).encode()
+
+
+class _OffHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle hold the body
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server: OffStandIn = self.server
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        url = urlsplit(self.path)
+        if url.path.startswith("/api/") and "/product/" in url.path:
+            code = url.path.rsplit("/", 1)[-1].removesuffix(".json")
+            body = server.products.get(code) or json.dumps(
+                {"code": code, "status": 0, "status_verbose": "product not found"}
+            ).encode()
+        elif url.path == "/cgi/search.pl":
+            query = parse_qs(url.query)
+            body = server.search(query.get("search_terms", [""])[0], int(query.get("page_size", ["24"])[0]))
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# ---------------- CLIENT SIDE ----------------
+class Client:
+    """One keep-alive connection per worker and host"""
+
+    def __init__(self, base_url: str, timeout: float):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method: str, path: str, body: bytes = None, headers: Dict = None):
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body, headers or {})
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (ConnectionError, http.client.HTTPException):
+                # Server closed an idle keep-alive connection: reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+class StageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.errors = Counter()
+
+    def record(self, seconds: float, error: Optional[str] = None):
+        with self._lock:
+            if error is None:
+                self.latencies.append(seconds)
+            else:
+                self.errors[error] += 1
+
+    def summary(self, wall: float) -> Dict:
+        ms = np.array(self.latencies) * 1000
+        total = len(ms) + sum(self.errors.values())
+        summary = {
+            "ok": len(ms),
+            "errors": dict(self.errors),
+            "error_rate": sum(self.errors.values()) / total if total else 0.0,
+            "throughput_per_s": len(ms) / wall if wall > 0 else 0.0
+        }
+        if len(ms):
+            summary.update({
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p90_ms": float(np.percentile(ms, 90)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max())
+            })
+        return summary
+
+
+def error_kind(e: Exception) -> str:
+    return "timeout" if isinstance(e, socket.timeout) else type(e).__name__
+
+
+class ZipfSampler:
+    """Product index with P(rank r) ~ 1 / r**s over a seeded popularity order"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.order = list(range(n))
+        rng.shuffle(self.order)
+        self.cumulative = np.cumsum(1.0 / np.arange(1, n + 1) ** s).tolist()
+
+    def sample(self, rng: random.Random) -> int:
+        rank = bisect.bisect_left(self.cumulative, rng.random() * self.cumulative[-1])
+        return self.order[min(rank, len(self.order) - 1)]
+
+
+class LoadTest:
+    def __init__(self, args, catalog: List[Dict], off_url: str, ml_url: str, conditions: List[str]):
+        self.args = args
+        self.catalog = catalog
+        self.off_url = off_url
+        self.ml_url = ml_url
+        self.conditions = conditions
+        self.stats = {stage: StageStats() for stage in STAGES}
+        self.tiers = Counter()
+        self.omitted = Counter()
+        self.sampler = ZipfSampler(len(catalog), args.zipf, random.Random(args.seed))
+
+    def scan(self, rng: random.Random) -> tuple:
+        """(product index, user conditions) for one simulated scan"""
+        count = rng.randint(0, self.args.max_conditions)
+        return self.sampler.sample(rng), rng.sample(self.conditions, min(count, len(self.conditions)))
+
+    def run_scan(self, off: Client, ml: Client, scheduled: float, index: int,
+                 conditions: List[str], measured: bool):
+        record = (lambda stage, seconds, error=None: self.stats[stage].record(seconds, error)) \
+            if measured else (lambda *a, **k: None)
+        started = time.perf_counter()
+        record("queue_wait", started - scheduled)
+
+        code = self.catalog[index]["code"]
+        try:
+            status, body = off.request("GET", f"/api/v0/product/{quote(code)}.json")
+            if status != 200:
+                raise RuntimeError(f"http_{status}")
+            product = json.loads(body)["product"]
+        except Exception as e:
+            record("off_fetch", 0, str(e) if isinstance(e, RuntimeError) else error_kind(e))
+            record("end_to_end", 0, "off_fetch")
+            return
+        fetched = time.perf_counter()
+        record("off_fetch", fetched - started)
+
+        # Same payload server.js builds from an OFF product
+        payload = {
+            "product": {
+                "name": product.get("product_name") or "Unknown Product",
+                "product_name": product.get("product_name") or "Unknown Product",
+                "ingredients": product.get("ingredients_text") or "",
+                "ingredients_text": product.get("ingredients_text") or "",
+                "nutriments": product.get("nutriments") or {},
+                "category_tags": product.get("categories_tags") or []
+            },
+            "userConditions": conditions
+        }
+        headers = {"Content-Type": "application/json"}
+        if self.args.deadline_ms:
+            headers["X-Deadline-Ms"] = str(self.args.deadline_ms)
+        try:
+            status, body = ml.request("POST", "/analyze", json.dumps(payload).encode(), headers)
+            if status != 200:
+                raise RuntimeError(f"http_{status}")
+            result = json.loads(body)
+        except Exception as e:
+            kind = str(e) if isinstance(e, RuntimeError) else error_kind(e)
+            record("analyze", 0, kind)
+            record("end_to_end", 0, "analyze")
+            return
+        done = time.perf_counter()
+        record("analyze", done - fetched)
+        record("end_to_end", done - scheduled)
+        if measured:
+            self.tiers[result.get("tier", "unknown")] += 1
+            for stage in result.get("omitted", []):
+                self.omitted[stage.split("[")[0]] += 1
+
+    def worker(self, worker_id: int, work: queue.Queue, start: float, stop: float):
+        off = Client(self.off_url, self.args.timeout)
+        ml = Client(self.ml_url, self.args.timeout)
+        rng = random.Random(self.args.seed * 1000 + worker_id)
+        warm_until = start + self.args.warmup
+        while True:
+            if self.args.rate > 0:
+                item = work.get()
+                if item is None:
+                    return
+                scheduled, index, conditions = item
+            else:
+                scheduled = time.perf_counter()
+                if scheduled >= stop:
+                    return
+                index, conditions = self.scan(rng)
+            self.run_scan(off, ml, scheduled, index, conditions, measured=scheduled >= warm_until)
+
+    def run(self) -> Dict:
+        args = self.args
+        work = queue.Queue()
+        start = time.perf_counter()
+        stop = start + args.warmup + args.duration
+        workers = [
+            threading.Thread(target=self.worker, args=(i, work, start, stop), daemon=True)
+            for i in range(args.concurrency)
+        ]
+        for thread in workers:
+            thread.start()
+
+        if args.rate > 0:
+            # Open loop: Poisson arrivals regardless of how the service keeps up
+            rng = random.Random(args.seed)
+            arrival = start
+            while True:
+                arrival += rng.expovariate(args.rate)
+                if arrival >= stop:
+                    break
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                work.put((arrival, *self.scan(rng)))
+            for _ in workers:
+                work.put(None)
+        for thread in workers:
+            thread.join()
+
+        wall = time.perf_counter() - (start + args.warmup)
+        return {
+            "config": {
+                key: getattr(args, key) for key in (
+                    "rate", "concurrency", "duration", "warmup", "zipf", "products",
+                    "max_conditions", "missing_nutriments", "deadline_ms", "off_latency_ms", "seed"
+                )
+            },
+            "ml_url": self.ml_url,
+            "wall_s": wall,
+            "stages": {stage: self.stats[stage].summary(wall) for stage in STAGES},
+            "tiers": dict(self.tiers),
+            "omitted": dict(self.omitted)
+        }
+
+
+# ---------------- ML SERVICE ----------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_ml(app: str, port: int) -> subprocess.Popen:
+    """Start ml_inference (ml/) or main (ml_api/) under uvicorn and wait for it"""
+    cwd = ROOT / ("ml" if app == "ml_inference" else "ml_api")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{app}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=cwd
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{app} exited with {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/health" if app == "ml_inference" else "/")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"{app} did not become healthy on port {port}")
+
+
+def print_report(report: Dict):
+    print(f"\n{'stage':12s} {'ok':>8s} {'err%':>6s} {'/s':>8s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}")
+    for stage, s in report["stages"].items():
+        if "p50_ms" not in s:
+            print(f"{stage:12s} {s['ok']:8d} {s['error_rate'] * 100:5.1f}% {'-':>8s}")
+            continue
+        print(f"{stage:12s} {s['ok']:8d} {s['error_rate'] * 100:5.1f}% {s['throughput_per_s']:8.1f} "
+              f"{s['p50_ms']:7.1f}ms {s['p90_ms']:7.1f}ms {s['p99_ms']:7.1f}ms {s['max_ms']:7.1f}ms")
+    for stage, s in report["stages"].items():
+        if s["errors"]:
+            print(f"  {stage} errors: {s['errors']}")
+    print(f"  tiers: {report['tiers']}" + (f"  omitted: {report['omitted']}" if report["omitted"] else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline /analyze load test")
+    parser.add_argument("--fixture", type=Path, help="OFF JSONL/CSV dump (default: generated products)")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--missing-nutriments", type=float, default=0.2,
+                        help="share of generated products without nutriments")
+    parser.add_argument("--off-latency-ms", type=float, default=0, help="added to every stand-in response")
+    parser.add_argument("--seed", type=int, default=42)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="drive /analyze")
+    target = run.add_mutually_exclusive_group(required=True)
+    target.add_argument("--ml-url", help="running ML service, e.g. http://localhost:8000")
+    target.add_argument("--serve", choices=["ml_inference", "main"], help="start this app locally")
+    run.add_argument("--rate", type=float, default=20, help="Poisson arrivals per second; 0 = closed loop")
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--duration", type=float, default=20, help="measured seconds")
+    run.add_argument("--warmup", type=float, default=3, help="unmeasured seconds first")
+    run.add_argument("--zipf", type=float, default=1.0, help="popularity skew; 0 = uniform")
+    run.add_argument("--max-conditions", type=int, default=3)
+    run.add_argument("--deadline-ms", type=float, default=0, help="send X-Deadline-Ms")
+    run.add_argument("--timeout", type=float, default=10)
+    run.add_argument("--out", type=Path, help="write the report as JSON")
+
+    stand_in = commands.add_parser("off-server", help="serve only the OFF stand-in")
+    stand_in.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+
+    catalog = (fixture_catalog(args.fixture, args.products) if args.fixture
+               else generated_catalog(args.products, args.seed, args.missing_nutriments))
+    if not catalog:
+        sys.exit("No products in the fixture")
+    off = OffStandIn(catalog, args.port if args.command == "off-server" else 0, args.off_latency_ms)
+    print(f"✓ OFF stand-in with {len(catalog)} products on {off.url}")
+    if args.command == "off-server":
+        try:
+            off.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    threading.Thread(target=off.serve_forever, daemon=True).start()
+
+    ml_process = None
+    ml_url = args.ml_url
+    if args.serve:
+        port = free_port()
+        ml_process = serve_ml(args.serve, port)
+        ml_url = f"http://127.0.0.1:{port}"
+        print(f"✓ {args.serve} on {ml_url}")
+
+    from payloads import PayloadGenerator
+    conditions = [d.replace("_", " ") for d in PayloadGenerator(args.seed).diseases]
+    mode = f"{args.rate:g}/s Poisson" if args.rate > 0 else "closed loop"
+    print(f"Driving {ml_url}/analyze: {mode}, {args.concurrency} workers, zipf={args.zipf:g}, "
+          f"{args.warmup:g}s warmup + {args.duration:g}s")
+    try:
+        report = LoadTest(args, catalog, off.url, ml_url, conditions).run()
+    finally:
+        off.shutdown()
+        if ml_process is not None:
+            ml_process.terminate()
+            ml_process.wait()
+
+    print_report(report)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"✓ Report written to {args.out}")
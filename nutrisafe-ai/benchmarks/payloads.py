@@ -0,0 +1,97 @@
+# file name: payloads.py
+"""Synthetic /analyze payloads built from the shipped training data
+
+Ingredients and nutriment profiles come from datasets/training_data.csv,
+product names and categories from datasets/healthy_products.csv, so the
+payloads exercise the same tokens and value ranges the models were trained
+on. Generation is seeded and therefore reproducible between runs.
+"""
+import ast
+import random
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+DATASET_DIR = Path(__file__).parent.parent / "ml" / "datasets"
+
+# Both services read nutriments, but spell two keys differently
+NUTRIENT_ALIASES = {
+    "saturated_fat_100g": "saturated-fat_100g",
+    "energy_kcal_100g": "energy-kcal_100g"
+}
+
+
+class PayloadGenerator:
+    def __init__(self, seed: int = 42, dataset_dir: Path = DATASET_DIR):
+        self.random = random.Random(seed)
+
+        training = pd.read_csv(dataset_dir / "training_data.csv")
+        self.ingredients = sorted(training["ingredient"].dropna().unique())
+        self.diseases = sorted(training["disease"].dropna().unique())
+        self.nutrient_profiles = [
+            ast.literal_eval(n) for n in training["nutrients"].dropna().unique()
+        ]
+
+        products = pd.read_csv(dataset_dir / "healthy_products.csv")
+        self.products = list(zip(products["product_name"], products["category"]))
+
+    def ingredients_text(self, count: int) -> str:
+        """OFF-style ingredient list with some nesting and percentages"""
+        parts = []
+        remaining = count
+        while remaining > 0:
+            roll = self.random.random()
+            if roll < 0.15 and remaining >= 3:
+                # Compound ingredient: "chocolate (sugar, cocoa butter)"
+                inner = self.random.sample(self.ingredients, min(remaining - 1, self.random.randint(2, 4)))
+                parts.append(f"{self.random.choice(self.ingredients)} ({', '.join(inner)})")
+                remaining -= len(inner) + 1
+            elif roll < 0.3:
+                parts.append(f"{self.random.choice(self.ingredients)} {self.random.randint(1, 60)}%")
+                remaining -= 1
+            else:
+                parts.append(self.random.choice(self.ingredients))
+                remaining -= 1
+        return ", ".join(parts)
+
+    def nutriments(self) -> Dict[str, float]:
+        nutriments = dict(self.random.choice(self.nutrient_profiles))
+        for key, alias in NUTRIENT_ALIASES.items():
+            if key in nutriments:
+                nutriments[alias] = nutriments[key]
+        return nutriments
+
+    def conditions(self, count: int) -> List[str]:
+        diseases = self.random.sample(self.diseases, min(count, len(self.diseases)))
+        return [d.replace("_", " ") for d in diseases]
+
+    def payload(self, ingredient_count: int = 10, condition_count: int = 2) -> Dict:
+        name, category = self.random.choice(self.products)
+        return {
+            "product": {
+                "name": name,
+                "ingredients": self.ingredients_text(ingredient_count),
+                "nutriments": self.nutriments(),
+                "category_tags": [f"en:{str(category).lower()}"]
+            },
+            "userConditions": self.conditions(condition_count)
+        }
+
+    def payloads(self, n: int, ingredient_count: int = 10, condition_count: int = 2,
+                 unique_ingredients: Optional[int] = None) -> List[Dict]:
+        """n payloads; unique_ingredients caps the token vocabulary (cache-friendly traffic)"""
+        if unique_ingredients is None:
+            return [self.payload(ingredient_count, condition_count) for _ in range(n)]
+
+        full_vocabulary = self.ingredients
+        self.ingredients = self.random.sample(full_vocabulary, min(unique_ingredients, len(full_vocabulary)))
+        try:
+            return [self.payload(ingredient_count, condition_count) for _ in range(n)]
+        finally:
+            self.ingredients = full_vocabulary
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(PayloadGenerator().payload(), indent=2))
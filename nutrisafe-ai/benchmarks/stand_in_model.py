@@ -0,0 +1,46 @@
+# file name: stand_in_model.py
+"""A 9-feature model for timing ml_api/main.py against the shipped bundle
+
+main.py builds one row of 8 nutriments + severity per product and expects
+one score per disease back. The shipped models take 12 features and score
+one condition per row, so every main.py analysis stops with
+ModelRowMismatch. install() swaps in an ArrayScaler and a linear map of
+the right shapes, so main's own work (tagging, batching, aggregation, kNN,
+alternatives) can be timed and measured; the model's share of the cost is
+not representative.
+"""
+import numpy as np
+
+
+class LinearRiskModel:
+    """len(DISEASES) scores in 0-100 from a scaled feature row"""
+
+    def __init__(self, weights: np.ndarray, bias: float):
+        self.weights = weights
+        self.bias = bias
+
+    def predict(self, X) -> np.ndarray:
+        return np.clip(np.asarray(X) @ self.weights + self.bias, 0, 100)
+
+
+def active(main) -> bool:
+    return isinstance(main.risk_model, LinearRiskModel)
+
+
+def install(main, seed: int = 0) -> bool:
+    """Use the stand-in when main's models don't take its rows; True if swapped in"""
+    if main.model_row_error() is None:
+        return False
+
+    from drift import monitor_from_scaler
+    from fast_models import ArrayScaler
+
+    print("⚠ Timing main.py with a 9-feature stand-in model instead (benchmarks/stand_in_model.py)")
+    rng = np.random.default_rng(seed)
+    width = main.MODEL_ROW_WIDTH
+    main.scaler = ArrayScaler(np.zeros(width), np.full(width, 10.0))
+    main.risk_model = LinearRiskModel(rng.uniform(0, 5, (width, len(main.DISEASES))), 20.0)
+    if main.drift_monitor is not None:
+        main.drift_monitor = monitor_from_scaler(main.scaler, main.NUTRIENT_FEATURES + ["severity"])
+    main.nutrient_free_output.cache_clear()
+    return True
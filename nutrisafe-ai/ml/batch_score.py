@@ -0,0 +1,226 @@
+# file name: batch_score.py
+"""Offline bulk scoring of Open Food Facts exports, no HTTP involved
+
+    python batch_score.py en.openfoodfacts.org.products.csv.gz scores/
+    python batch_score.py products.jsonl scores/ --profile diabetes,hypertension --profile celiac_disease
+
+The dump is read in chunks of --chunk-rows products. Each chunk is scored in
+a worker process with run_analysis_chunk() from ml_inference (one vectorized
+risk pass and one kNN pass per chunk) and written as its own part file:
+parquet when pyarrow is installed, CSV otherwise. Every product is scored
+once per condition profile; without --profile it is scored against all
+diseases in disease_data.json, so the breakdown covers each of them.
+
+checkpoint.json in the output directory records the finished chunks. Rerun
+the same command after an interruption to pick up where it stopped;
+--restart throws the previous parts away.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+ML_DIR = Path(__file__).parent
+CHECKPOINT_FILE = "checkpoint.json"
+
+sys.path.append(str(ML_DIR.parent / "ml_api"))
+from off_dump import read_chunks, with_aliases
+
+_worker = None
+
+
+def to_payload(record: Dict, conditions: List[str]) -> Dict:
+    return {
+        "product": {
+            "name": str(record["product_name"]),
+            "ingredients": str(record["ingredients_text"]),
+            "nutriments": with_aliases(record["nutriments"]),
+            "categories": str(record["categories"]),
+            "brand": str(record["brands"])
+        },
+        "userConditions": conditions
+    }
+
+
+def output_columns(profiles: List[List[str]]) -> List[str]:
+    conditions = sorted({c.lower().replace(" ", "_") for profile in profiles for c in profile})
+    return (["code", "product_name", "profile", "risk_score", "risk_level"]
+            + [f"risk_{c}" for c in conditions]
+            + ["high_risk_ingredients", "alternatives", "error"])
+
+
+def write_part(frame: pd.DataFrame, path: Path, fmt: str) -> Path:
+    """Write atomically so a killed run never leaves a half-written part"""
+    final = path.with_suffix(f".{fmt}")
+    tmp = final.with_name(final.name + ".tmp")
+    if fmt == "parquet":
+        frame.to_parquet(tmp, index=False)
+    else:
+        frame.to_csv(tmp, index=False)
+    os.replace(tmp, final)
+    return final
+
+
+def _init_worker():
+    global _worker
+    os.environ.setdefault("NUTRISAFE_MODEL_DIR", str(ML_DIR / "models"))
+    os.environ.setdefault("NUTRISAFE_DATASET_DIR", str(ML_DIR / "datasets"))
+    import ml_inference
+    _worker = ml_inference
+
+
+def score_chunk(index: int, records: List[Dict], profiles: List[List[str]],
+                columns: List[str], part: Path, fmt: str) -> Dict:
+    """Score one chunk in a worker and write its part file"""
+    payloads = [to_payload(record, conditions) for record in records for conditions in profiles]
+    results = _worker.run_analysis_chunk(payloads, breakdown=True)
+
+    rows = []
+    errors = 0
+    for k, result in enumerate(results):
+        record = records[k // len(profiles)]
+        row = {
+            "code": record["code"],
+            "product_name": record["product_name"],
+            "profile": ",".join(profiles[k % len(profiles)])
+        }
+        if "error" in result:
+            row["error"] = result["error"]
+            errors += 1
+        else:
+            row["risk_score"] = result["risk_score"]
+            row["risk_level"] = result["risk_level"]
+            for condition, score in result["disease_breakdown"].items():
+                row[f"risk_{condition}"] = score
+            row["high_risk_ingredients"] = "; ".join(
+                ing["name"] for ing in result["ingredient_analysis"] if ing["risk"] == "high"
+            )
+            row["alternatives"] = json.dumps([
+                {"name": alt["name"], "match_score": round(alt["match_score"], 2)}
+                for alt in result["alternatives"]
+            ])
+        rows.append(row)
+
+    write_part(pd.DataFrame(rows, columns=columns), part, fmt)
+    return {"index": index, "rows": len(records), "items": len(rows), "errors": errors}
+
+
+def load_checkpoint(out_dir: Path, settings: Dict, restart: bool) -> Dict:
+    path = out_dir / CHECKPOINT_FILE
+    if path.exists() and not restart:
+        checkpoint = json.loads(path.read_text())
+        if checkpoint["settings"] != settings:
+            raise SystemExit(
+                f"{path} was written with different settings; use --restart to start over\n"
+                f"  was: {checkpoint['settings']}\n  now: {settings}"
+            )
+        return checkpoint
+    for old in out_dir.glob("part-*"):
+        old.unlink()
+    return {"settings": settings, "completed": [], "rows": 0, "items": 0, "errors": 0}
+
+
+def save_checkpoint(out_dir: Path, checkpoint: Dict):
+    tmp = out_dir / (CHECKPOINT_FILE + ".tmp")
+    tmp.write_text(json.dumps(checkpoint, indent=2))
+    os.replace(tmp, out_dir / CHECKPOINT_FILE)
+
+
+def default_profiles() -> List[List[str]]:
+    dataset_dir = Path(os.environ.get("NUTRISAFE_DATASET_DIR", ML_DIR / "datasets"))
+    with open(dataset_dir / "disease_data.json") as f:
+        return [sorted(json.load(f))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score an Open Food Facts CSV/JSONL export offline")
+    parser.add_argument("input", type=Path, help="OFF export (.csv, .tsv, .jsonl, optionally .gz)")
+    parser.add_argument("output", type=Path, help="directory for part files and checkpoint.json")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="comma-separated conditions; repeat for several profiles (default: all diseases)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-rows", type=int, default=2000)
+    parser.add_argument("--format", choices=("auto", "parquet", "csv"), default="auto")
+    parser.add_argument("--restart", action="store_true", help="discard previous parts and checkpoint")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt == "auto":
+        try:
+            import pyarrow  # noqa: F401
+            fmt = "parquet"
+        except ImportError:
+            print("⚠ pyarrow not installed, writing CSV parts")
+            fmt = "csv"
+
+    profiles = [[c.strip() for c in p.split(",") if c.strip()] for p in args.profile] or default_profiles()
+    columns = output_columns(profiles)
+    settings = {
+        "input": str(args.input.resolve()),
+        "input_size": args.input.stat().st_size,
+        "chunk_rows": args.chunk_rows,
+        "profiles": profiles,
+        "format": fmt,
+        # Parts scored with the old per-process hash() encoding can't be mixed with new ones
+        "disease_encoding": "crc32"
+    }
+    args.output.mkdir(parents=True, exist_ok=True)
+    checkpoint = load_checkpoint(args.output, settings, args.restart)
+    completed = set(checkpoint["completed"])
+    if completed:
+        print(f"Resuming: {len(completed)} chunks ({checkpoint['rows']} rows) already scored")
+
+    # Scores don't depend on the start method or on which run scored a
+    # chunk: the disease encoding is crc32 (condition_risk.disease_code),
+    # not hash(), so resumed and spawned workers agree with earlier ones
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    started = time.perf_counter()
+    rows_this_run = 0
+    pending = set()
+
+    def collect(done):
+        nonlocal rows_this_run
+        for future in done:
+            result = future.result()
+            completed.add(result["index"])
+            checkpoint["completed"] = sorted(completed)
+            for key in ("rows", "items", "errors"):
+                checkpoint[key] += result[key]
+            save_checkpoint(args.output, checkpoint)
+            rows_this_run += result["rows"]
+            rate = rows_this_run / (time.perf_counter() - started)
+            print(f"  chunk {result['index']:>6}: {checkpoint['rows']} rows scored, {rate:,.0f} rows/s")
+
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=_init_worker) as pool:
+        try:
+            for index, records in enumerate(read_chunks(args.input, args.chunk_rows)):
+                if index in completed:
+                    continue
+                # Bound the chunks held in memory while workers catch up
+                if len(pending) >= args.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                part = args.output / f"part-{index:06d}"
+                pending.add(pool.submit(score_chunk, index, records, profiles, columns, part, fmt))
+            collect(wait(pending).done)
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+            raise SystemExit(f"\nInterrupted after {checkpoint['rows']} rows; rerun the same command to resume")
+
+    elapsed = time.perf_counter() - started
+    print(f"✓ Scored {checkpoint['rows']} products ({checkpoint['items']} product/profile rows, "
+          f"{checkpoint['errors']} errors) into {args.output}")
+    print(f"  {rows_this_run} rows this run in {elapsed:.1f}s: {rows_this_run / max(elapsed, 1e-9):,.0f} rows/s "
+          f"with {args.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
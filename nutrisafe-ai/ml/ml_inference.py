@@ -1,15 +1,59 @@
 # file name: ml_inference.py
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import sys
+from pathlib import Path
+
+# Shared serving helpers live next to the ML API service
+sys.path.append(str(Path(__file__).parent.parent / "ml_api"))
+import import_report
+import_report.install_from_env()
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 import numpy as np
-import pandas as pd
-import joblib
+import asyncio
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, NamedTuple, Optional, Tuple, Union
 import os
-from pathlib import Path
+from functools import lru_cache
+
+from ingredient_cache import IngredientCache, top_ingredient_tokens
+from ingredient_parser import ingredient_names
+from bounded_executor import BoundedExecutor, ExecutorSaturated
+from micro_batcher import MicroBatcher
+from singleflight import SingleFlight, payload_key
+from metrics import REGISTRY, CONTENT_TYPE, BATCH_SIZE_BUCKETS, RequestMetrics, StageTimers
+from profiling import profiler_from_env, pstats_text
+from fast_models import load_serving_models
+from condition_risk import MAX_ALTERNATIVE_RISK, ConditionRiskMatrix, disease_code, risk_band
+from product_store import STORE_FILE, ProductStore
+from drift import monitor_from_scaler
+from sharded_catalog import ShardedNeighbors, catalog_from_env
+from shadow import shadow_from_env
+from condition_profiles import ConditionProfiles, InvalidProfile
+from deadline import ClientDisconnected, Deadline, DeadlineExceeded, StageCosts, run_until
+from ndjson_stream import DEFAULT_CHUNK_SIZE, DuplexStreamingResponse, ndjson_results, parse_profiles
+from fast_json import FastJSONResponse
+from array_codec import (
+    CONTENT_TYPE as ARRAY_CONTENT_TYPE, FrameTooLarge, decode_array, encode_array,
+    feature_columns, gather_columns, read_frame
+)
 
-app = FastAPI(title="Food Safety ML Engine")
+app = FastAPI(title="Food Safety ML Engine", default_response_class=FastJSONResponse)
+
+stages = StageTimers("ml_inference")
+batch_sizes = REGISTRY.histogram(
+    "nutrisafe_batch_size", "Items per vectorized model batch",
+    ("app", "batcher"), buckets=BATCH_SIZE_BUCKETS
+)
+inference_tiers = REGISTRY.counter(
+    "nutrisafe_inference_tier_total", "Analyses by the inference tier that answered them", ("app", "tier")
+)
+# "full": model + kNN on the product's features; "ingredients_only": the
+# product has no usable nutriments, so the model part is a cached constant
+TIERS = {tier: inference_tiers.labels("ml_inference", tier) for tier in ("full", "ingredients_only")}
 
 class ProductRequest(BaseModel):
     name: str
@@ -20,33 +64,127 @@ class ProductRequest(BaseModel):
 
 class AnalysisRequest(BaseModel):
     product: ProductRequest
+    userConditions: List[str] = []
+    # From POST /condition-profiles; replaces userConditions when given
+    profileId: Optional[str] = None
+
+class BarcodeRequest(BaseModel):
+    barcode: str
+    userConditions: List[str] = []
+    profileId: Optional[str] = None
+
+class ConditionProfileRequest(BaseModel):
     userConditions: List[str]
 
+class IngredientRisk(BaseModel):
+    name: str
+    risk: str
+    risk_score: int
+
+class Alternative(BaseModel):
+    name: str
+    reason: str
+    match_score: float
+    condition_risk: Optional[float] = None
+
+class AnalysisResponse(BaseModel):
+    risk_score: int
+    risk_level: str
+    ingredient_analysis: List[IngredientRisk]
+    alternatives: List[Alternative]
+    tier: str
+    # Only present when a deadline dropped stages
+    omitted: Optional[List[str]] = None
+
+class BarcodeResponse(AnalysisResponse):
+    product: Dict
+
+# Nutriment features 1-8 of the risk model, in training order
+RISK_NUTRIENTS = [
+    "sugars_100g", "carbohydrates_100g", "salt_100g", "fat_100g",
+    "saturated_fat_100g", "fiber_100g", "proteins_100g", "energy_kcal_100g"
+]
+RISK_FEATURES = RISK_NUTRIENTS + ["disease_encoded", "severity_critical", "severity_high", "severity_medium"]
+
+class ConditionProfile(NamedTuple):
+    """A condition list resolved against the disease data, reusable across requests"""
+    conditions: Tuple[str, ...]
+    disease_indices: Tuple  # (condition, disease_data index or None) per condition
+    condition_rows: np.ndarray  # features 9-12, one row per condition
+    risk_columns: Tuple[int, ...]  # product_risk_matrix columns
+    breakdown_keys: Tuple[str, ...]
+    # Conditions behind _generate_reason's condition-specific reasons
+    low_sugar: bool
+    low_sodium: bool
+    low_saturated_fat: bool
+
+# Analyzer methods take free-text conditions or an already compiled profile
+Conditions = Union[List[str], ConditionProfile]
+
 class DiseaseIngredientAnalyzer:
     def __init__(self):
         # Load ML models
         self.models = self.load_models()
         self.dataset = self.load_datasets()
+        self.disease_index = {
+            disease: i for i, disease in enumerate(self.dataset["disease_data"])
+        }
+        
+        # Live feature statistics vs. the scaler's training mean/std
+        self.drift = monitor_from_scaler(self.models["scaler"], RISK_FEATURES)
+        
+        # Raw token -> (normalized name, per-disease severity vector)
+        self.ingredient_cache = IngredientCache(
+            self._analyze_token,
+            maxsize=int(os.environ.get("INGREDIENT_CACHE_SIZE", 4096))
+        )
+        warm_file = os.environ.get("INGREDIENT_CACHE_WARM_FILE")
+        if warm_file:
+            self.ingredient_cache.warm(
+                top_ingredient_tokens(warm_file, n=self.ingredient_cache.maxsize)
+            )
+        
+        # Concurrent requests share one vectorized scaler/model and kNN pass
+        batch_max = int(os.environ.get("MICRO_BATCH_MAX", 32))
+        self.risk_batcher = MicroBatcher(
+            self._predict_batch, batch_max, name="risk-batcher",
+            on_batch=batch_sizes.labels("ml_inference", "risk").observe
+        )
+        self.neighbors_batcher = MicroBatcher(
+            self._neighbors_batch, batch_max, name="neighbors-batcher",
+            on_batch=batch_sizes.labels("ml_inference", "neighbors").observe
+        )
+        
+        # Per-item cost of the stages a request deadline may drop, learned from traffic
+        self.stage_costs = StageCosts({"ingredient_analysis": 0.0002, "alternatives": 0.01})
+        
+        # Precompute the nutriment-free answers for no and single conditions,
+        # keyed like ConditionProfile.breakdown_keys (the dataset's own keys)
+        self.nutrient_free_result(())
+        for disease in self.dataset["disease_data"]:
+            self.nutrient_free_result((disease,))
         
     def load_models(self):
-        """Load trained ML models"""
-        model_dir = Path("models")
+        """Load trained ML models (exported arrays; the classifier isn't used for serving)"""
+        model_dir = Path(os.environ.get("NUTRISAFE_MODEL_DIR", "models"))
+        models = load_serving_models(model_dir)
         
         return {
-            "risk_model": joblib.load(model_dir / "risk_model.pkl"),
-            "classifier": joblib.load(model_dir / "classifier.pkl"),
-            "scaler": joblib.load(model_dir / "scaler.pkl"),
-            "recommender": joblib.load(model_dir / "recommender.pkl"),
+            "risk_model": models["risk_model"],
+            "scaler": models["scaler"],
+            "recommender": catalog_from_env(model_dir, models["recommender"]),
             "product_vectors": np.load(model_dir / "product_vectors.npy"),
-            "product_names": pd.read_csv(model_dir / "product_names.csv")["product_name"].tolist()
+            "product_names": models["product_names"].tolist(),
+            "condition_risk": ConditionRiskMatrix.load(model_dir, len(models["product_names"]))
         }
     
     def load_datasets(self):
         """Load disease and ingredient datasets"""
-        with open("datasets/disease_data.json", "r") as f:
+        dataset_dir = Path(os.environ.get("NUTRISAFE_DATASET_DIR", "datasets"))
+        with open(dataset_dir / "disease_data.json", "r") as f:
             disease_data = json.load(f)
         
-        with open("datasets/ingredient_mapping.json", "r") as f:
+        with open(dataset_dir / "ingredient_mapping.json", "r") as f:
             ingredient_mapping = json.load(f)
         
         return {
@@ -56,8 +194,10 @@ class DiseaseIngredientAnalyzer:
     
     def normalize_ingredient_name(self, ingredient: str) -> str:
         """Normalize ingredient name across languages"""
-        ingredient_lower = ingredient.lower().strip()
-        
+        return self.ingredient_cache.get(ingredient.lower().strip())[0]
+    
+    def _normalize_uncached(self, ingredient_lower: str) -> str:
+        """Resolve a lowercased token against the multi-language mapping"""
         # Check multi-language mapping
         for eng_name, translations in self.dataset["ingredient_mapping"].items():
             if (ingredient_lower == eng_name or 
@@ -68,40 +208,76 @@ class DiseaseIngredientAnalyzer:
         # Return original if no match
         return ingredient_lower
     
-    def analyze_ingredients(self, ingredients_text: str, user_conditions: List[str]) -> List[Dict]:
-        """Analyze each ingredient for disease risks"""
+    def _analyze_token(self, ingredient_lower: str):
+        """Normalize a token and find its trigger severity for every disease"""
+        normalized = self._normalize_uncached(ingredient_lower)
+        
+        severities = []
+        for disease_info in self.dataset["disease_data"].values():
+            risk_level = "safe"
+            for severity, triggers in disease_info["triggers"].items():
+                if any(trigger in normalized for trigger in triggers):
+                    risk_level = severity
+                    break
+            severities.append(risk_level)
+        
+        return normalized, tuple(severities)
+    
+    def _predict_batch(self, feature_blocks: List[np.ndarray]) -> List[np.ndarray]:
+        """Scale and score the per-condition feature rows of several requests at once"""
+        clock = stages.clock()
+        counts = [len(block) for block in feature_blocks]
+        features = np.vstack(feature_blocks)
+        if self.drift:
+            self.drift.observe(features)
+            clock.mark("drift_observe")
+        features_scaled = self.models["scaler"].transform(features)
+        clock.mark("scaler_transform")
+        predictions = self.models["risk_model"].predict(features_scaled)
+        clock.mark("risk_model_predict")
+        return np.split(predictions, np.cumsum(counts)[:-1])
+    
+    def _neighbors_batch(self, queries: List[np.ndarray]):
+        """kNN lookup for several query vectors at once"""
+        with stages.time("kneighbors"):
+            distances, indices = self.models["recommender"].kneighbors(
+                np.vstack(queries),
+                n_neighbors=20
+            )
+        return list(zip(distances, indices))
+    
+    def analyze_ingredients(self, ingredients_text: str, user_conditions: Conditions,
+                            deadline: Deadline = None) -> List[Dict]:
+        """Analyze each ingredient for disease risks
+        
+        Under a tight deadline only the leading ingredients (the largest
+        by weight on OFF labels) are analyzed.
+        """
         if not ingredients_text or ingredients_text.lower() in ["", "ingredients not specified"]:
             return []
         
-        # Parse ingredients
-        ingredients = []
-        for ing in ingredients_text.split(','):
-            ing = ing.strip()
-            if len(ing) > 2:
-                ingredients.append(ing)
-        
+        # Parse ingredients (nested sub-ingredients, percentages, ';' lists)
+        ingredients = ingredient_names(ingredients_text, min_length=3)
+        if deadline is not None:
+            ingredients = ingredients[:deadline.fit(self.stage_costs, "ingredient_analysis", len(ingredients))]
+        with self.stage_costs.timed("ingredient_analysis", len(ingredients)):
+            return self._analyze_ingredient_list(ingredients, user_conditions)
+    
+    def _analyze_ingredient_list(self, ingredients: List[str], user_conditions: Conditions) -> List[Dict]:
         # Analyze each ingredient
         ingredient_analysis = []
         
+        severity_scores = {"critical": 90, "high": 80, "medium": 60, "low": 40, "safe": 10}
+        condition_indices = self.compile_conditions(user_conditions).disease_indices
+        
         for ingredient in ingredients:
-            normalized = self.normalize_ingredient_name(ingredient)
+            normalized, severities = self.ingredient_cache.get(ingredient.lower().strip())
             ingredient_risks = []
             
-            for condition in user_conditions:
-                condition_lower = condition.lower().replace(" ", "_")
-                
-                if condition_lower in self.dataset["disease_data"]:
-                    disease_info = self.dataset["disease_data"][condition_lower]
-                    
-                    # Check if ingredient is a trigger
-                    risk_level = "safe"
-                    for severity, triggers in disease_info["triggers"].items():
-                        if any(trigger in normalized for trigger in triggers):
-                            risk_level = severity
-                            break
-                    
-                    # Calculate risk score
-                    severity_scores = {"critical": 90, "high": 80, "medium": 60, "low": 40, "safe": 10}
+            for condition, disease_idx in condition_indices:
+                if disease_idx is not None:
+                    # Trigger severity was resolved once per token and cached
+                    risk_level = severities[disease_idx]
                     risk_score = severity_scores.get(risk_level, 10)
                     
                     ingredient_risks.append({
@@ -129,61 +305,114 @@ class DiseaseIngredientAnalyzer:
         
         return ingredient_analysis
     
-    def predict_risk_score(self, product: ProductRequest, user_conditions: List[str]) -> Dict:
+    def predict_risk_score(self, product: ProductRequest, user_conditions: Conditions) -> Dict:
         """Predict risk score using ML model - MATCHES TRAINING (12 features)"""
         # For multiple conditions, we need to predict for each and take max
-        nutr = product.nutriments
+        clock = stages.clock()
+        features = self.risk_features(product, user_conditions)
+        clock.mark("feature_building")
         
         all_predictions = []
+        if len(features):
+            # Scale + predict alongside concurrent requests
+            all_predictions = self.risk_batcher.submit(features)
+            clock.mark("risk_batch")
         
-        for condition in user_conditions:
-            condition_lower = condition.lower().replace(" ", "_")
-            
-            # Disease encoding (must match training)
-            disease_encoded = hash(condition_lower) % 100
-            
-            # Severity flags based on disease (from dataset)
-            severity_critical = 0
-            severity_high = 0
-            severity_medium = 0
-            
-            if condition_lower in self.dataset["disease_data"]:
-                disease_info = self.dataset["disease_data"][condition_lower]
-                severity_weight = disease_info.get("severity_weight", 1.0)
-                
-                if severity_weight >= 1.5:
-                    severity_high = 1
-                elif severity_weight >= 1.2:
-                    severity_medium = 1
-            
-            # EXACTLY 12 features as trained
-            features = np.array([[
-                nutr.get("sugars_100g", 0),            # 1
-                nutr.get("carbohydrates_100g", 0),     # 2
-                nutr.get("salt_100g", 0),              # 3
-                nutr.get("fat_100g", 0),               # 4
-                nutr.get("saturated_fat_100g", 0),     # 5
-                nutr.get("fiber_100g", 0),             # 6
-                nutr.get("proteins_100g", 0),          # 7
-                nutr.get("energy_kcal_100g", 0),       # 8
-                disease_encoded,                       # 9 - disease encoding
-                severity_critical,                     # 10 - critical flag
-                severity_high,                         # 11 - high flag
-                severity_medium                        # 12 - medium flag
-            ]])
-            
-            # Handle NaN values
-            features = np.nan_to_num(features)
-            
-            # Scale features
-            features_scaled = self.models["scaler"].transform(features)
+        return self.risk_from_predictions(all_predictions)
+    
+    def risk_features(self, product: ProductRequest, user_conditions: Conditions) -> np.ndarray:
+        """One 12-feature row per condition"""
+        nutr = product.nutriments
+        condition_rows = self.compile_conditions(user_conditions).condition_rows
+        
+        # EXACTLY 12 features as trained: nutriments 1-8, then the
+        # condition's encoding and critical/high/medium flags 9-12
+        nutrients = np.array([nutr.get(name, 0) for name in RISK_NUTRIENTS], dtype=float)
+        rows = np.hstack([np.tile(nutrients, (len(condition_rows), 1)), condition_rows])
+        
+        # Handle NaN values
+        return np.nan_to_num(rows)
+    
+    def condition_features(self, condition: str) -> List[int]:
+        """Features 9-12 for one condition: disease encoding and severity flags"""
+        condition_lower = condition.lower().replace(" ", "_")
+        
+        # Disease encoding (must match training)
+        disease_encoded = disease_code(condition_lower)
+        
+        # Severity flags based on disease (from dataset)
+        severity_critical = 0
+        severity_high = 0
+        severity_medium = 0
+        
+        if condition_lower in self.dataset["disease_data"]:
+            disease_info = self.dataset["disease_data"][condition_lower]
+            severity_weight = disease_info.get("severity_weight", 1.0)
             
-            # Predict
-            pred = self.models["risk_model"].predict(features_scaled)[0]
-            all_predictions.append(pred)
+            if severity_weight >= 1.5:
+                severity_high = 1
+            elif severity_weight >= 1.2:
+                severity_medium = 1
+        
+        return [disease_encoded, severity_critical, severity_high, severity_medium]
+    
+    def compile_conditions(self, user_conditions: Conditions) -> ConditionProfile:
+        """Resolve a condition list once for every stage that depends on it"""
+        if isinstance(user_conditions, ConditionProfile):
+            return user_conditions
+        conditions = tuple(user_conditions)
+        keys = tuple(c.lower().replace(" ", "_") for c in conditions)
+        # Spelled from the keys, so "Heart Disease" and "heart_disease" compile alike
+        lowered = [key.replace("_", " ") for key in keys]
+        condition_risk = self.models["condition_risk"]
+        return ConditionProfile(
+            conditions=conditions,
+            disease_indices=tuple(
+                (condition, self.disease_index.get(key)) for condition, key in zip(conditions, keys)
+            ),
+            condition_rows=np.array(
+                [self.condition_features(c) for c in conditions], dtype=float
+            ).reshape(-1, 4),
+            risk_columns=tuple(condition_risk.columns(lowered)) if condition_risk else (),
+            breakdown_keys=keys,
+            low_sugar=any("diabetes" in c for c in lowered),
+            low_sodium=any("hypertension" in c or "blood pressure" in c for c in lowered),
+            low_saturated_fat=any("heart" in c or "cholesterol" in c for c in lowered)
+        )
+    
+    def has_nutrient_signal(self, product: ProductRequest) -> bool:
+        """False when every model nutriment is missing, null, NaN or zero"""
+        try:
+            values = np.array([product.nutriments.get(k, 0) for k in RISK_NUTRIENTS], dtype=float)
+        except (TypeError, ValueError):
+            # Malformed values take the full path, which reports them
+            return True
+        return bool(np.nan_to_num(values).any())
+    
+    @lru_cache(maxsize=int(os.environ.get("NUTRIENT_FREE_CACHE_SIZE", 256)))
+    def nutrient_free_result(self, user_conditions: tuple):
+        """(per-condition predictions, risk, alternatives) for an all-zero product
         
+        Without nutriments the feature rows and the kNN query depend only on
+        the conditions, so the model and kNN answer is computed once per
+        condition list, given as normalized keys ("heart_disease") so every
+        spelling of a list shares one entry. Scored directly, not through the micro-batchers or
+        the drift monitor (these rows are not live traffic).
+        """
+        empty = ProductRequest(name="", ingredients="", nutriments={})
+        features = self.risk_features(empty, user_conditions)
+        predictions = np.array([])
+        if len(features):
+            predictions = self.models["risk_model"].predict(self.models["scaler"].transform(features))
+        query = self.alternatives_query(empty)
+        _, indices = self._neighbors_batch([query])[0]
+        alternatives = self.alternatives_from_neighbors(query, indices, user_conditions, n_recommendations=3)
+        return predictions, self.risk_from_predictions(predictions), alternatives
+    
+    def risk_from_predictions(self, all_predictions) -> Dict:
+        """Overall risk from the per-condition predictions"""
         # Use worst-case (max) prediction
-        ml_risk_score = float(np.max(all_predictions)) if all_predictions else 50.0
+        ml_risk_score = float(np.max(all_predictions)) if len(all_predictions) else 50.0
         
         # Classify
         is_risky = ml_risk_score > 50
@@ -194,8 +423,49 @@ class DiseaseIngredientAnalyzer:
             "is_risky": is_risky
         }
     
-    def get_healthy_alternatives(self, product: ProductRequest, user_conditions: List[str], n_recommendations: int = 5) -> List[Dict]:
+    def score_matrix(self, matrix: np.ndarray, columns: List[int], user_conditions: Conditions,
+                     block_rows: int = 16384) -> np.ndarray:
+        """risk_score plus one score per condition for every row of a nutriment matrix
+        
+        Rows are products; `columns` gives the matrix column of each
+        RISK_NUTRIENTS entry. The matrix is never turned into per-product dicts.
+        """
+        nutrients = gather_columns(matrix, columns)
+        conditions = self.compile_conditions(user_conditions).condition_rows
+        
+        n, c = len(nutrients), len(conditions)
+        scores = np.empty((n, c))
+        step = max(1, block_rows // max(c, 1))
+        for start in range(0, n if c else 0, step):
+            block = nutrients[start:start + step]
+            # Every product paired with every condition, product-major
+            X = np.hstack([np.repeat(block, c, axis=0), np.tile(conditions, (len(block), 1))])
+            if self.drift:
+                self.drift.observe(X)
+            with stages.time("scaler_transform"):
+                X_scaled = self.models["scaler"].transform(X)
+            with stages.time("risk_model_predict"):
+                scores[start:start + step] = self.models["risk_model"].predict(X_scaled).reshape(-1, c)
+        
+        # Same worst-case rule (and no-condition default) as risk_from_predictions
+        risk = scores.max(axis=1) if c else np.full(n, 50.0)
+        return np.column_stack([risk, scores])
+    
+    def get_healthy_alternatives(self, product: ProductRequest, user_conditions: Conditions, n_recommendations: int = 5) -> List[Dict]:
         """Get healthy alternatives using ML recommendation engine"""
+        query = self.alternatives_query(product)
+        
+        # Find similar but healthier products
+        clock = stages.clock()
+        distances, indices = self.neighbors_batcher.submit(query)
+        clock.mark("neighbors_batch")
+        
+        alternatives = self.alternatives_from_neighbors(query, indices, user_conditions, n_recommendations)
+        clock.mark("alternatives_filter")
+        return alternatives
+    
+    def alternatives_query(self, product: ProductRequest) -> np.ndarray:
+        """Similarity-search vector for a product"""
         # Prepare product features for similarity search
         nutr = product.nutriments
         
@@ -208,17 +478,21 @@ class DiseaseIngredientAnalyzer:
             nutr.get("energy_kcal_100g", 0),
             70  # Default health score for query
         ]])
-        
-        # Find similar but healthier products
-        distances, indices = self.models["recommender"].kneighbors(
-            query_features, 
-            n_neighbors=20
-        )
-        
+        return query_features[0]
+    
+    def alternatives_from_neighbors(self, query: np.ndarray, indices, user_conditions: Conditions,
+                                    n_recommendations: int = 5) -> List[Dict]:
+        """Healthier products among a query's nearest neighbours"""
         alternatives = []
         seen_names = set()
         
-        for idx in indices[0]:
+        # Precomputed catalog risk for the user's own conditions
+        condition_risk = self.models["condition_risk"]
+        profile = self.compile_conditions(user_conditions)
+        columns = list(profile.risk_columns)
+        candidate_risk = condition_risk.risk(indices, columns) if columns else None
+        
+        for k, idx in enumerate(indices):
             if len(alternatives) >= n_recommendations:
                 break
             
@@ -228,12 +502,17 @@ class DiseaseIngredientAnalyzer:
             if product_name in seen_names:
                 continue
             
+            # Skip products that are themselves risky for the user
+            risk = None if candidate_risk is None else float(candidate_risk[k])
+            if risk is not None and risk > MAX_ALTERNATIVE_RISK:
+                continue
+            
             # Get product features
             product_vector = self.models["product_vectors"][idx]
             
             # Calculate health improvement score
             improvement_score = self._calculate_improvement_score(
-                query_features[0], product_vector
+                query, product_vector
             )
             
             # Only recommend healthier alternatives
@@ -249,12 +528,13 @@ class DiseaseIngredientAnalyzer:
                         "protein": float(product_vector[4]),
                         "calories": float(product_vector[5])
                     },
-                    "reason": self._generate_reason(product_vector, user_conditions)
+                    "reason": self._generate_reason(product_vector, profile),
+                    "condition_risk": risk
                 })
                 seen_names.add(product_name)
         
-        # Sort by improvement score
-        alternatives.sort(key=lambda x: x["improvement_score"], reverse=True)
+        # Safest for the user's conditions first, then by improvement score
+        alternatives.sort(key=lambda x: (risk_band(x["condition_risk"]), -x["improvement_score"]))
         
         return alternatives[:n_recommendations]
     
@@ -292,19 +572,19 @@ class DiseaseIngredientAnalyzer:
         
         return np.mean(improvements) if improvements else 0
     
-    def _generate_reason(self, product_features: np.ndarray, user_conditions: List[str]) -> str:
+    def _generate_reason(self, product_features: np.ndarray, user_conditions: Conditions) -> str:
         """Generate reason why this is a good alternative"""
         reasons = []
         
-        conditions_lower = [c.lower() for c in user_conditions]
+        profile = self.compile_conditions(user_conditions)
         
-        if any("diabetes" in c for c in conditions_lower) and product_features[0] < 5:
+        if profile.low_sugar and product_features[0] < 5:
             reasons.append("Low sugar for diabetes")
         
-        if any("hypertension" in c or "blood pressure" in c for c in conditions_lower) and product_features[1] < 1:
+        if profile.low_sodium and product_features[1] < 1:
             reasons.append("Low sodium for blood pressure")
         
-        if any("heart" in c or "cholesterol" in c for c in conditions_lower) and product_features[2] < 3:
+        if profile.low_saturated_fat and product_features[2] < 3:
             reasons.append("Low saturated fat for heart health")
         
         if product_features[3] > 5:
@@ -320,64 +600,423 @@ class DiseaseIngredientAnalyzer:
 
 # Initialize analyzer
 analyzer = DiseaseIngredientAnalyzer()
+if import_report.report()["enabled"]:
+    import_report.print_report()
 
-@app.post("/analyze")
-async def analyze_product(request: AnalysisRequest):
-    """Analyze product for health risks"""
-    try:
-        # Step 1: Predict risk score using ML
-        risk_prediction = analyzer.predict_risk_score(request.product, request.userConditions)
-        
-        # Step 2: Analyze ingredients
+# CPU-bound analysis runs off the event loop; beyond the queue we shed load
+analyze_executor = BoundedExecutor(
+    max_workers=int(os.environ.get("ANALYZE_WORKERS", os.cpu_count() or 4)),
+    max_queue=int(os.environ.get("ANALYZE_QUEUE_SIZE", 64)),
+    kind=os.environ.get("ANALYZE_EXECUTOR", "thread"),
+    on_wait=stages["executor_queue_wait"].observe
+)
+if analyze_executor.kind == "process":
+    # Observations are made where the analysis runs and aren't sent back
+    print("⚠ ANALYZE_EXECUTOR=process: stage timings, tiers, drift, shadow, batching and "
+          "ingredient-cache stats stay in the pool processes; /metrics and /health here "
+          "only show request counts, latencies and queue waits")
+
+# Identical concurrent requests wait on the first one's result
+analyze_flights = SingleFlight()
+
+# Registered condition lists, compiled once per worker
+condition_profiles = ConditionProfiles(
+    analyzer.compile_conditions, maxsize=int(os.environ.get("CONDITION_PROFILE_CACHE_SIZE", 1024))
+)
+
+def condition_profile(request) -> ConditionProfile:
+    """The request's registered profile, else its userConditions compiled for this request"""
+    if request.profileId is not None:
+        return condition_profiles.get(request.profileId)
+    return analyzer.compile_conditions(request.userConditions)
+
+analyze_metrics = RequestMetrics("ml_inference", "/analyze")
+
+# Barcode -> product, bulk-loaded from an OFF dump (product_store.py load)
+product_store = ProductStore(Path(os.environ.get(
+    "PRODUCT_STORE_PATH", Path(__file__).parent.parent / "ml_api" / STORE_FILE
+)))
+
+# Off unless REQUEST_PROFILING=1 or PROFILE_SAMPLE_EVERY=N
+profiler = profiler_from_env("ml_inference", Path(__file__).parent / "profiles")
+REGISTRY.function(
+    "nutrisafe_ingredient_cache_lookups_total", "Ingredient cache lookups by result",
+    lambda: {
+        ("ml_inference", "hit"): analyzer.ingredient_cache.hits,
+        ("ml_inference", "miss"): analyzer.ingredient_cache.misses
+    },
+    ("app", "result"), kind="counter"
+)
+REGISTRY.function(
+    "nutrisafe_ingredient_cache_entries", "Ingredient cache size",
+    lambda: {("ml_inference",): len(analyzer.ingredient_cache)}, ("app",)
+)
+REGISTRY.function(
+    "nutrisafe_singleflight_requests_total", "Analyze requests by coalescing outcome",
+    lambda: {
+        ("ml_inference", "executed"): analyze_flights.executions,
+        ("ml_inference", "coalesced"): analyze_flights.coalesced
+    },
+    ("app", "outcome"), kind="counter"
+)
+REGISTRY.function(
+    "nutrisafe_feature_drift_mean_shift", "Live feature mean minus training mean, in training SDs",
+    lambda: analyzer.drift.mean_shifts("ml_inference") if analyzer.drift else {}, ("app", "feature")
+)
+REGISTRY.function(
+    "nutrisafe_shadow_requests_total", "Sampled requests by shadow-scoring outcome",
+    lambda: {
+        ("ml_inference", "scored"): shadow.scored,
+        ("ml_inference", "dropped"): shadow.dropped,
+        ("ml_inference", "error"): shadow.errors
+    } if shadow is not None else {},
+    ("app", "outcome"), kind="counter"
+)
+REGISTRY.function(
+    "nutrisafe_executor_queue_depth", "Analyses waiting for a pool worker",
+    lambda: {("ml_inference",): analyze_executor.stats()["queue_depth"]}, ("app",)
+)
+REGISTRY.function(
+    "nutrisafe_executor_rejected_total", "Analyses shed with 503 because the queue was full",
+    lambda: {("ml_inference",): analyze_executor.rejected}, ("app",), kind="counter"
+)
+
+def run_analysis(request: AnalysisRequest, deadline: Deadline = None) -> Dict:
+    """Synchronous analysis pipeline, executed in the analyze pool
+    
+    With a bounded deadline, work whose caller has gone is dropped and the
+    optional stages shrink to what still fits (see deadline.py).
+    """
+    deadline = deadline or Deadline()
+    deadline.check("risk_prediction")
+    profile = condition_profile(request)
+    if not analyzer.has_nutrient_signal(request.product):
+        return run_ingredients_only(request, deadline=deadline, profile=profile)
+    TIERS["full"].inc()
+    
+    # Step 1: Predict risk score using ML
+    risk_prediction = analyzer.predict_risk_score(request.product, profile)
+    if shadow is not None and profile.conditions and shadow.sampled():
+        # Only queued here; the candidate model runs on the shadow thread
+        shadow.offer(
+            analyzer.risk_features(request.product, profile),
+            lambda predictions: analyzer.risk_from_predictions(predictions)["final_score"]
+        )
+    
+    # Step 2: Analyze ingredients
+    deadline.check("ingredient_analysis")
+    with stages.time("ingredient_analysis"):
         ingredient_analysis = analyzer.analyze_ingredients(
             request.product.ingredients, 
-            request.userConditions
+            profile,
+            deadline
         )
-        
-        # Step 3: Get healthy alternatives
-        alternatives = analyzer.get_healthy_alternatives(
-            request.product, 
-            request.userConditions,
-            n_recommendations=3
+    
+    # Step 3: Get healthy alternatives
+    alternatives = []
+    if deadline.allows(analyzer.stage_costs, "alternatives"):
+        with analyzer.stage_costs.timed("alternatives"):
+            alternatives = analyzer.get_healthy_alternatives(
+                request.product, 
+                profile,
+                n_recommendations=3
+            )
+    
+    return build_response(risk_prediction, ingredient_analysis, alternatives, omitted=deadline.omitted)
+
+def run_ingredients_only(request: AnalysisRequest, breakdown: bool = False,
+                         deadline: Deadline = None, profile: ConditionProfile = None) -> Dict:
+    """Fast tier: cached model/kNN answer plus the product's own ingredient analysis"""
+    deadline = deadline or Deadline()
+    profile = profile or condition_profile(request)
+    TIERS["ingredients_only"].inc()
+    with stages.time("nutrient_free_lookup"):
+        predictions, risk_prediction, alternatives = analyzer.nutrient_free_result(profile.breakdown_keys)
+    with stages.time("ingredient_analysis"):
+        ingredient_analysis = analyzer.analyze_ingredients(
+            request.product.ingredients,
+            profile,
+            deadline
         )
-        
-        # Step 4: Determine risk level
-        final_score = risk_prediction["final_score"]
-        if final_score > 80:
-            risk_level = "high"
-        elif final_score > 50:
-            risk_level = "medium"
+    result = build_response(
+        risk_prediction, ingredient_analysis, alternatives,
+        tier="ingredients_only", omitted=deadline.omitted
+    )
+    if breakdown:
+        result["disease_breakdown"] = disease_breakdown(profile, predictions)
+    return result
+
+def disease_breakdown(profile: ConditionProfile, predictions) -> Dict:
+    return dict(zip(profile.breakdown_keys, np.asarray(predictions, dtype=float).tolist()))
+
+def run_analysis_chunk(payloads: List[Dict], breakdown: bool = False) -> List[Dict]:
+    """Analyze many payloads with one vectorized risk pass and one kNN pass
+
+    Payloads that fail validation come back as {"error": ...} entries. With
+    breakdown=True each result also maps every condition to its own score.
+    """
+    results: List[Optional[Dict]] = [None] * len(payloads)
+    requests = []
+    for i, payload in enumerate(payloads):
+        try:
+            request = AnalysisRequest(**payload)
+            profile = condition_profile(request)
+        except ValidationError as e:
+            results[i] = {"error": f"Invalid payload: {e.errors()[0]['loc']} {e.errors()[0]['msg']}"}
+            continue
+        except InvalidProfile as e:
+            results[i] = {"error": str(e)}
+            continue
+        if analyzer.has_nutrient_signal(request.product):
+            requests.append((i, request, profile))
         else:
-            risk_level = "safe"
-        
-        # Step 5: Prepare response
-        return {
-    "risk_score": int(final_score),
-    "risk_level": risk_level,
-    "ingredient_analysis": [
-        {
-            "name": ing["name"],
-            "risk": ing["risk"],
-            "risk_score": ing["risk_score"]
-        }
-        for ing in ingredient_analysis
-    ],
-    "alternatives": [
-        {
-            "name": alt["name"],
-            "reason": alt.get("reason", "Healthier alternative"),
-            "match_score": alt.get("improvement_score", 75)
-        }
-        for alt in alternatives
-    ]
-}
-        
+            results[i] = run_ingredients_only(request, breakdown, profile=profile)
+    if not requests:
+        return results
+    TIERS["full"].inc(len(requests))
+    
+    clock = stages.clock()
+    feature_blocks = [analyzer.risk_features(r.product, profile) for _, r, profile in requests]
+    queries = [analyzer.alternatives_query(r.product) for _, r, _ in requests]
+    clock.mark("feature_building")
+    
+    predictions = analyzer._predict_batch(feature_blocks) if any(len(b) for b in feature_blocks) else []
+    neighbors = analyzer._neighbors_batch(queries)
+    
+    for k, (i, request, profile) in enumerate(requests):
+        block_predictions = predictions[k] if len(predictions) else []
+        with stages.time("ingredient_analysis"):
+            ingredient_analysis = analyzer.analyze_ingredients(
+                request.product.ingredients,
+                profile
+            )
+        alternatives = analyzer.alternatives_from_neighbors(
+            queries[k], neighbors[k][1], profile, n_recommendations=3
+        )
+        results[i] = build_response(
+            analyzer.risk_from_predictions(block_predictions), ingredient_analysis, alternatives
+        )
+        if breakdown:
+            results[i]["disease_breakdown"] = disease_breakdown(profile, block_predictions)
+    clock.mark("chunk_assembly")
+    return results
+
+def risk_level(score: float) -> str:
+    if score > 80:
+        return "high"
+    elif score > 50:
+        return "medium"
+    return "safe"
+
+# Candidate model scoring sampled traffic when NUTRISAFE_SHADOW_MODEL_DIR is set
+shadow = shadow_from_env(analyzer.models, risk_level)
+
+def build_response(risk_prediction: Dict, ingredient_analysis: List[Dict], alternatives: List[Dict],
+                   tier: str = "full", omitted: List[str] = None) -> Dict:
+    """/analyze response body; `omitted` lists stages a deadline cut short"""
+    # Step 4: Determine risk level
+    final_score = risk_prediction["final_score"]
+    
+    # Step 5: Prepare response
+    response = {
+        "risk_score": int(final_score),
+        "risk_level": risk_level(final_score),
+        "ingredient_analysis": [
+            {
+                "name": ing["name"],
+                "risk": ing["risk"],
+                "risk_score": ing["risk_score"]
+            }
+            for ing in ingredient_analysis
+        ],
+        "alternatives": [
+            {
+                "name": alt["name"],
+                "reason": alt.get("reason", "Healthier alternative"),
+                "match_score": alt.get("improvement_score", 75),
+                "condition_risk": alt.get("condition_risk")
+            }
+            for alt in alternatives
+        ],
+        "tier": tier
+    }
+    if omitted:
+        response["omitted"] = list(omitted)
+    return response
+
+@app.post("/analyze", response_model=AnalysisResponse, response_model_exclude_unset=True)
+async def analyze_product(request: AnalysisRequest, http_request: Request, response: Response):
+    """Analyze product for health risks"""
+    try:
+        deadline = Deadline.from_headers(http_request.headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        with analyze_metrics.track():
+            mode = profiler.requested(
+                http_request.headers.get("x-profile"), http_request.query_params.get("profile")
+            )
+            if mode:
+                # Profile inside the worker, where the analysis actually runs
+                result, profile_id = await run_until(
+                    deadline,
+                    analyze_executor.run(profiler.run, mode, run_analysis, request, deadline),
+                    http_request
+                )
+                response.headers["X-Profile-Id"] = profile_id
+                return result
+            # Bounded calls only join bounded ones, so an unbounded caller
+            # never gets a result trimmed to someone else's budget
+            return await analyze_flights.do_until(
+                payload_key([jsonable_encoder(request), deadline.bounded]), deadline, http_request,
+                analyze_executor.run, run_analysis, request
+            )
+    
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full, retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    except InvalidProfile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClientDisconnected as e:
+        # Nobody reads this; nginx's code for a caller that hung up
+        raise HTTPException(status_code=499, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         import traceback
         print(f"Error: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
 
+@app.post("/analyze/barcode", response_model=BarcodeResponse, response_model_exclude_unset=True)
+async def analyze_barcode(request: BarcodeRequest, http_request: Request, response: Response):
+    """Analyze a product from the local store by barcode: no OFF round trip"""
+    # SQLite lookup: off the event loop, but not in an analysis slot
+    product = await run_in_threadpool(stored_product, request.barcode)
+    result = await analyze_product(
+        AnalysisRequest(
+            product=ProductRequest(
+                name=product["name"],
+                ingredients=product["ingredients"],
+                nutriments=product["nutriments"],
+                categories=product["categories"],
+                brand=product["brand"]
+            ),
+            userConditions=request.userConditions,
+            profileId=request.profileId
+        ),
+        http_request, response
+    )
+    return {"product": product, **result}
+
+@app.get("/products/{barcode}")
+async def get_product(barcode: str):
+    """Product from the local store"""
+    return await run_in_threadpool(stored_product, barcode)
+
+@app.post("/condition-profiles")
+async def register_condition_profile(request: ConditionProfileRequest):
+    """Compile a condition list once; /analyze then takes the returned profileId"""
+    try:
+        profile_id, profile = condition_profiles.register(request.userConditions)
+    except InvalidProfile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return describe_profile(profile_id, profile)
+
+@app.get("/condition-profiles/{profile_id}")
+async def get_condition_profile(profile_id: str):
+    """What a profile ID resolves to"""
+    try:
+        profile = condition_profiles.get(profile_id)
+    except InvalidProfile as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return describe_profile(profile_id, profile)
+
+def describe_profile(profile_id: str, profile: ConditionProfile) -> Dict:
+    return {
+        "profileId": profile_id,
+        "userConditions": list(profile.conditions),
+        "diseases": [
+            key for key, (_, disease_idx) in zip(profile.breakdown_keys, profile.disease_indices)
+            if disease_idx is not None
+        ],
+        # Still scored by the model, but without trigger ingredients or severity
+        "unmatched": [condition for condition, disease_idx in profile.disease_indices if disease_idx is None]
+    }
+
+def stored_product(barcode: str) -> Dict:
+    if not barcode.strip():
+        raise HTTPException(status_code=400, detail="Barcode required")
+    if not product_store.available():
+        raise HTTPException(status_code=503, detail="Product store not loaded (product_store.py load <dump>)")
+    product = product_store.get(barcode)
+    if product is None:
+        raise HTTPException(status_code=404, detail=f"Barcode {barcode} not in the product store")
+    return product
+
+@app.post("/analyze/stream")
+async def analyze_stream(
+    http_request: Request,
+    profile: List[str] = Query(default=[]),
+    chunk_size: int = Query(default=int(os.environ.get("STREAM_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)), ge=1, le=4096)
+):
+    """Bulk scoring: NDJSON payloads (or bare products) in, NDJSON results out
+
+    Each `profile` query value is a comma-separated condition list; bare
+    products are scored once per profile.
+    """
+    async def score(payloads):
+        with stages.time("stream_chunk"):
+            while True:
+                try:
+                    return await analyze_executor.run(run_analysis_chunk, payloads)
+                except ExecutorSaturated:
+                    # Wait for capacity rather than failing a long-running scan
+                    await asyncio.sleep(0.05)
+    
+    return DuplexStreamingResponse(
+        ndjson_results(http_request.stream(), score, parse_profiles(profile), chunk_size),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/analyze/array")
+async def analyze_array(http_request: Request):
+    """Bulk risk scores for a raw nutriment matrix, binary in and out
+    
+    The request is an array_codec frame whose header lists "features" (one
+    nutriment name per column) and optionally "conditions". The response
+    frame has columns ["risk_score", *conditions] in the request's dtype.
+    """
+    try:
+        body = await read_frame(http_request.stream(), int(os.environ.get("ARRAY_MAX_BYTES", 64 << 20)))
+        header, matrix = decode_array(body)
+        columns = feature_columns(header.get("features"), RISK_NUTRIENTS, matrix.shape[1])
+    except FrameTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    conditions = [str(c) for c in header.get("conditions", [])]
+    try:
+        scores = await analyze_executor.run(analyzer.score_matrix, matrix, columns, conditions)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full, retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+    
+    return Response(
+        encode_array(scores.astype(matrix.dtype), columns=["risk_score", *conditions]),
+        media_type=ARRAY_CONTENT_TYPE
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -385,9 +1024,76 @@ async def health_check():
         "status": "healthy",
         "models_loaded": True,
         "diseases_loaded": len(analyzer.dataset["disease_data"]),
-        "alternatives_count": len(analyzer.models["product_names"])
+        "alternatives_count": len(analyzer.models["product_names"]),
+        "ingredient_cache": analyzer.ingredient_cache.stats(),
+        "executor": analyze_executor.stats(),
+        "coalescing": analyze_flights.stats(),
+        "condition_profiles": condition_profiles.stats(),
+        "product_store": product_store.stats(),
+        "deadline_stage_costs": analyzer.stage_costs.snapshot(),
+        "catalog": (
+            analyzer.models["recommender"].stats()
+            if isinstance(analyzer.models["recommender"], ShardedNeighbors) else {"shards": 1}
+        ),
+        "micro_batching": {
+            "risk": analyzer.risk_batcher.stats(),
+            "neighbors": analyzer.neighbors_batcher.stats()
+        }
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of per-stage latency, counters and gauges"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/admin/drift")
+async def feature_drift(histograms: bool = False):
+    """Live feature statistics compared with the scaler's training statistics"""
+    if analyzer.drift is None:
+        return {"status": "disabled"}
+    return analyzer.drift.report(histograms)
+
+@app.post("/admin/drift/reset")
+async def reset_feature_drift():
+    """Start the live statistics over, e.g. after deploying a retrained model"""
+    if analyzer.drift is not None:
+        analyzer.drift.reset()
+    return {"status": "reset"}
+
+@app.get("/admin/shadow")
+async def shadow_report(recent: int = 20):
+    """Candidate vs. production scores and latency on sampled traffic"""
+    if shadow is None:
+        return {"status": "disabled"}
+    return shadow.report(recent)
+
+@app.post("/admin/shadow/reset")
+async def reset_shadow():
+    """Clear the shadow log, e.g. after switching candidate bundles"""
+    if shadow is not None:
+        shadow.reset()
+    return {"status": "reset"}
+
+@app.get("/admin/imports")
+async def import_times(limit: int = 25):
+    """Per-module import times (IMPORT_TIME_REPORT=1) and heavy modules in memory"""
+    return import_report.report(limit)
+
+@app.get("/admin/profiles")
+async def list_profiles():
+    """Stored request profiles, newest first"""
+    return profiler.list()
+
+@app.get("/admin/profiles/{name}")
+async def get_profile(name: str, format: str = "raw"):
+    """Download a profile; format=text renders a pstats dump as a table"""
+    path = profiler.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text" and path.suffix == ".pstats":
+        return PlainTextResponse(pstats_text(path))
+    return FileResponse(path, filename=name)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -7,16 +7,29 @@ from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.neighbors import NearestNeighbors
 import joblib
 import os
+import sys
 from pathlib import Path
 import warnings
+from contextlib import nullcontext
 warnings.filterwarnings('ignore')
 
+# Serving-format export lives with the ML API service
+sys.path.append(str(Path(__file__).parent.parent / "ml_api"))
+from fast_models import SERVING_FILE, export_serving_models
+from condition_risk import RISK_MATRIX_FILE, disease_code, score_catalog
+from sharded_catalog import build_shards
+
 class FoodSafetyModel:
-    def __init__(self):
-        self.dataset = self.load_datasets()
+    def __init__(self, phase=None):
+        # phase(name) -> context manager wrapped around each pipeline phase
+        # (load, label, extract, fit, save); used by the memory benchmarks
+        self.phase = phase or (lambda name: nullcontext())
+        with self.phase("load"):
+            self.dataset = self.load_datasets()
         self.scaler = StandardScaler()
         self.risk_model = None
         self.recommender = None
+        self.product_risk = None
         self.ingredient_encoder = LabelEncoder()
         self.disease_encoder = LabelEncoder()
     
@@ -48,18 +61,21 @@ class FoodSafetyModel:
     def prepare_training_data(self):
         """Prepare comprehensive training data"""
         # Load generated training data
-        training_data = pd.read_csv("datasets/training_data.csv")
+        with self.phase("load"):
+            training_data = pd.read_csv("datasets/training_data.csv")
         
         # Add OpenFoodFacts data if available
         if self.dataset["off_data"] is not None:
-            off_data = self.dataset["off_data"]
-            # Enrich with disease-specific labels
-            off_data = self._label_off_data(off_data)
-            training_data = pd.concat([training_data, off_data], ignore_index=True)
+            with self.phase("label"):
+                off_data = self.dataset["off_data"]
+                # Enrich with disease-specific labels
+                off_data = self._label_off_data(off_data)
+                training_data = pd.concat([training_data, off_data], ignore_index=True)
         
         # Feature engineering
-        X = self._extract_features(training_data)
-        y = training_data[["risk_score", "is_risky"]].values
+        with self.phase("extract"):
+            X = self._extract_features(training_data)
+            y = training_data[["risk_score", "is_risky"]].values
         
         return X, y
     
@@ -75,7 +91,7 @@ class FoodSafetyModel:
                 nutrients = row["nutrients"]
             
             # Disease encoding
-            disease_encoded = hash(row["disease"]) % 100
+            disease_encoded = disease_code(row["disease"])
             
             # 12 features exactly
             ingredient_features = [
@@ -179,43 +195,44 @@ class FoodSafetyModel:
         print("Preparing training data...")
         X, y = self.prepare_training_data()
         
-        # Split data
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
-        
-        # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        print(f"Training data shape: {X_train.shape}")
-        print(f"Test data shape: {X_test.shape}")
-        
-        # Train model for risk score prediction (regression)
-        print("Training risk prediction model...")
-        self.risk_model = GradientBoostingRegressor(
-            n_estimators=100,
-            learning_rate=0.1,
-            max_depth=5,
-            random_state=42
-        )
-        
-        # Train for risk scores
-        self.risk_model.fit(X_train_scaled, y_train[:, 0])
-        
-        # Evaluate
-        train_score = self.risk_model.score(X_train_scaled, y_train[:, 0])
-        test_score = self.risk_model.score(X_test_scaled, y_test[:, 0])
-        
-        print(f"Training R² score: {train_score:.3f}")
-        print(f"Test R² score: {test_score:.3f}")
-        
-        # Train classifier for risky/not risky
-        self.classifier = RandomForestClassifier(n_estimators=50, random_state=42)
-        self.classifier.fit(X_train_scaled, y_train[:, 1])
-        
-        clf_score = self.classifier.score(X_test_scaled, y_test[:, 1])
-        print(f"Classifier accuracy: {clf_score:.3f}")
+        with self.phase("fit"):
+            # Split data
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, test_size=0.2, random_state=42
+            )
+            
+            # Scale features
+            X_train_scaled = self.scaler.fit_transform(X_train)
+            X_test_scaled = self.scaler.transform(X_test)
+            
+            print(f"Training data shape: {X_train.shape}")
+            print(f"Test data shape: {X_test.shape}")
+            
+            # Train model for risk score prediction (regression)
+            print("Training risk prediction model...")
+            self.risk_model = GradientBoostingRegressor(
+                n_estimators=100,
+                learning_rate=0.1,
+                max_depth=5,
+                random_state=42
+            )
+            
+            # Train for risk scores
+            self.risk_model.fit(X_train_scaled, y_train[:, 0])
+            
+            # Evaluate
+            train_score = self.risk_model.score(X_train_scaled, y_train[:, 0])
+            test_score = self.risk_model.score(X_test_scaled, y_test[:, 0])
+            
+            print(f"Training R² score: {train_score:.3f}")
+            print(f"Test R² score: {test_score:.3f}")
+            
+            # Train classifier for risky/not risky
+            self.classifier = RandomForestClassifier(n_estimators=50, random_state=42)
+            self.classifier.fit(X_train_scaled, y_train[:, 1])
+            
+            clf_score = self.classifier.score(X_test_scaled, y_test[:, 1])
+            print(f"Classifier accuracy: {clf_score:.3f}")
         
         return train_score, test_score
     
@@ -260,13 +277,57 @@ class FoodSafetyModel:
         self.product_subcategories = product_subcategories
         
         # Train nearest neighbors model
-        self.recommender = NearestNeighbors(n_neighbors=10, metric='euclidean')
-        self.recommender.fit(product_features)
+        with self.phase("fit"):
+            self.recommender = NearestNeighbors(n_neighbors=10, metric='euclidean')
+            self.recommender.fit(product_features)
+            
+            # Score the catalog for every disease once, so serving can rank
+            # alternatives by the user's conditions without model calls
+            if self.risk_model is not None:
+                self.product_risk = self.score_catalog_risk(products)
         
         print(f"Recommendation engine trained with {len(products)} products")
         
         return product_features.shape
     
+    def score_catalog_risk(self, products: pd.DataFrame) -> np.ndarray:
+        """Risk of every catalog product for every disease (products x diseases, float32)"""
+        nutrients = products.reindex(columns=[
+            "sugars_100g", "carbohydrates_100g", "salt_100g", "fat_100g",
+            "saturated_fat_100g", "fiber_100g", "proteins_100g", "energy_kcal_100g"
+        ]).fillna(0).to_numpy(dtype=float)
+        
+        # Condition features as serving builds them for a user's condition
+        # (DiseaseIngredientAnalyzer.condition_features)
+        condition_rows = []
+        for disease, info in self.dataset["disease_data"].items():
+            severity_weight = info.get("severity_weight", 1.0)
+            condition_rows.append([
+                disease_code(disease),
+                0,
+                1 if severity_weight >= 1.5 else 0,
+                1 if 1.2 <= severity_weight < 1.5 else 0
+            ])
+        
+        return score_catalog(self.risk_model, self.scaler, nutrients, np.array(condition_rows, dtype=float))
+    
+    def rescore_catalog(self, model_dir: Path):
+        """Rebuild the catalog risk matrix for already trained models
+        
+        For changes to the condition features that don't need retraining.
+        """
+        self.risk_model = joblib.load(model_dir / "risk_model.pkl")
+        self.scaler = joblib.load(model_dir / "scaler.pkl")
+        products = pd.read_csv("datasets/healthy_products.csv")
+        catalog = pd.read_csv(model_dir / "product_names.csv")
+        if products["product_name"].tolist() != catalog["product_name"].tolist():
+            raise SystemExit(f"datasets/healthy_products.csv isn't the catalog in {model_dir}; retrain instead")
+        
+        self.product_risk = self.score_catalog_risk(products)
+        np.save(model_dir / RISK_MATRIX_FILE, self.product_risk)
+        print(f"Rescored {self.product_risk.shape[0]} products x {self.product_risk.shape[1]} diseases "
+              f"into {model_dir / RISK_MATRIX_FILE}")
+    
     def _create_healthy_products(self):
         """Create synthetic healthy products dataset"""
         healthy_products = []
@@ -306,8 +367,9 @@ class FoodSafetyModel:
     
     def save_models(self):
         """Save all trained models"""
-        model_dir = Path("models")
-        model_dir.mkdir(exist_ok=True)
+        # Point elsewhere to train a candidate bundle for shadow scoring
+        model_dir = Path(os.environ.get("NUTRISAFE_TRAIN_OUTPUT_DIR", "models"))
+        model_dir.mkdir(parents=True, exist_ok=True)
         
         # Save models
         joblib.dump(self.risk_model, model_dir / "risk_model.pkl")
@@ -317,6 +379,8 @@ class FoodSafetyModel:
         
         # Save product data for recommendations
         np.save(model_dir / "product_vectors.npy", self.product_vectors)
+        if self.product_risk is not None:
+            np.save(model_dir / RISK_MATRIX_FILE, self.product_risk)
         
         # Ensure categories exist and match length
         if not hasattr(self, 'product_categories') or len(self.product_categories) != len(self.product_names):
@@ -331,12 +395,25 @@ class FoodSafetyModel:
         })
         product_df.to_csv(model_dir / "product_names.csv", index=False)
         
+        # Plain-array copy the serving path loads without sklearn/pandas
+        export_serving_models(
+            model_dir / SERVING_FILE, self.risk_model, self.scaler, self.recommender,
+            self.product_names, product_df["category"].fillna("General")
+        )
+        
+        # Rebalance the serving shards over the new catalog
+        n_shards = int(os.environ.get("NUTRISAFE_CATALOG_SHARDS", 0))
+        if n_shards > 1:
+            manifest = build_shards(model_dir, self.product_vectors, n_shards)
+            print(f"Catalog split into {manifest['n_shards']} shards: {manifest['sizes']}")
+        
         # Save dataset info
         with open(model_dir / "dataset_info.json", "w") as f:
             json.dump({
                 "disease_count": len(self.dataset["disease_data"]),
                 "ingredient_mapping_count": len(self.dataset["ingredient_mapping"]),
-                "training_samples": len(self.product_names)
+                "training_samples": len(self.product_names),
+                "risk_matrix_diseases": list(self.dataset["disease_data"])
             }, f, indent=2)
         
         print("Models saved successfully!")
@@ -354,7 +431,8 @@ class FoodSafetyModel:
         self.build_recommendation_engine()
         
         # Step 3: Save everything
-        self.save_models()
+        with self.phase("save"):
+            self.save_models()
         
         print("\n" + "=" * 50)
         print("TRAINING COMPLETE!")
@@ -363,6 +441,11 @@ class FoodSafetyModel:
 if __name__ == "__main__":
     import sys
     sys.path.append('.')
+    
+    if "--rescore-catalog" in sys.argv:
+        # python train_model.py --rescore-catalog: only the risk matrix
+        FoodSafetyModel().rescore_catalog(Path(os.environ.get("NUTRISAFE_TRAIN_OUTPUT_DIR", "models")))
+        sys.exit(0)
     from datasets.disease_ingredients import DiseaseIngredientDataset
     
     print("Creating datasets...")
@@ -0,0 +1,110 @@
+# file name: array_codec.py
+"""Binary framing for /analyze/array: a small JSON header plus a raw matrix
+
+    b"NSA1" | uint32 header length (little-endian) | JSON header | data
+
+The header holds "dtype" ("<f4" or "<f8"), "shape" and whatever else the
+endpoint needs ("features", "conditions" on requests; "columns" on
+responses). It is space-padded so the data starts 8-byte aligned, and
+decode_array() returns a np.frombuffer view of the body without copying.
+
+    body = encode_array(matrix, features=["sugars_100g", "salt_100g"], conditions=["diabetes"])
+    header, scores = decode_array(urlopen(Request(url, body, {"Content-Type": CONTENT_TYPE})).read())
+"""
+import json
+import struct
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CONTENT_TYPE = "application/vnd.nutrisafe.array"
+MAGIC = b"NSA1"
+DTYPES = ("<f4", "<f8")
+_PREFIX = struct.Struct("<4sI")
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+async def read_frame(stream: AsyncIterator[bytes], max_bytes: int) -> bytes:
+    """Collect a request body, giving up as soon as it exceeds max_bytes"""
+    parts = []
+    size = 0
+    async for data in stream:
+        size += len(data)
+        if size > max_bytes:
+            raise FrameTooLarge(f"Body exceeds {max_bytes} bytes")
+        parts.append(data)
+    return b"".join(parts)
+
+
+def encode_array(array: np.ndarray, **meta) -> bytes:
+    array = np.asarray(array)
+    dtype = array.dtype.newbyteorder("<")
+    if dtype.str not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, got {dtype.str}")
+    header = json.dumps({"dtype": dtype.str, "shape": list(array.shape), **meta}).encode("utf-8")
+    header += b" " * (-(_PREFIX.size + len(header)) % 8)
+    return b"".join([
+        _PREFIX.pack(MAGIC, len(header)), header,
+        np.ascontiguousarray(array, dtype=dtype).tobytes()
+    ])
+
+
+def decode_array(buffer: bytes) -> Tuple[Dict, np.ndarray]:
+    """(header, read-only view of the data); ValueError on a malformed frame"""
+    if len(buffer) < _PREFIX.size:
+        raise ValueError("Body too short for an array frame")
+    magic, header_size = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"Bad magic {magic!r}, expected {MAGIC!r}")
+    offset = _PREFIX.size + header_size
+    try:
+        header = json.loads(bytes(buffer[_PREFIX.size:offset]))
+        dtype = np.dtype(header["dtype"])
+        shape = tuple(int(n) for n in header["shape"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Bad array header: {e}")
+    if header["dtype"] not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, got {header['dtype']}")
+    if len(shape) != 2 or min(shape) < 0:
+        raise ValueError(f"Expected a 2-d shape, got {list(shape)}")
+
+    count = shape[0] * shape[1]
+    if len(buffer) - offset != count * dtype.itemsize:
+        raise ValueError(
+            f"Shape {list(shape)} needs {count * dtype.itemsize} data bytes, got {len(buffer) - offset}"
+        )
+    return header, np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+
+def feature_columns(features: Sequence[str], wanted: Sequence[str], width: int) -> List[Optional[int]]:
+    """Position of each wanted feature in the request's schema (None if absent)
+
+    The schema must name all `width` matrix columns. Names compare with
+    dashes and underscores folded, so OFF's "saturated-fat_100g" and
+    "saturated_fat_100g" are the same column.
+    """
+    if not isinstance(features, list) or len(features) != width:
+        raise ValueError(f"Header \"features\" must name each of the {width} columns")
+    positions = {}
+    for i, name in enumerate(features):
+        key = str(name).replace("-", "_")
+        if key in positions:
+            raise ValueError(f"Duplicate feature {name!r}")
+        positions[key] = i
+    known = {name.replace("-", "_") for name in wanted}
+    unknown = [name for name in features if str(name).replace("-", "_") not in known]
+    if unknown:
+        raise ValueError(f"Unknown features {unknown}; expected some of {list(wanted)}")
+    return [positions.get(name.replace("-", "_")) for name in wanted]
+
+
+def gather_columns(matrix: np.ndarray, columns: Sequence[Optional[int]]) -> np.ndarray:
+    """float64 copy of the requested columns, zeros for absent ones, NaN -> 0"""
+    out = np.zeros((len(matrix), len(columns)))
+    for j, column in enumerate(columns):
+        if column is not None:
+            out[:, j] = matrix[:, column]
+    return np.nan_to_num(out)
@@ -0,0 +1,107 @@
+# file name: bounded_executor.py
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the admission queue is full; callers should shed load (503)"""
+
+
+def _timed_call(enqueued: float, fn: Callable, args: tuple):
+    # time.monotonic is system-wide, so this also works inside pool processes
+    started = time.monotonic()
+    return started - enqueued, fn(*args)
+
+
+class BoundedExecutor:
+    """Thread or process pool for CPU-bound work with a bounded admission queue
+
+    At most `max_workers` calls run at once and at most `max_queue` more may
+    wait; beyond that `run()` raises ExecutorSaturated instead of letting the
+    backlog (and every caller's latency) grow without limit.
+
+    With kind="process" `fn` runs in the pool's processes, so anything it
+    records in module state (metrics, caches) stays there and is never
+    visible to the process serving /metrics.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 64, kind: str = "thread",
+                 on_wait: Optional[Callable[[float], None]] = None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+
+        self.kind = kind
+        self.on_wait = on_wait
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        if kind == "process":
+            self._pool = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analyze")
+
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._waits = deque(maxlen=1024)
+        self._wait_max = 0.0
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in the pool, or raise ExecutorSaturated if the queue is full"""
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated()
+            self.pending += 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            wait, result = await loop.run_in_executor(
+                self._pool, _timed_call, time.monotonic(), fn, args
+            )
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+        with self._lock:
+            self.completed += 1
+            self._waits.append(wait)
+            self._wait_max = max(self._wait_max, wait)
+        if self.on_wait is not None:
+            self.on_wait(wait)
+        return result
+
+    def stats(self) -> Dict:
+        """Queue depth and queue-wait statistics"""
+        with self._lock:
+            waits = sorted(self._waits)
+            pending = self.pending
+            completed, rejected, wait_max = self.completed, self.rejected, self._wait_max
+
+        def percentile(q: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(q * len(waits)))] * 1000
+
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": pending,
+            "queue_depth": max(0, pending - self.max_workers),
+            "completed": completed,
+            "rejected": rejected,
+            "wait_ms": {
+                "mean": sum(waits) / len(waits) * 1000 if waits else 0.0,
+                "p50": percentile(0.50),
+                "p99": percentile(0.99),
+                "max": wait_max * 1000
+            }
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
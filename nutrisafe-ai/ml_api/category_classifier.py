@@ -0,0 +1,150 @@
+# file name: category_classifier.py
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Keyword rules in priority order; the first category whose keyword occurs
+# anywhere in the lowercased name wins (same semantics as the old any() chain)
+CATEGORY_KEYWORDS = [
+    ("Beverages", ["soda", "cola", "juice", "drink", "water", "tea", "coffee"]),
+    ("Snacks", ["chips", "crisp", "cracker", "popcorn", "snack"]),
+    ("Sweets", ["chocolate", "candy", "cookie", "cake", "sweet"]),
+    ("Grains", ["bread", "pasta", "oats", "cereal", "rice", "grain"]),
+    ("Dairy", ["yogurt", "milk", "cheese", "dairy", "cream"]),
+    ("Protein", ["burger", "meat", "chicken", "fish", "protein"]),
+    ("Condiments", ["sauce", "dressing", "oil", "mayo", "condiment"]),
+    ("Nuts", ["almond", "cashew", "walnut", "pecan", "pistachio", "peanut", "seed"]),
+    ("Vegetables", ["vegetable", "veggie", "lentil", "spinach", "broccoli"])
+]
+
+# Rule names that the recommendation catalog files under a different partition
+CATEGORY_ALIASES = {
+    "Sweets": "Snacks",
+    "Protein": "Proteins"
+}
+
+# Exact OpenFoodFacts categories_tags -> catalog partition
+CATEGORY_TAGS = {
+    "en:beverages": "Beverages",
+    "en:plant-based-beverages": "Beverages",
+    "en:sodas": "Beverages",
+    "en:juices": "Beverages",
+    "en:fruit-juices": "Beverages",
+    "en:waters": "Beverages",
+    "en:teas": "Beverages",
+    "en:coffees": "Beverages",
+    "en:snacks": "Snacks",
+    "en:salty-snacks": "Snacks",
+    "en:sweet-snacks": "Snacks",
+    "en:crisps": "Snacks",
+    "en:chips-and-fries": "Snacks",
+    "en:crackers": "Snacks",
+    "en:popcorn": "Snacks",
+    "en:chocolates": "Snacks",
+    "en:candies": "Snacks",
+    "en:confectioneries": "Snacks",
+    "en:biscuits-and-cakes": "Snacks",
+    "en:biscuits": "Snacks",
+    "en:cereal-bars": "Snacks",
+    "en:protein-bars": "Snacks",
+    "en:cereals-and-potatoes": "Grains",
+    "en:cereals-and-their-products": "Grains",
+    "en:breakfast-cereals": "Grains",
+    "en:breads": "Grains",
+    "en:pastas": "Grains",
+    "en:rices": "Grains",
+    "en:oat-flakes": "Grains",
+    "en:dairies": "Dairy",
+    "en:milks": "Dairy",
+    "en:cheeses": "Dairy",
+    "en:yogurts": "Dairy",
+    "en:fermented-milk-products": "Dairy",
+    "en:creams": "Dairy",
+    "en:meats": "Proteins",
+    "en:poultries": "Proteins",
+    "en:fishes": "Proteins",
+    "en:seafood": "Proteins",
+    "en:eggs": "Proteins",
+    "en:meat-alternatives": "Proteins",
+    "en:sauces": "Condiments",
+    "en:condiments": "Condiments",
+    "en:dressings": "Condiments",
+    "en:mayonnaises": "Condiments",
+    "en:vegetable-oils": "Condiments",
+    "en:nuts": "Nuts",
+    "en:nuts-and-their-products": "Nuts",
+    "en:nut-butters": "Nuts",
+    "en:seeds": "Nuts",
+    "en:vegetables": "Vegetables",
+    "en:vegetables-based-foods": "Vegetables",
+    "en:legumes": "Vegetables",
+    "en:soups": "Vegetables"
+}
+
+DEFAULT_CATEGORY = "General"
+
+
+class CategoryClassifier:
+    """Compiled product-name + category_tags classifier
+
+    All keywords are compiled into one overlapping-match regex ordered by
+    rule priority, so a single scan replaces the per-category any() chain.
+    Output is restricted to the partitions of the recommendation catalog.
+    """
+
+    def __init__(self, catalog_categories: Optional[Iterable[str]] = None,
+                 keywords=CATEGORY_KEYWORDS, tags: Dict[str, str] = CATEGORY_TAGS):
+        catalog = set(catalog_categories) if catalog_categories is not None else None
+
+        def partition(category: str) -> str:
+            category = CATEGORY_ALIASES.get(category, category)
+            if catalog is not None and category not in catalog:
+                return DEFAULT_CATEGORY
+            return category
+
+        self._priority = {}
+        self._category = {}
+        alternatives = []
+        for priority, (category, words) in enumerate(keywords):
+            for word in words:
+                if word in self._priority:
+                    continue
+                self._priority[word] = priority
+                self._category[word] = partition(category)
+                alternatives.append(word)
+
+        # Lookahead makes matches overlap, so "chocolate" still reports "cola"
+        # exactly like the substring checks did; alternation order = priority
+        alternatives.sort(key=lambda w: (self._priority[w], -len(w)))
+        self._pattern = re.compile(
+            "(?=(" + "|".join(re.escape(w) for w in alternatives) + "))"
+        )
+        self._tags = {tag: partition(category) for tag, category in tags.items()}
+
+    def classify_name(self, product_name: str) -> str:
+        best = None
+        for match in self._pattern.finditer(product_name.lower()):
+            word = match.group(1)
+            if best is None or self._priority[word] < self._priority[best]:
+                best = word
+                if self._priority[word] == 0:
+                    break
+        return self._category[best] if best is not None else DEFAULT_CATEGORY
+
+    def classify_tags(self, category_tags: Optional[Iterable[str]]) -> Optional[str]:
+        """Most specific (last) known OFF tag wins"""
+        found = None
+        for tag in category_tags or ():
+            category = self._tags.get(tag)
+            if category is not None and category != DEFAULT_CATEGORY:
+                found = category
+        return found
+
+    def classify(self, product_name: str, category_tags: Optional[Iterable[str]] = None) -> str:
+        return self.classify_tags(category_tags) or self.classify_name(product_name or "")
+
+    def classify_many(self, product_names: List[str],
+                      category_tags: Optional[List[Optional[Iterable[str]]]] = None) -> List[str]:
+        """Categorize a batch of products"""
+        if category_tags is None:
+            return [self.classify_name(name or "") for name in product_names]
+        return [self.classify(name, tags) for name, tags in zip(product_names, category_tags)]
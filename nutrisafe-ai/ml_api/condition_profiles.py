@@ -0,0 +1,90 @@
+# file name: condition_profiles.py
+"""Condition lists compiled once and referenced by a profile ID
+
+    POST /condition-profiles  {"userConditions": ["Diabetes", "heart disease"]}
+    -> {"profileId": "cp1.WyJEaWFiZXRlcyIsImhlYXJ0IGRpc2Vhc2UiXQ", ...}
+
+Later /analyze calls send "profileId" instead of "userConditions" and the
+app reuses its compiled form of the list (matched diseases, aggregation
+weights, condition feature rows, risk-matrix columns) instead of resolving
+the free text again.
+
+The ID is the normalized condition list itself, base64url-encoded, rather
+than a key into server-side state. Any worker of a pre-forked server, or a
+restarted one, compiles an ID it hasn't seen on first use and then keeps it
+in a bounded LRU, so nothing has to be shared between processes or stored.
+"""
+import base64
+import binascii
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple
+
+PROFILE_ID_PREFIX = "cp1."
+MAX_CONDITIONS = 32
+MAX_ID_LENGTH = 4096
+
+
+class InvalidProfile(ValueError):
+    pass
+
+
+def normalize_conditions(conditions) -> List[str]:
+    """Stripped, non-empty condition strings in the caller's order"""
+    if not isinstance(conditions, (list, tuple)) or not all(isinstance(c, str) for c in conditions):
+        raise InvalidProfile("userConditions must be a list of strings")
+    conditions = [c.strip() for c in conditions if c.strip()]
+    if len(conditions) > MAX_CONDITIONS:
+        raise InvalidProfile(f"A profile holds at most {MAX_CONDITIONS} conditions")
+    return conditions
+
+
+def profile_id(conditions: List[str]) -> str:
+    raw = json.dumps(conditions, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return PROFILE_ID_PREFIX + base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def conditions_from_id(value: str) -> List[str]:
+    """The condition list an ID stands for; InvalidProfile unless it is canonical"""
+    if not isinstance(value, str) or not value.startswith(PROFILE_ID_PREFIX) or len(value) > MAX_ID_LENGTH:
+        raise InvalidProfile("Unknown profileId format (register one with POST /condition-profiles)")
+    encoded = value[len(PROFILE_ID_PREFIX):]
+    try:
+        conditions = json.loads(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)))
+    except (binascii.Error, ValueError):
+        raise InvalidProfile(f"Malformed profileId {value!r}")
+    # One ID per list, so equal profiles share a cache entry
+    if profile_id(normalize_conditions(conditions)) != value:
+        raise InvalidProfile(f"Malformed profileId {value!r}")
+    return conditions
+
+
+class ConditionProfiles:
+    """Compiled profiles by ID, each compiled at most once per worker while cached"""
+
+    def __init__(self, compile: Callable[[List[str]], Any], maxsize: int = 1024):
+        # Failed lookups raise InvalidProfile and aren't cached
+        self._compiled = lru_cache(maxsize=maxsize)(lambda value: compile(conditions_from_id(value)))
+
+    def register(self, conditions) -> Tuple[str, Any]:
+        """(profile ID, compiled profile) for a condition list"""
+        value = profile_id(normalize_conditions(conditions))
+        return value, self._compiled(value)
+
+    def get(self, value: str) -> Any:
+        """Compiled profile for an ID; InvalidProfile when it isn't one"""
+        if not isinstance(value, str):
+            # Checked before the cache, which would raise TypeError on unhashable values
+            raise InvalidProfile("profileId must be a string")
+        return self._compiled(value)
+
+    def stats(self) -> Dict:
+        info = self._compiled.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": info.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,82 @@
+# file name: condition_risk.py
+"""Precomputed catalog risk per disease, for condition-aware alternatives
+
+Training scores every catalog product against every disease once and saves
+the result as product_risk_matrix.npy (float32, products x diseases), with
+the column order in dataset_info.json. Serving then ranks a request's kNN
+candidates by the user's conditions with a column lookup instead of extra
+model calls.
+"""
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+RISK_MATRIX_FILE = "product_risk_matrix.npy"
+
+# Candidates above this risk for any of the user's conditions are dropped
+MAX_ALTERNATIVE_RISK = float(os.environ.get("ALTERNATIVE_MAX_RISK", 80))
+
+
+class ConditionRiskMatrix:
+    def __init__(self, matrix: np.ndarray, diseases: Sequence[str]):
+        self.matrix = matrix
+        self.diseases = list(diseases)
+
+    @classmethod
+    def load(cls, model_dir: Path, n_products: int) -> Optional["ConditionRiskMatrix"]:
+        """None (ranking by nutrients only) when the matrix is missing or stale"""
+        path = Path(model_dir) / RISK_MATRIX_FILE
+        if not path.exists():
+            print(f"⚠ {RISK_MATRIX_FILE} not found, alternatives won't be ranked by condition")
+            return None
+        with open(Path(model_dir) / "dataset_info.json") as f:
+            diseases = json.load(f).get("risk_matrix_diseases", [])
+        matrix = np.load(path, mmap_mode="r")
+        if matrix.shape != (n_products, len(diseases)):
+            print(f"⚠ {RISK_MATRIX_FILE} is {matrix.shape}, expected ({n_products}, {len(diseases)}); ignoring it")
+            return None
+        return cls(matrix, diseases)
+
+    def columns(self, user_conditions: List[str]) -> List[int]:
+        """Matrix columns for the user's conditions ("Heart disease" -> heart_disease)"""
+        columns = []
+        for i, disease in enumerate(self.diseases):
+            for condition in user_conditions:
+                condition = condition.lower()
+                if condition.replace(" ", "_") == disease or disease.replace("_", " ") in condition:
+                    columns.append(i)
+                    break
+        return columns
+
+    def risk(self, indices, columns: List[int]) -> Optional[np.ndarray]:
+        """Worst-case risk of each product in `indices` over `columns`"""
+        if not columns:
+            return None
+        return self.matrix[np.asarray(indices)][:, columns].max(axis=1)
+
+
+def disease_code(disease: str) -> int:
+    """Feature 9 for a disease name, the same in training and every serving process
+
+    crc32 rather than hash(), which is salted per interpreter unless
+    PYTHONHASHSEED is pinned.
+    """
+    return zlib.crc32(disease.encode("utf-8")) % 100
+
+
+def risk_band(risk: Optional[float]) -> int:
+    """0 safe, 1 medium, 2 high; unknown risk sorts with safe"""
+    if risk is None or risk <= 50:
+        return 0
+    return 1 if risk <= 80 else 2
+
+
+def score_catalog(risk_model, scaler, nutrients: np.ndarray, condition_rows: np.ndarray) -> np.ndarray:
+    """products x conditions risk from 8 nutrient and 4 condition features each"""
+    n, c = len(nutrients), len(condition_rows)
+    X = np.hstack([np.repeat(nutrients, c, axis=0), np.tile(condition_rows, (n, 1))])
+    return risk_model.predict(scaler.transform(X)).reshape(n, c).astype(np.float32)
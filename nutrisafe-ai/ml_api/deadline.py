@@ -0,0 +1,183 @@
+# file name: deadline.py
+"""Per-request time budgets for the analyze pipeline
+
+A caller that will give up after N ms sends "X-Deadline-Ms: N". The
+pipeline then checks its remaining budget between stages. The risk score is
+always computed. Optional stages (alternatives, the tail of the ingredient
+analysis) run only when their recent cost still fits, and whatever was
+dropped is listed in the response's "omitted" field. run_until() stops
+waiting once the budget is spent or the caller disconnects and cancels the
+deadline, so queued work is dropped and running work stops at its next
+stage boundary.
+"""
+import asyncio
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, List, Optional
+
+DEADLINE_HEADER = "x-deadline-ms"
+
+# Kept back for response serialization and the trip back to the caller
+MARGIN = float(os.environ.get("DEADLINE_MARGIN_MS", 50)) / 1000
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ClientDisconnected(DeadlineExceeded):
+    pass
+
+
+class StageCosts:
+    """Recent per-item cost of each optional stage
+
+    Smoothed mean plus four mean deviations, as in TCP's retransmission
+    timeout, so a stage is only started when it will very likely finish.
+    """
+
+    def __init__(self, defaults: Dict[str, float], alpha: float = 0.125, beta: float = 0.25):
+        self.alpha = alpha
+        self.beta = beta
+        self._mean = dict(defaults)
+        self._dev = {stage: cost / 2 for stage, cost in defaults.items()}
+
+    def observe(self, stage: str, seconds: float):
+        mean = self._mean.get(stage)
+        if mean is None:
+            self._mean[stage], self._dev[stage] = seconds, seconds / 2
+            return
+        self._dev[stage] += self.beta * (abs(seconds - mean) - self._dev[stage])
+        self._mean[stage] += self.alpha * (seconds - mean)
+
+    @contextmanager
+    def timed(self, stage: str, items: int = 1):
+        """Measure a stage and feed its per-item cost back in"""
+        started = time.perf_counter()
+        yield
+        if items:
+            self.observe(stage, (time.perf_counter() - started) / items)
+
+    def estimate(self, stage: str) -> float:
+        return self._mean.get(stage, 0.0) + 4 * self._dev.get(stage, 0.0)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {"mean_ms": self._mean[stage] * 1000, "estimate_ms": self.estimate(stage) * 1000}
+            for stage in self._mean
+        }
+
+
+class Deadline:
+    """Remaining budget of one request; Deadline() is unbounded
+
+    Uses time.monotonic, which is system-wide, so a Deadline pickled into a
+    process pool keeps its expiry (cancellation then only reaches threads).
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.expires = None if budget is None else time.monotonic() + budget
+        self.cancelled = False
+        self.omitted: List[str] = []
+
+    @classmethod
+    def from_headers(cls, headers) -> "Deadline":
+        value = headers.get(DEADLINE_HEADER)
+        if value is None:
+            return cls()
+        try:
+            budget_ms = float(value)
+        except ValueError:
+            raise ValueError(f"{DEADLINE_HEADER} must be a number of milliseconds, got {value!r}")
+        if not math.isfinite(budget_ms):
+            raise ValueError(f"{DEADLINE_HEADER} must be finite")
+        return cls(budget_ms / 1000)
+
+    @property
+    def bounded(self) -> bool:
+        return self.expires is not None
+
+    def remaining(self) -> float:
+        return math.inf if self.expires is None else self.expires - time.monotonic()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self, stage: str):
+        """Raise DeadlineExceeded before a required stage if nobody is waiting"""
+        if self.cancelled:
+            raise DeadlineExceeded(f"Request abandoned before {stage}")
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"Deadline passed before {stage}")
+
+    def allows(self, costs: StageCosts, stage: str) -> bool:
+        """Whether an optional stage fits; records it as omitted if not"""
+        if self.expires is not None and (self.cancelled or self.remaining() - MARGIN < costs.estimate(stage)):
+            self.omitted.append(stage)
+            return False
+        return True
+
+    def fit(self, costs: StageCosts, stage: str, items: int) -> int:
+        """How many of `items` equally costly steps fit; records a shortfall"""
+        if self.expires is None or not items:
+            return items
+        per_item = costs.estimate(stage)
+        budget = 0.0 if self.cancelled else self.remaining() - MARGIN
+        n = items if per_item <= 0 else max(0, min(items, int(budget / per_item)))
+        if n < items:
+            self.omitted.append(stage if n == 0 else f"{stage}[{n}:]")
+        return n
+
+
+class SharedDeadline(Deadline):
+    """Deadline of work several callers wait on (see SingleFlight.do_until)
+
+    Its expiry is the latest among the callers that joined, and it is
+    cancelled only once all of them have left, so the first caller timing
+    out or hanging up doesn't cut the work short for the others.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = 0
+        self._joined = False
+
+    def join(self, deadline: Deadline):
+        if not self._joined:
+            self.expires, self._joined = deadline.expires, True
+        elif self.expires is not None:
+            self.expires = None if deadline.expires is None else max(self.expires, deadline.expires)
+        self.waiting += 1
+
+    def leave(self):
+        self.waiting -= 1
+        if self.waiting <= 0:
+            self.cancel()
+
+
+async def run_until(deadline: Deadline, work: Awaitable, request=None, poll: float = 0.05):
+    """Await `work` within the deadline, watching for a disconnected caller
+
+    On expiry or disconnect the deadline is cancelled and the awaitable
+    with it: a call still queued in an executor never starts, and one
+    already running stops at its next deadline check. Without a bound
+    `work` is simply awaited.
+    """
+    if not deadline.bounded:
+        return await work
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=max(0.0, min(poll, deadline.remaining())))
+            if done:
+                return task.result()
+            if deadline.remaining() <= 0:
+                raise DeadlineExceeded("Deadline passed")
+            if request is not None and await request.is_disconnected():
+                raise ClientDisconnected("Client disconnected")
+    finally:
+        if not task.done():
+            deadline.cancel()
+            task.cancel()
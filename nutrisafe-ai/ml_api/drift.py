@@ -0,0 +1,155 @@
+# file name: drift.py
+"""Online feature-drift tracking against the scaler's training statistics
+
+The fitted scaler stores each feature's training mean and standard
+deviation. DriftMonitor keeps running live statistics for the same feature
+rows the model scores: Welford/Chan mean and variance plus a fixed-bin
+histogram in training z-units. It is fed once per vectorized model batch;
+batches are only buffered there and folded in groups of FOLD_ROWS rows, so
+the per-request cost is a list append and the numeric work is amortised.
+report() scores drift per feature as the live mean's shift in training
+standard deviations and the ratio of live to training spread.
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Histogram bins in training standard deviations, plus under/overflow
+Z_EDGES = np.linspace(-4, 4, 17)
+MIN_SAMPLES = 100
+FOLD_ROWS = 256
+
+
+class DriftMonitor:
+    def __init__(self, train_mean: Sequence[float], train_std: Sequence[float],
+                 names: Optional[Sequence[str]] = None,
+                 mean_shift_threshold: float = None, std_ratio_threshold: float = None):
+        self.train_mean = np.asarray(train_mean, dtype=float)
+        self.train_std = np.asarray(train_std, dtype=float)
+        self.train_std = np.where(self.train_std > 0, self.train_std, 1.0)
+        n = len(self.train_mean)
+        names = list(names or [])[:n]
+        self.names = names + [f"feature_{i}" for i in range(len(names), n)]
+        self.mean_shift_threshold = mean_shift_threshold or float(os.environ.get("DRIFT_MEAN_SHIFT", 0.5))
+        self.std_ratio_threshold = std_ratio_threshold or float(os.environ.get("DRIFT_STD_RATIO", 2.0))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        n = len(self.train_mean)
+        with self._lock:
+            self.count = 0
+            self.mismatched = 0
+            self._pending = []
+            self._pending_rows = 0
+            self._mean = np.zeros(n)
+            self._m2 = np.zeros(n)
+            self._hist = np.zeros(n * (len(Z_EDGES) + 1), dtype=np.int64)
+
+    def observe(self, X) -> None:
+        """Add a batch of raw (unscaled) feature rows to the live statistics"""
+        X = np.asarray(X, dtype=float)
+        with self._lock:
+            if X.ndim != 2 or X.shape[1] != len(self.train_mean):
+                # The model would reject these too; count rather than raise
+                self.mismatched += len(X) if X.ndim == 2 else 1
+                return
+            self._pending.append(X)
+            self._pending_rows += len(X)
+            if self._pending_rows >= FOLD_ROWS:
+                self._fold()
+
+    def _fold(self):
+        """Merge the buffered rows (caller holds the lock)"""
+        if not self._pending_rows:
+            return
+        X = np.vstack(self._pending)
+        self._pending = []
+        self._pending_rows = 0
+
+        batch_n = len(X)
+        batch_mean = X.mean(axis=0)
+        batch_m2 = ((X - batch_mean) ** 2).sum(axis=0)
+        z = (X - self.train_mean) / self.train_std
+        bins = np.searchsorted(Z_EDGES, z, side="right")
+        offsets = np.arange(X.shape[1]) * (len(Z_EDGES) + 1)
+        hist = np.bincount((bins + offsets).ravel(), minlength=len(self._hist))
+
+        # Chan et al. pairwise merge of (count, mean, M2)
+        total = self.count + batch_n
+        delta = batch_mean - self._mean
+        self._mean += delta * batch_n / total
+        self._m2 += batch_m2 + delta ** 2 * self.count * batch_n / total
+        self.count = total
+        self._hist += hist
+
+    def report(self, histograms: bool = False) -> Dict:
+        with self._lock:
+            self._fold()
+            count = self.count
+            mean = self._mean.copy()
+            m2 = self._m2.copy()
+            hist = self._hist.reshape(len(self.train_mean), -1).copy()
+            mismatched = self.mismatched
+
+        std = np.sqrt(m2 / (count - 1)) if count > 1 else np.zeros_like(mean)
+        if count:
+            mean_shift = (mean - self.train_mean) / self.train_std
+            std_ratio = std / self.train_std
+        else:
+            mean_shift = std_ratio = np.zeros_like(mean)
+
+        features = []
+        drifted = []
+        for i, name in enumerate(self.names):
+            row = {
+                "name": name,
+                "train_mean": float(self.train_mean[i]),
+                "train_std": float(self.train_std[i]),
+                "live_mean": float(mean[i]),
+                "live_std": float(std[i]),
+                "mean_shift": float(mean_shift[i]),
+                "std_ratio": float(std_ratio[i])
+            }
+            if histograms:
+                row["histogram"] = hist[i].tolist()
+            features.append(row)
+            ratio = std_ratio[i] if std_ratio[i] > 0 else np.inf
+            if abs(mean_shift[i]) > self.mean_shift_threshold or \
+                    max(ratio, 1 / ratio) > self.std_ratio_threshold:
+                drifted.append(name)
+
+        if count < MIN_SAMPLES:
+            status = "insufficient_data"
+        else:
+            status = "drift" if drifted else "ok"
+        report = {
+            "status": status,
+            "samples": count,
+            "mismatched_rows": mismatched,
+            "thresholds": {"mean_shift": self.mean_shift_threshold, "std_ratio": self.std_ratio_threshold},
+            "drifted_features": drifted if count >= MIN_SAMPLES else [],
+            "max_abs_mean_shift": float(np.abs(mean_shift).max()),
+            "features": features
+        }
+        if histograms:
+            report["histogram_edges_z"] = Z_EDGES.tolist()
+        return report
+
+    def mean_shifts(self, app: str) -> Dict[tuple, float]:
+        """{(app, feature): shift} for the metrics registry"""
+        with self._lock:
+            self._fold()
+            if not self.count:
+                return {}
+            shifts = (self._mean - self.train_mean) / self.train_std
+        return {(app, name): float(shift) for name, shift in zip(self.names, shifts)}
+
+
+def monitor_from_scaler(scaler, names: List[str]) -> Optional[DriftMonitor]:
+    """DriftMonitor for a fitted scaler, or None with DRIFT_MONITOR=0"""
+    if os.environ.get("DRIFT_MONITOR", "1").lower() in ("0", "false", "no", "off"):
+        return None
+    return DriftMonitor(scaler.mean_, scaler.scale_, names)
@@ -0,0 +1,56 @@
+# file name: export_models.py
+"""Export the pickled models to serving_models.npz and check parity
+
+    python export_models.py                # ml_api/models
+    python export_models.py ../ml/models
+"""
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from fast_models import SERVING_FILE, export_serving_models, load_serving_models
+
+
+def export(model_dir: Path, samples: int = 2000):
+    risk_model = joblib.load(model_dir / "risk_model.pkl")
+    scaler = joblib.load(model_dir / "scaler.pkl")
+    recommender = joblib.load(model_dir / "recommender.pkl")
+    product_data = pd.read_csv(model_dir / "product_names.csv")
+
+    export_serving_models(
+        model_dir / SERVING_FILE, risk_model, scaler, recommender,
+        product_data["product_name"].to_numpy(dtype=str),
+        product_data["category"].fillna("General").to_numpy(dtype=str)
+    )
+    fast = load_serving_models(model_dir)
+
+    # Parity on inputs spread over the training distribution
+    rng = np.random.default_rng(0)
+    X = scaler.mean_ + rng.standard_normal((samples, scaler.n_features_in_)) * scaler.scale_
+    scaled = scaler.transform(X)
+    scaler_error = np.abs(fast["scaler"].transform(X) - scaled).max()
+    risk_error = np.abs(fast["risk_model"].predict(scaled) - risk_model.predict(scaled)).max()
+
+    queries = recommender._fit_X[rng.integers(0, len(recommender._fit_X), samples)]
+    queries = queries + rng.standard_normal(queries.shape) * queries.std(axis=0)
+    k = min(20, len(recommender._fit_X))
+    distances, indices = recommender.kneighbors(queries, n_neighbors=k)
+    fast_distances, fast_indices = fast["recommender"].kneighbors(queries, n_neighbors=k)
+    neighbor_error = np.abs(fast_distances - distances).max()
+    index_mismatch = (fast_indices != indices).any(axis=1).mean()
+
+    print(f"✓ Exported {model_dir / SERVING_FILE}")
+    print(f"  scaler max error:     {scaler_error:.2e}")
+    print(f"  risk model max error: {risk_error:.2e}")
+    print(f"  kNN distance error:   {neighbor_error:.2e} "
+          f"({index_mismatch:.2%} of queries order tied neighbours differently)")
+
+    if max(scaler_error, risk_error, neighbor_error) > 1e-6:
+        sys.exit("Exported models disagree with the pickles")
+
+
+if __name__ == "__main__":
+    export(Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "models")
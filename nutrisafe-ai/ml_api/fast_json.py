@@ -0,0 +1,46 @@
+# file name: fast_json.py
+"""JSON encoding for response bodies, with orjson when it is installed
+
+FastAPI's default path walks every response through jsonable_encoder in
+Python and then json.dumps, which together cost more than the analysis for
+small payloads. The endpoints declare pydantic response models instead, so
+validation and conversion to plain types happen in pydantic-core, and
+FastJSONResponse writes the result with orjson (optional: pip install
+orjson). Without it the stdlib encoder is used, still compact and with
+numpy values converted via tolist().
+"""
+import json
+from typing import Any
+
+import numpy as np
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(
+            content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps()"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
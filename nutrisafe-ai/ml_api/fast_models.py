@@ -0,0 +1,176 @@
+# file name: fast_models.py
+"""NumPy-only stand-ins for the fitted sklearn estimators used when serving
+
+export_serving_models() flattens the fitted scaler, gradient-boosted trees
+and kNN index into plain arrays in models/serving_models.npz;
+load_serving_models() rebuilds them as small classes with the same
+transform / predict / kneighbors interface. The serving import graph then
+stays NumPy plus the web framework. Loading falls back to the pickles
+(pulling in joblib, pandas and sklearn) when no export exists yet.
+
+Neither function imports sklearn: export only reads fitted attributes.
+"""
+from pathlib import Path
+from typing import Dict, Sequence
+
+import numpy as np
+
+SERVING_FILE = "serving_models.npz"
+FORMAT_VERSION = 1
+
+
+class ArrayScaler:
+    """StandardScaler.transform"""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.n_features_in_ = len(mean)
+
+    def transform(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[1]} features, but StandardScaler is expecting "
+                f"{self.n_features_in_} features as input."
+            )
+        return (X - self.mean_) / self.scale_
+
+
+class ArrayTreeEnsemble:
+    """GradientBoostingRegressor.predict over all trees at once
+
+    Node arrays of every tree are concatenated; leaves point at themselves,
+    so walking max_depth levels lands every (sample, tree) pair on its leaf.
+    """
+
+    def __init__(self, left, right, feature, threshold, value, roots,
+                 max_depth: int, constant: float, learning_rate: float):
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.constant = constant
+        self.learning_rate = learning_rate
+
+    def predict(self, X) -> np.ndarray:
+        # Trees split on float32 inputs, like sklearn
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.constant + self.learning_rate * self.value[nodes].sum(axis=1)
+
+
+class ArrayNeighbors:
+    """NearestNeighbors.kneighbors (euclidean) by brute force"""
+
+    def __init__(self, fit_X: np.ndarray, n_neighbors: int):
+        self.fit_X = fit_X
+        self.n_neighbors = n_neighbors
+
+    def kneighbors(self, X, n_neighbors: int = None, return_distance: bool = True):
+        X = np.asarray(X, dtype=np.float64)
+        k = min(n_neighbors or self.n_neighbors, len(self.fit_X))
+        # Bound the (queries, catalog, features) temporary to ~8MB
+        step = max(1, (1 << 20) // max(1, self.fit_X.size))
+        distances = np.empty((len(X), k))
+        indices = np.empty((len(X), k), dtype=np.intp)
+        for start in range(0, len(X), step):
+            block = X[start:start + step]
+            d = np.sqrt(((block[:, None, :] - self.fit_X[None, :, :]) ** 2).sum(axis=2))
+            if k < d.shape[1]:
+                candidates = np.argpartition(d, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.broadcast_to(np.arange(d.shape[1]), d.shape)
+            candidate_d = np.take_along_axis(d, candidates, axis=1)
+            order = np.argsort(candidate_d, axis=1, kind="stable")
+            indices[start:start + step] = np.take_along_axis(candidates, order, axis=1)
+            distances[start:start + step] = np.take_along_axis(candidate_d, order, axis=1)
+        return (distances, indices) if return_distance else indices
+
+
+def export_serving_models(path, risk_model, scaler, recommender,
+                          product_names: Sequence[str], product_categories: Sequence[str]):
+    """Flatten fitted sklearn estimators into one .npz of plain arrays"""
+    if recommender.effective_metric_ != "euclidean":
+        raise ValueError(f"Only euclidean kNN can be exported, got {recommender.effective_metric_}")
+    if risk_model.estimators_.shape[1] != 1:
+        raise ValueError("Only single-output gradient boosting regressors can be exported")
+
+    trees = [estimator.tree_ for estimator in risk_model.estimators_[:, 0]]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    left, right, feature, threshold, value = [], [], [], [], []
+    for offset, tree in zip(offsets, trees):
+        own = np.arange(tree.node_count) + offset
+        leaf = tree.children_left == -1
+        left.append(np.where(leaf, own, tree.children_left + offset))
+        right.append(np.where(leaf, own, tree.children_right + offset))
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(np.where(leaf, 0.0, tree.threshold))
+        value.append(tree.value[:, 0, 0])
+
+    n_features = scaler.n_features_in_
+    np.savez(
+        path,
+        format_version=FORMAT_VERSION,
+        scaler_mean=scaler.mean_ if scaler.with_mean else np.zeros(n_features),
+        scaler_scale=scaler.scale_ if scaler.with_std else np.ones(n_features),
+        tree_left=np.concatenate(left).astype(np.int32),
+        tree_right=np.concatenate(right).astype(np.int32),
+        tree_feature=np.concatenate(feature).astype(np.int32),
+        tree_threshold=np.concatenate(threshold),
+        tree_value=np.concatenate(value),
+        tree_roots=offsets[:-1].astype(np.int32),
+        tree_max_depth=max(tree.max_depth for tree in trees),
+        gbr_constant=float(np.ravel(risk_model.init_.constant_)[0]),
+        gbr_learning_rate=risk_model.learning_rate,
+        knn_fit_X=np.asarray(recommender._fit_X, dtype=np.float64),
+        knn_n_neighbors=recommender.n_neighbors,
+        product_names=np.asarray(product_names, dtype=str),
+        product_categories=np.asarray(product_categories, dtype=str)
+    )
+
+
+def load_serving_models(model_dir: Path) -> Dict:
+    """risk_model / scaler / recommender plus catalog names and categories"""
+    path = Path(model_dir) / SERVING_FILE
+    if not path.exists():
+        return _load_pickled_models(Path(model_dir))
+
+    with np.load(path, allow_pickle=False) as data:
+        if int(data["format_version"]) != FORMAT_VERSION:
+            raise ValueError(f"{path} has format {int(data['format_version'])}, expected {FORMAT_VERSION}")
+        return {
+            "risk_model": ArrayTreeEnsemble(
+                data["tree_left"], data["tree_right"], data["tree_feature"],
+                data["tree_threshold"], data["tree_value"], data["tree_roots"],
+                int(data["tree_max_depth"]), float(data["gbr_constant"]),
+                float(data["gbr_learning_rate"])
+            ),
+            "scaler": ArrayScaler(data["scaler_mean"], data["scaler_scale"]),
+            "recommender": ArrayNeighbors(data["knn_fit_X"], int(data["knn_n_neighbors"])),
+            "product_names": data["product_names"],
+            "product_categories": data["product_categories"]
+        }
+
+
+def _load_pickled_models(model_dir: Path) -> Dict:
+    print(f"⚠ {SERVING_FILE} not found in {model_dir}, loading pickles "
+          f"(run export_models.py for a faster start)")
+    import joblib
+    import pandas as pd
+
+    product_data = pd.read_csv(model_dir / "product_names.csv")
+    return {
+        "risk_model": joblib.load(model_dir / "risk_model.pkl"),
+        "scaler": joblib.load(model_dir / "scaler.pkl"),
+        "recommender": joblib.load(model_dir / "recommender.pkl"),
+        "product_names": product_data["product_name"].to_numpy(dtype=str),
+        "product_categories": product_data["category"].fillna("General").to_numpy(dtype=str)
+    }
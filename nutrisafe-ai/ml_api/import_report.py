@@ -0,0 +1,110 @@
+# file name: import_report.py
+"""Per-module import timing for worker cold starts
+
+With IMPORT_TIME_REPORT=1, install_from_env() puts a finder at the front of
+sys.meta_path that times each module as it executes. Cumulative time
+includes the modules it imports in turn. The serving modules call it before
+their other imports and print_report() once startup is done; /admin/imports
+serves the same table. For an outside view:
+python -X importtime -c "import main".
+"""
+import os
+import sys
+import time
+from importlib.abc import MetaPathFinder
+from typing import Dict, List
+
+# Modules the serving path should not need (see fast_models.py)
+HEAVY_MODULES = ("pandas", "sklearn", "scipy", "joblib")
+
+_timings: Dict[str, Dict[str, float]] = {}
+_stack: List[float] = []  # child time accumulated by each module being executed
+_top_level_ms = 0.0
+
+
+class _TimedLoader:
+    """Wraps a loader; everything except module creation/execution is delegated"""
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._timed(spec.name, self._loader.create_module, spec)
+
+    def exec_module(self, module):
+        return self._timed(module.__name__, self._loader.exec_module, module)
+
+    @staticmethod
+    def _timed(name, fn, arg):
+        global _top_level_ms
+        _stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return fn(arg)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            children = _stack.pop()
+            row = _timings.setdefault(name, {"cumulative_ms": 0.0, "self_ms": 0.0})
+            row["cumulative_ms"] += elapsed
+            row["self_ms"] += elapsed - children
+            if _stack:
+                _stack[-1] += elapsed
+            else:
+                _top_level_ms += elapsed
+
+
+class _TimingFinder(MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader)
+            return spec
+        return None
+
+
+def install():
+    if not any(isinstance(finder, _TimingFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _TimingFinder())
+
+
+def uninstall():
+    sys.meta_path[:] = [f for f in sys.meta_path if not isinstance(f, _TimingFinder)]
+
+
+def install_from_env() -> bool:
+    enabled = os.environ.get("IMPORT_TIME_REPORT", "").lower() in ("1", "true", "yes", "on")
+    if enabled:
+        install()
+    return enabled
+
+
+def heavy_modules_loaded() -> List[str]:
+    return sorted(name for name in HEAVY_MODULES if name in sys.modules)
+
+
+def report(limit: int = 25) -> Dict:
+    rows = sorted(_timings.items(), key=lambda item: item[1]["cumulative_ms"], reverse=True)
+    return {
+        "enabled": any(isinstance(finder, _TimingFinder) for finder in sys.meta_path),
+        "total_ms": _top_level_ms,
+        "modules_timed": len(_timings),
+        "heavy_modules_loaded": heavy_modules_loaded(),
+        "top": [{"module": name, **row} for name, row in rows[:limit]]
+    }
+
+
+def print_report(limit: int = 15):
+    data = report(limit)
+    print(f"Import time: {data['total_ms']:.0f}ms across {data['modules_timed']} modules")
+    for row in data["top"]:
+        print(f"  {row['cumulative_ms']:8.1f}ms cumulative {row['self_ms']:7.1f}ms self  {row['module']}")
+    if data["heavy_modules_loaded"]:
+        print(f"⚠ Serving imported {', '.join(data['heavy_modules_loaded'])}")
@@ -0,0 +1,98 @@
+# file name: ingredient_cache.py
+import csv
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Iterable, List
+
+from ingredient_parser import ingredient_names
+from off_dump import csv_format
+
+_MISSING = object()
+
+
+class IngredientCache:
+    """Bounded, thread-safe LRU memo from raw ingredient token to its analysis"""
+
+    def __init__(self, compute: Callable[[str], Any], maxsize: int = 4096):
+        self._compute = compute
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Any:
+        """Return the cached value for a token, computing it on a miss"""
+        with self._lock:
+            value = self._data.get(token, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(token)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # Compute outside the lock so slow tokens don't serialize other requests
+        value = self._compute(token)
+        self._store(token, value)
+        return value
+
+    def warm(self, tokens: Iterable[str]) -> int:
+        """Pre-populate the cache without touching hit/miss counters"""
+        added = 0
+        for token in tokens:
+            with self._lock:
+                if token in self._data:
+                    continue
+            self._store(token, self._compute(token))
+            added += 1
+        return added
+
+    def _store(self, token: str, value: Any):
+        with self._lock:
+            self._data[token] = value
+            self._data.move_to_end(token)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        """Hit-rate statistics for health/metrics endpoints"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+def split_ingredient_tokens(ingredients_text: str) -> List[str]:
+    """Split an ingredients_text into lowercased tokens the way serving does"""
+    return ingredient_names(ingredients_text.lower(), min_length=3)
+
+
+def top_ingredient_tokens(path, n: int = 2000, column: str = "ingredients_text") -> List[str]:
+    """Most frequent ingredient tokens in an OpenFoodFacts CSV/TSV export"""
+    counts = Counter()
+
+    csv.field_size_limit(1 << 24)
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        reader = csv.DictReader(f, **csv_format(path))
+        for row in reader:
+            text = row.get(column) or ""
+            if text:
+                counts.update(split_ingredient_tokens(text))
+
+    return [token for token, _ in counts.most_common(n)]
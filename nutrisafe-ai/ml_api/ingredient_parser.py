@@ -0,0 +1,191 @@
+# file name: ingredient_parser.py
+import csv
+import re
+import sys
+import time
+from typing import List, NamedTuple, Optional
+
+from off_dump import csv_format
+
+SEPARATORS = ",;"
+OPENERS = "(["
+CLOSERS = ")]"
+TRIM_CHARS = " \t\r\n.:*_-"
+# "Ingredients: ..." headings are dropped; other "label: value" labels are kept
+HEADING_PREFIXES = ("ingredient", "ingrédient", "zutaten")
+MAX_HEADING_CHARS = 40
+
+# Only structural characters need a decision; the scanner jumps between them
+_STRUCTURAL = re.compile(r"[,;()\[\]:%]")
+
+
+class IngredientSpan(NamedTuple):
+    """One ingredient as offsets into the original ingredients_text"""
+    start: int
+    end: int
+    depth: int
+    percent: Optional[float]
+    parent: int  # index of the enclosing span, -1 at top level
+
+
+def _trim(text: str, start: int, end: int):
+    while start < end and text[start] in TRIM_CHARS:
+        start += 1
+    while end > start and text[end - 1] in TRIM_CHARS:
+        end -= 1
+    return start, end
+
+
+def _is_digit_comma(text: str, i: int, n: int) -> bool:
+    """'4,5%' (a European decimal) and '1,2-propanediol' are single ingredients"""
+    return 0 < i < n - 1 and text[i - 1].isdigit() and text[i + 1].isdigit()
+
+
+def _is_heading(text: str, start: int, end: int) -> bool:
+    """'Ingredients' / 'Ingredients of the filling' before a colon"""
+    a, b = _trim(text, start, end)
+    return b - a <= MAX_HEADING_CHARS and text[a:b].lower().startswith(HEADING_PREFIXES)
+
+
+def _percent_bounds(text: str, start: int, pct_pos: int):
+    """Return (number_start, value) for the number written before a '%'"""
+    j = pct_pos
+    while j > start and text[j - 1] == " ":
+        j -= 1
+    num_end = j
+    while j > start and (text[j - 1].isdigit() or text[j - 1] in ".,"):
+        j -= 1
+    if j == num_end:
+        return None, None
+    try:
+        return j, float(text[j:num_end].replace(",", "."))
+    except ValueError:
+        return None, None
+
+
+def parse_ingredients(text: str) -> List[IngredientSpan]:
+    """Single-pass tokenizer for OFF ingredients_text with nesting and percentages
+
+    "chocolate 30% (sugar, cocoa butter)" yields chocolate (depth 0, 30.0),
+    sugar and cocoa butter (depth 1, parent 0). Commas and semicolons both
+    separate, except a comma between digits ("4,5%", "1,2-propanediol").
+    In "emulsifier: lecithin" label and value are both spans; only an
+    "Ingredients:" heading is dropped. Spans are offsets into `text`.
+    """
+    n = len(text)
+    spans = []        # mutable [start, end, depth, percent, parent] rows
+    parents = [-1]    # stack of enclosing span indices
+    seg_start = 0
+    pct_pos = -1
+    continues = -1    # span whose group just closed; trailing text belongs to it
+
+    def emit(seg_end: int) -> int:
+        depth = len(parents) - 1
+        parent = parents[-1]
+        a, b = _trim(text, seg_start, seg_end)
+
+        percent = None
+        if pct_pos >= 0:
+            num_start, percent = _percent_bounds(text, seg_start, pct_pos)
+            if percent is not None:
+                if b == pct_pos + 1 or b == pct_pos:
+                    a, b = _trim(text, a, num_start)
+                elif a == num_start:
+                    a, b = _trim(text, pct_pos + 1, b)
+
+        if continues >= 0:
+            # "sugar (cane) 40%": trailing percentage belongs to the closed span
+            if percent is not None and spans[continues][3] is None:
+                spans[continues][3] = percent
+            return -1
+
+        if a >= b:
+            # "sugar (45%)": a bare percentage annotates the enclosing span
+            if percent is not None and parent >= 0 and spans[parent][3] is None:
+                spans[parent][3] = percent
+            return -1
+
+        spans.append([a, b, depth, percent, parent])
+        return len(spans) - 1
+
+    for match in _STRUCTURAL.finditer(text):
+        i = match.start()
+        ch = text[i]
+        if ch in SEPARATORS:
+            if ch == "," and _is_digit_comma(text, i, n):
+                continue
+            emit(i)
+            seg_start, pct_pos, continues = i + 1, -1, -1
+        elif ch in OPENERS:
+            owner = emit(i)
+            if owner < 0:
+                owner = continues if continues >= 0 else parents[-1]
+            parents.append(owner)
+            seg_start, pct_pos, continues = i + 1, -1, -1
+        elif ch in CLOSERS:
+            if len(parents) > 1:
+                emit(i)
+                continues = parents.pop()
+                seg_start, pct_pos = i + 1, -1
+        elif ch == ":":
+            if not _is_heading(text, seg_start, i):
+                emit(i)
+            seg_start, pct_pos, continues = i + 1, -1, -1
+        elif ch == "%":
+            pct_pos = i
+
+    emit(n)
+    return [IngredientSpan(*span) for span in spans]
+
+
+def ingredient_names(text: str, min_length: int = 3) -> List[str]:
+    """Flat list of ingredient names (parents and sub-ingredients)"""
+    names = []
+    for span in parse_ingredients(text):
+        if span.end - span.start >= min_length:
+            names.append(text[span.start:span.end])
+    return names
+
+
+def nest_spans(spans: List[IngredientSpan]) -> List[dict]:
+    """Turn the flat span list into a tree of {"span", "children"} nodes"""
+    nodes = [{"span": span, "children": []} for span in spans]
+    roots = []
+    for node in nodes:
+        parent = node["span"].parent
+        (nodes[parent]["children"] if parent >= 0 else roots).append(node)
+    return roots
+
+
+def measure_throughput(path: str, column: str = "ingredients_text") -> dict:
+    """Parse one column of an OFF CSV/TSV export and report MB/s"""
+    csv.field_size_limit(1 << 24)
+
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        texts = [row.get(column) or "" for row in csv.DictReader(f, **csv_format(path))]
+
+    total_bytes = sum(len(t.encode("utf-8")) for t in texts)
+    spans = 0
+    started = time.perf_counter()
+    for text in texts:
+        spans += len(parse_ingredients(text))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "rows": len(texts),
+        "spans": spans,
+        "megabytes": total_bytes / 1e6,
+        "seconds": elapsed,
+        "mb_per_s": total_bytes / 1e6 / elapsed if elapsed > 0 else 0.0
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python ingredient_parser.py <off_export.csv|.tsv> [column]")
+        sys.exit(1)
+
+    result = measure_throughput(sys.argv[1], *sys.argv[2:3])
+    print(f"Parsed {result['rows']} rows ({result['megabytes']:.2f} MB) "
+          f"into {result['spans']} spans in {result['seconds']:.3f}s "
+          f"-> {result['mb_per_s']:.2f} MB/s")
@@ -1,10 +1,39 @@
-from fastapi import FastAPI
-import joblib
+import import_report
+import_report.install_from_env()
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse
+from pydantic import BaseModel
 import numpy as np
-import pandas as pd
 import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from ingredient_cache import IngredientCache, top_ingredient_tokens
+from ingredient_parser import parse_ingredients
+from category_classifier import CategoryClassifier
+from micro_batcher import MicroBatcher
+from process_memory import memory_usage
+from singleflight import SingleFlight, payload_key
+from metrics import REGISTRY, CONTENT_TYPE, BATCH_SIZE_BUCKETS, RequestMetrics, StageTimers
+from profiling import profiler_from_env, pstats_text
+from fast_models import load_serving_models
+from condition_risk import MAX_ALTERNATIVE_RISK, ConditionRiskMatrix, risk_band
+from product_store import STORE_FILE, ProductStore
+from drift import monitor_from_scaler
+from sharded_catalog import ShardedNeighbors, catalog_from_env
+from shadow import shadow_from_env
+from condition_profiles import ConditionProfiles, InvalidProfile
+from deadline import ClientDisconnected, Deadline, DeadlineExceeded, StageCosts, run_until
+from ndjson_stream import DEFAULT_CHUNK_SIZE, DuplexStreamingResponse, ndjson_results, parse_profiles
+from fast_json import FastJSONResponse
+from array_codec import (
+    CONTENT_TYPE as ARRAY_CONTENT_TYPE, FrameTooLarge, decode_array, encode_array,
+    feature_columns, gather_columns, read_frame
+)
  
-app = FastAPI(title="NutriSafe AI – ML Engine")
+app = FastAPI(title="NutriSafe AI – ML Engine", default_response_class=FastJSONResponse)
 
 DISEASE_WEIGHTS = {
     # Metabolic
@@ -43,17 +72,31 @@ print(f"Looking for models in: {MODEL_DIR}")
 if not MODEL_DIR.exists():
     raise FileNotFoundError(f"Models directory not found at: {MODEL_DIR}")
 
-# Load models with explicit paths
-risk_model = joblib.load(MODEL_DIR / "risk_model.pkl")
-scaler = joblib.load(MODEL_DIR / "scaler.pkl")
-knn = joblib.load(MODEL_DIR / "recommender.pkl")
-product_vectors = np.load(MODEL_DIR / "product_vectors.npy")
-product_data = pd.read_csv(MODEL_DIR / "product_names.csv")
+# Load models from their exported arrays (no pandas / sklearn at import)
+models = load_serving_models(MODEL_DIR)
+risk_model = models["risk_model"]
+scaler = models["scaler"]
+# Shard processes when NUTRISAFE_CATALOG_SHARDS > 1 (and the shards are built)
+knn = catalog_from_env(MODEL_DIR, models.pop("recommender"))
+# Memory-mapped: pre-forked workers (serve.py) share the page cache copy
+product_vectors = np.load(MODEL_DIR / "product_vectors.npy", mmap_mode="r")
 
 print("✓ All models loaded successfully!")
+if import_report.report()["enabled"]:
+    import_report.print_report()
 # ---------------- LOAD MODELS ----------------
-product_names = product_data["product_name"].tolist()
-product_categories = product_data["category"].tolist()
+# Packed NumPy string arrays rather than lists of str objects: reading them
+# doesn't touch per-object refcounts, so forked workers keep sharing the pages
+product_names = models["product_names"]
+product_categories = models["product_categories"]
+# Catalog risk per disease, to keep alternatives safe for the user's conditions
+condition_risk = ConditionRiskMatrix.load(MODEL_DIR, len(product_names))
+
+# Barcode -> product, bulk-loaded from an OFF dump (product_store.py load)
+product_store = ProductStore(Path(os.environ.get("PRODUCT_STORE_PATH", BASE_DIR / STORE_FILE)))
+
+# Classifier output is restricted to the partitions the catalog is indexed by
+category_classifier = CategoryClassifier(product_categories)
 
 DISEASES = [
     "diabetes", "obesity", "pcos", "gout",
@@ -61,7 +104,90 @@ DISEASES = [
     "kidney", "ibs", "acid_reflux", "gluten", "lactose"
 ]
 
+# Nutriment features of the model row, in the order prepare_payload builds it
+NUTRIENT_FEATURES = [
+    "sugars_100g", "carbohydrates_100g", "salt_100g", "fat_100g",
+    "saturated-fat_100g", "fiber_100g", "proteins_100g", "energy-kcal_100g"
+]
+
+# This app scores one row of nutriments + severity for all DISEASES at once;
+# train_model.py's 12-feature models score one condition per row instead
+MODEL_ROW_WIDTH = len(NUTRIENT_FEATURES) + 1
+
+def model_row_error():
+    if scaler.n_features_in_ == MODEL_ROW_WIDTH:
+        return None
+    return (
+        f"Loaded models take {scaler.n_features_in_} features per row, this app builds "
+        f"{MODEL_ROW_WIDTH}; serve them with ml_inference.py"
+    )
+
+class ModelRowMismatch(RuntimeError):
+    """The loaded models don't take this app's rows; endpoints answer 503"""
+
+def require_model_row():
+    error = model_row_error()
+    if error:
+        raise ModelRowMismatch(error)
+
+if model_row_error():
+    print(f"⚠ {model_row_error()}")
+
+# Live feature statistics vs. the scaler's training mean/std
+drift_monitor = monitor_from_scaler(scaler, NUTRIENT_FEATURES + ["severity"])
+
 # ---------------- HELPERS ----------------
+def tag_ingredient(ing: str) -> str:
+    """Rule-based risk tag for a single lowercased ingredient token"""
+    if any(k in ing for k in ["sugar", "syrup", "glucose", "fructose"]):
+        return "high"
+    elif any(k in ing for k in ["salt", "sodium", "fat", "oil"]):
+        return "medium"
+    return "low"
+
+# Shared across requests: the same tokens ("sugar", "salt", ...) repeat constantly.
+# A warm hit is ~2x cheaper than tag_ingredient, a miss ~2x dearer (bench_inference.py
+# ml_api.tag_ingredient cases); real traffic hits >99%.
+ingredient_cache = IngredientCache(
+    tag_ingredient,
+    maxsize=int(os.environ.get("INGREDIENT_CACHE_SIZE", 4096))
+)
+
+warm_file = os.environ.get("INGREDIENT_CACHE_WARM_FILE")
+if warm_file:
+    warmed = ingredient_cache.warm(top_ingredient_tokens(warm_file, n=ingredient_cache.maxsize))
+    print(f"✓ Ingredient cache warmed with {warmed} tokens")
+
+def condition_weights(user_conditions: List[str]) -> dict:
+    """Aggregation weight of each disease for the selected conditions (0 if unselected)"""
+    weights = {}
+    for disease in DISEASES:
+        weights[disease] = 0.0
+        for cond in user_conditions:
+            if disease.replace("_", " ") in cond.lower():
+                weights[disease] += DISEASE_WEIGHTS.get(disease, 1.0)
+    return weights
+
+def compile_conditions(user_conditions: List[str]) -> dict:
+    """Everything /analyze derives from a condition list, resolved once"""
+    conditions = [c.lower() for c in user_conditions]
+    return {
+        "conditions": conditions,
+        "weights": condition_weights(conditions),
+        "risk_columns": condition_risk.columns(conditions) if condition_risk else []
+    }
+
+# Registered condition lists, compiled once per worker
+condition_profiles = ConditionProfiles(
+    compile_conditions, maxsize=int(os.environ.get("CONDITION_PROFILE_CACHE_SIZE", 1024))
+)
+
+def payload_profile(payload: dict) -> dict:
+    """The payload's registered profile, else its userConditions compiled for this request"""
+    if payload.get("profileId") is not None:
+        return condition_profiles.get(payload["profileId"])
+    return compile_conditions(payload.get("userConditions", []))
+
 def risk_level(score: float):
     if score > 80:
         return "high"
@@ -69,29 +195,289 @@ def risk_level(score: float):
         return "medium"
     return "low"
 
-def detect_product_category(product_name: str) -> str:
-    """Detect category from product name"""
-    name = product_name.lower()
-    
-    if any(word in name for word in ["soda", "cola", "juice", "drink", "water", "tea", "coffee"]):
-        return "Beverages"
-    elif any(word in name for word in ["chips", "crisp", "cracker", "popcorn", "snack"]):
-        return "Snacks"
-    elif any(word in name for word in ["chocolate", "candy", "cookie", "cake", "sweet"]):
-        return "Sweets"
-    elif any(word in name for word in ["bread", "pasta", "oats", "cereal", "rice", "grain"]):
-        return "Grains"
-    elif any(word in name for word in ["yogurt", "milk", "cheese", "dairy", "cream"]):
-        return "Dairy"
-    elif any(word in name for word in ["burger", "meat", "chicken", "fish", "protein"]):
-        return "Protein"
-    elif any(word in name for word in ["sauce", "dressing", "oil", "mayo", "condiment"]):
-        return "Condiments"
-    return "General"
+# Candidate model scoring sampled traffic when NUTRISAFE_SHADOW_MODEL_DIR is set
+shadow = shadow_from_env({"scaler": scaler, "risk_model": risk_model}, risk_level)
+
+def detect_product_category(product_name: str, category_tags=None) -> str:
+    """Detect category from OFF category tags, falling back to the product name"""
+    return category_classifier.classify(product_name, category_tags)
+
+# ---------------- METRICS ----------------
+stages = StageTimers("ml_api")
+analyze_metrics = RequestMetrics("ml_api", "/analyze")
+batch_sizes = REGISTRY.histogram(
+    "nutrisafe_batch_size", "Items per vectorized model batch",
+    ("app", "batcher"), buckets=BATCH_SIZE_BUCKETS
+)
+inference_tiers = REGISTRY.counter(
+    "nutrisafe_inference_tier_total", "Analyses by the inference tier that answered them", ("app", "tier")
+)
+# "full": model + kNN on the product's row; "ingredients_only": no usable
+# nutriments, so the model output is a cached constant
+TIERS = {tier: inference_tiers.labels("ml_api", tier) for tier in ("full", "ingredients_only")}
+
+def run_model_batch(rows):
+    """scaler -> risk_model -> kneighbors for a batch of feature rows"""
+    require_model_row()
+    clock = stages.clock()
+    X = np.vstack(rows)
+    if drift_monitor:
+        drift_monitor.observe(X)
+        clock.mark("drift_observe")
+    X_scaled = scaler.transform(X)
+    clock.mark("scaler_transform")
+    disease_scores = risk_model.predict(X_scaled)
+    clock.mark("risk_model_predict")
+    distances, indices = knn.kneighbors(X[:, :7], n_neighbors=20)
+    clock.mark("kneighbors")
+    return list(zip(disease_scores, distances, indices))
+
+def has_nutrient_signal(x) -> bool:
+    """False when every nutriment in a prepared row is missing, NaN or zero"""
+    return bool(x[:len(NUTRIENT_FEATURES)].any())
+
+@lru_cache(maxsize=1)
+def nutrient_free_output():
+    """Model output for a row without nutriments: the same for every such product
+
+    Computed once on first use, outside the batcher and the drift monitor.
+    """
+    require_model_row()
+    X = np.zeros((1, len(NUTRIENT_FEATURES) + 1))
+    X[0, -1] = 3
+    disease_scores = risk_model.predict(scaler.transform(X))
+    distances, indices = knn.kneighbors(X[:, :7], n_neighbors=20)
+    return disease_scores[0], distances[0], indices[0]
+
+# Concurrent single /analyze calls share one vectorized model pass
+model_batcher = MicroBatcher(
+    run_model_batch,
+    max_batch=int(os.environ.get("MICRO_BATCH_MAX", 32)),
+    name="model-batcher",
+    on_batch=batch_sizes.labels("ml_api", "model").observe
+)
+
+# Per-item cost of the stages a request deadline may drop, learned from traffic
+stage_costs = StageCosts({"ingredient_analysis": 0.0001, "alternatives": 0.005})
+
+# Identical concurrent payloads (viral products, client retries) share one computation
+analyze_flights = SingleFlight()
+
+# Off unless REQUEST_PROFILING=1 or PROFILE_SAMPLE_EVERY=N
+profiler = profiler_from_env("ml_api", BASE_DIR / "profiles")
+
+REGISTRY.function(
+    "nutrisafe_ingredient_cache_lookups_total", "Ingredient cache lookups by result",
+    lambda: {
+        ("ml_api", "hit"): ingredient_cache.hits,
+        ("ml_api", "miss"): ingredient_cache.misses
+    },
+    ("app", "result"), kind="counter"
+)
+REGISTRY.function(
+    "nutrisafe_ingredient_cache_entries", "Ingredient cache size",
+    lambda: {("ml_api",): len(ingredient_cache)}, ("app",)
+)
+REGISTRY.function(
+    "nutrisafe_feature_drift_mean_shift", "Live feature mean minus training mean, in training SDs",
+    lambda: drift_monitor.mean_shifts("ml_api") if drift_monitor else {}, ("app", "feature")
+)
+REGISTRY.function(
+    "nutrisafe_shadow_requests_total", "Sampled requests by shadow-scoring outcome",
+    lambda: {
+        ("ml_api", "scored"): shadow.scored,
+        ("ml_api", "dropped"): shadow.dropped,
+        ("ml_api", "error"): shadow.errors
+    } if shadow is not None else {},
+    ("app", "outcome"), kind="counter"
+)
+REGISTRY.function(
+    "nutrisafe_singleflight_requests_total", "Analyze requests by coalescing outcome",
+    lambda: {
+        ("ml_api", "executed"): analyze_flights.executions,
+        ("ml_api", "coalesced"): analyze_flights.coalesced
+    },
+    ("app", "outcome"), kind="counter"
+)
+
+# ---------------- RESPONSE MODELS ----------------
+class IngredientTag(BaseModel):
+    name: str
+    risk: str
+
+class Alternative(BaseModel):
+    name: str
+    category: str
+    match_score: float
+    condition_risk: Optional[float] = None
+
+class AnalysisResponse(BaseModel):
+    risk_score: int
+    risk_level: str
+    ingredient_analysis: List[IngredientTag]
+    disease_breakdown: Dict[str, float]
+    alternatives: List[Alternative]
+    tier: str
+    # Only present when a deadline dropped stages
+    omitted: Optional[List[str]] = None
+
+class BarcodeResponse(AnalysisResponse):
+    product: Dict
 
 # ---------------- API ----------------
-@app.post("/analyze")
-def analyze(payload: dict):
+@app.post("/analyze", response_model=AnalysisResponse, response_model_exclude_unset=True)
+async def analyze(payload: dict, request: Request, response: Response):
+    try:
+        deadline = Deadline.from_headers(request.headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        with analyze_metrics.track():
+            mode = profiler.requested(
+                request.headers.get("x-profile"), request.query_params.get("profile")
+            )
+            if mode:
+                # Profiled requests skip coalescing so they always do their own work
+                result, profile_id = await run_until(
+                    deadline,
+                    run_in_threadpool(profiler.run, mode, analyze_payload, payload, deadline),
+                    request
+                )
+                response.headers["X-Profile-Id"] = profile_id
+                return result
+            # Bounded calls only join bounded ones, so an unbounded caller
+            # never gets a result trimmed to someone else's budget
+            return await analyze_flights.do_until(
+                payload_key([payload, deadline.bounded]), deadline, request,
+                run_in_threadpool, analyze_payload, payload
+            )
+    except InvalidProfile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ModelRowMismatch as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ClientDisconnected as e:
+        # Nobody reads this; nginx's code for a caller that hung up
+        raise HTTPException(status_code=499, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+@app.post("/analyze/barcode", response_model=BarcodeResponse, response_model_exclude_unset=True)
+async def analyze_barcode(payload: dict, request: Request, response: Response):
+    """Analyze a product from the local store by barcode: no OFF round trip"""
+    product = await run_in_threadpool(stored_product, str(payload.get("barcode", "")))
+    barcode_payload = {"product": product, "userConditions": payload.get("userConditions", [])}
+    if "profileId" in payload:
+        barcode_payload["profileId"] = payload["profileId"]
+    result = await analyze(barcode_payload, request, response)
+    return {"product": product, **result}
+
+@app.get("/products/{barcode}")
+def get_product(barcode: str):
+    """Product from the local store"""
+    return stored_product(barcode)
+
+@app.post("/condition-profiles")
+def register_condition_profile(payload: dict):
+    """Compile a condition list once; /analyze then takes the returned profileId"""
+    try:
+        profile_id, profile = condition_profiles.register(payload.get("userConditions"))
+    except InvalidProfile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return describe_profile(profile_id, profile)
+
+@app.get("/condition-profiles/{profile_id}")
+def get_condition_profile(profile_id: str):
+    """What a profile ID resolves to"""
+    try:
+        profile = condition_profiles.get(profile_id)
+    except InvalidProfile as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return describe_profile(profile_id, profile)
+
+def describe_profile(profile_id: str, profile: dict) -> dict:
+    return {
+        "profileId": profile_id,
+        "userConditions": profile["conditions"],
+        "weights": {disease: weight for disease, weight in profile["weights"].items() if weight},
+        # Matched no disease, so they don't change the aggregation
+        "unmatched": [
+            c for c in profile["conditions"] if not any(d.replace("_", " ") in c for d in DISEASES)
+        ]
+    }
+
+def stored_product(barcode: str) -> dict:
+    if not barcode.strip():
+        raise HTTPException(status_code=400, detail="Barcode required")
+    if not product_store.available():
+        raise HTTPException(status_code=503, detail="Product store not loaded (product_store.py load <dump>)")
+    product = product_store.get(barcode)
+    if product is None:
+        raise HTTPException(status_code=404, detail=f"Barcode {barcode} not in the product store")
+    return product
+
+def analyze_payload(payload: dict, deadline: Deadline = None):
+    """Full analysis of one /analyze payload
+
+    With a bounded deadline, work whose caller has gone is dropped and the
+    optional stages shrink to what still fits (see deadline.py).
+    """
+    deadline = deadline or Deadline()
+    deadline.check("ingredient_tagging")
+    context, x = prepare_payload(payload, deadline)
+    if not has_nutrient_signal(x):
+        TIERS["ingredients_only"].inc()
+        return finish_payload(context, nutrient_free_output(), tier="ingredients_only", deadline=deadline)
+    TIERS["full"].inc()
+    deadline.check("model_batch")
+    with stages.time("model_batch"):
+        model_output = model_batcher.submit(x)
+    if shadow is not None and shadow.sampled():
+        # Only queued here; the candidate model runs on the shadow thread
+        weights = context["profile"]["weights"]
+        shadow.offer(
+            x[None, :],
+            lambda scores: aggregate_risk(dict(zip(DISEASES, scores[0])), weights)
+        )
+    return finish_payload(context, model_output, deadline=deadline)
+
+
+def analyze_chunk(payloads: List[dict]) -> List[dict]:
+    """Analyze many payloads with a single vectorized model pass
+
+    Payloads that fail on their own come back as {"error": ...} entries.
+    """
+    results = [None] * len(payloads)
+    prepared = []
+    for i, payload in enumerate(payloads):
+        try:
+            context, x = prepare_payload(payload)
+            if has_nutrient_signal(x):
+                prepared.append((i, context, x))
+            else:
+                TIERS["ingredients_only"].inc()
+                results[i] = finish_payload(context, nutrient_free_output(), tier="ingredients_only")
+        except Exception as e:
+            results[i] = {"error": f"{type(e).__name__}: {e}"}
+
+    if prepared:
+        TIERS["full"].inc(len(prepared))
+        with stages.time("model_batch"):
+            outputs = run_model_batch([x for _, _, x in prepared])
+        for (i, context, _), model_output in zip(prepared, outputs):
+            try:
+                results[i] = finish_payload(context, model_output)
+            except Exception as e:
+                results[i] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+
+def prepare_payload(payload: dict, deadline: Deadline = None):
+    """Ingredient tagging and the model feature row for one payload
+
+    Under a tight deadline only the leading ingredients are tagged.
+    """
+    clock = stages.clock()
+    profile = payload_profile(payload)
     product = payload.get("product", {})
     ingredients_text = (
         product.get("ingredients") or 
@@ -102,24 +488,18 @@ def analyze(payload: dict):
     # ---------------- INGREDIENT RISK TAGGING ----------------
     ingredient_risk = []
 
-    for ing in ingredients_text.split(","):
-        ing = ing.strip()
-        if not ing or len(ing) < 3:
-            continue
-
-        risk = "low"
-
-        if any(k in ing for k in ["sugar", "syrup", "glucose", "fructose"]):
-            risk = "high"
-        elif any(k in ing for k in ["salt", "sodium", "fat", "oil"]):
-            risk = "medium"
+    spans = [span for span in parse_ingredients(ingredients_text) if span.end - span.start >= 3]
+    if deadline is not None:
+        spans = spans[:deadline.fit(stage_costs, "ingredient_analysis", len(spans))]
+    with stage_costs.timed("ingredient_analysis", len(spans)):
+        for span in spans:
+            ing = ingredients_text[span.start:span.end]
 
-        ingredient_risk.append({
-            "name": ing,
-            "risk": risk
-        })
-
-    user_conditions = [c.lower() for c in payload.get("userConditions", [])]
+            ingredient_risk.append({
+                "name": ing,
+                "risk": ingredient_cache.get(ing)
+            })
+    clock.mark("ingredient_tagging")
 
     nutr = product.get("nutriments", {})
 
@@ -136,58 +516,111 @@ def analyze(payload: dict):
     ]])
 
     X = np.nan_to_num(X)
-    X_scaled = scaler.transform(X)
+    clock.mark("feature_building")
+
+    context = {
+        "product": product,
+        "nutr": nutr,
+        "profile": profile,
+        "ingredient_risk": ingredient_risk
+    }
+    return context, X[0]
+
+
+def finish_payload(context: dict, model_output, tier: str = "full", deadline: Deadline = None):
+    """Risk aggregation and alternatives from one row of model output"""
+    clock = stages.clock()
+    product = context["product"]
+    nutr = context["nutr"]
+    profile = context["profile"]
+    ingredient_risk = context["ingredient_risk"]
 
     # ---------------- ML RISK PREDICTION ----------------
-    disease_scores = risk_model.predict(X_scaled)[0]
-    disease_risk = dict(zip(DISEASES, disease_scores))
+    disease_scores, neighbor_distances, neighbor_indices = model_output
+    # One bulk conversion to Python floats instead of numpy scalars per item
+    disease_risk = dict(zip(DISEASES, np.asarray(disease_scores, dtype=float).tolist()))
+
+    final_risk = aggregate_risk(disease_risk, profile["weights"])
+    clock.mark("risk_aggregation")
 
+    alternatives = []
+    if deadline is None or deadline.allows(stage_costs, "alternatives"):
+        with stage_costs.timed("alternatives"):
+            alternatives = find_alternatives(
+                product, nutr, profile["risk_columns"], neighbor_distances, neighbor_indices, clock
+            )
+
+    result = {
+        "risk_score": int(final_risk),
+        "risk_level": risk_level(final_risk),
+        "ingredient_analysis": ingredient_risk,
+        "disease_breakdown": disease_risk,
+        "alternatives": alternatives,
+        "tier": tier
+    }
+    if deadline is not None and deadline.omitted:
+        result["omitted"] = list(deadline.omitted)
+    return result
+
+
+def aggregate_risk(disease_risk: dict, weights: dict) -> float:
+    """Weighted mean of the selected diseases' scores, else the mean of all
+
+    `weights` comes from condition_weights (via the request's profile).
+    """
     # ---------------- WEIGHTED RISK AGGREGATION ----------------
     weighted_sum = 0.0
     weight_total = 0.0
 
     for disease, score in disease_risk.items():
-        for cond in user_conditions:
-            if disease.replace("_", " ") in cond.lower():
-                weight = DISEASE_WEIGHTS.get(disease, 1.0)
-                weighted_sum += score * weight
-                weight_total += weight
+        weighted_sum += score * weights[disease]
+        weight_total += weights[disease]
 
     # If user selected diseases, use weighted score
     if weight_total > 0:
-        final_risk = weighted_sum / weight_total
-    else:
-        # Fallback: overall population risk
-        final_risk = np.mean(list(disease_risk.values()))
+        return weighted_sum / weight_total
+    # Fallback: overall population risk
+    return np.mean(list(disease_risk.values()))
+
 
+def find_alternatives(product: dict, nutr: dict, risk_columns: List[int],
+                      neighbor_distances, neighbor_indices, clock) -> List[dict]:
+    """Safer, same-category products among the kNN candidates"""
     # ---------------- ML RECOMMENDATION WITH CATEGORY MATCHING ----------------
-    distances, indices = knn.kneighbors(X[:, :7], n_neighbors=20)
-    
     # Detect original product category
     original_product_name = product.get("name", "") or product.get("product_name", "")
-    original_category = detect_product_category(original_product_name)
+    original_category = detect_product_category(
+        original_product_name, product.get("category_tags")
+    )
+    clock.mark("category_detection")
     
     alternatives = []
     original_energy = nutr.get("energy-kcal_100g", 0)
+    candidate_risk = condition_risk.risk(neighbor_indices, risk_columns) if risk_columns else None
     
     # First pass: Collect all candidates
     candidates = []
-    for idx in indices[0]:
+    neighbors = zip(np.asarray(neighbor_indices).tolist(), np.asarray(neighbor_distances).tolist())
+    for k, (idx, distance) in enumerate(neighbors):
         if idx < len(product_names):
-            name = product_names[idx]
-            category = product_categories[idx] if idx < len(product_categories) else "General"
+            name = str(product_names[idx])
+            category = str(product_categories[idx]) if idx < len(product_categories) else "General"
             
             # Skip very short / noisy names
             if len(name) < 6:
                 continue
             
             # Energy-based sanity filter
-            candidate_energy = product_vectors[idx][5]  # energy_kcal
+            candidate_energy = float(product_vectors[idx][5])  # energy_kcal
             if candidate_energy > original_energy * 1.5:  # Allow some variation
                 continue
             
+            # Skip products that are themselves risky for the user's conditions
+            risk = None if candidate_risk is None else float(candidate_risk[k])
+            if risk is not None and risk > MAX_ALTERNATIVE_RISK:
+                continue
+            
             # Calculate match score (distance to similarity)
-            distance = distances[0][list(indices[0]).index(idx)]
             similarity_score = (1 - distance) * 100
             
             # Boost score for same category
@@ -199,11 +632,12 @@ def analyze(payload: dict):
                 "category": category,
                 "score": min(95, similarity_score),
                 "same_category": category == original_category,
-                "energy": candidate_energy
+                "energy": candidate_energy,
+                "condition_risk": risk
             })
     
-    # Sort by: same category first, then score
-    candidates.sort(key=lambda x: (-x["same_category"], -x["score"]))
+    # Sort by: safest for the user's conditions, same category, then score
+    candidates.sort(key=lambda x: (risk_band(x["condition_risk"]), -x["same_category"], -x["score"]))
     
     # Take top 5 unique products
     seen_names = set()
@@ -215,20 +649,167 @@ def analyze(payload: dict):
             alternatives.append({
                 "name": candidate["name"],
                 "category": candidate["category"],
-                "match_score": candidate["score"]
+                "match_score": candidate["score"],
+                "condition_risk": candidate["condition_risk"]
             })
+    clock.mark("alternatives_filter")
 
-    return {
-        "risk_score": int(final_risk),
-        "risk_level": risk_level(final_risk),
-        "ingredient_analysis": ingredient_risk,
-        "disease_breakdown": disease_risk,
-        "alternatives": alternatives
-    }
+    return alternatives
+
+
+@app.post("/analyze/stream")
+async def analyze_stream(
+    request: Request,
+    profile: List[str] = Query(default=[]),
+    chunk_size: int = Query(default=int(os.environ.get("STREAM_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)), ge=1, le=4096)
+):
+    """Bulk scoring: NDJSON payloads (or bare products) in, NDJSON results out
+
+    Each `profile` query value is a comma-separated condition list; bare
+    products are scored once per profile.
+    """
+    async def score(payloads):
+        with stages.time("stream_chunk"):
+            return await run_in_threadpool(analyze_chunk, payloads)
+
+    return DuplexStreamingResponse(
+        ndjson_results(request.stream(), score, parse_profiles(profile), chunk_size),
+        media_type="application/x-ndjson"
+    )
+
+
+def score_matrix(matrix: np.ndarray, columns: List[int], user_conditions: List[str],
+                 block_rows: int = 16384) -> np.ndarray:
+    """risk_score plus the per-disease scores for every row of a nutriment matrix
+
+    `columns` gives the matrix column of each NUTRIENT_FEATURES entry.
+    """
+    require_model_row()
+    nutrients = gather_columns(matrix, columns)
+    weights = np.array(list(condition_weights([c.lower() for c in user_conditions]).values()))
+
+    scores = []
+    for start in range(0, len(nutrients), block_rows):
+        block = nutrients[start:start + block_rows]
+        X = np.hstack([block, np.full((len(block), 1), 3.0)])
+        if drift_monitor:
+            drift_monitor.observe(X)
+        with stages.time("scaler_transform"):
+            X_scaled = scaler.transform(X)
+        with stages.time("risk_model_predict"):
+            scores.append(np.asarray(risk_model.predict(X_scaled)).reshape(len(block), -1))
+    scores = np.vstack(scores) if scores else np.empty((0, len(DISEASES)))
+
+    # Weighted like finish_payload; population mean when nothing is selected
+    if weights.sum() > 0:
+        risk = scores @ weights / weights.sum()
+    else:
+        risk = scores.mean(axis=1)
+    return np.column_stack([risk, scores])
+
+
+@app.post("/analyze/array")
+async def analyze_array(request: Request):
+    """Bulk risk scores for a raw nutriment matrix, binary in and out
+
+    The request is an array_codec frame whose header lists "features" (one
+    nutriment name per column) and optionally "conditions". The response
+    frame has columns ["risk_score", *DISEASES] in the request's dtype.
+    """
+    try:
+        body = await read_frame(request.stream(), int(os.environ.get("ARRAY_MAX_BYTES", 64 << 20)))
+        header, matrix = decode_array(body)
+        columns = feature_columns(header.get("features"), NUTRIENT_FEATURES, matrix.shape[1])
+    except FrameTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        scores = await run_in_threadpool(
+            score_matrix, matrix, columns, [str(c) for c in header.get("conditions", [])]
+        )
+    except ModelRowMismatch as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(
+        encode_array(scores.astype(matrix.dtype), columns=["risk_score", *DISEASES]),
+        media_type=ARRAY_CONTENT_TYPE
+    )
 
 
 @app.get("/")
 def health():
 
-    return {"status": "ML API running"}
+    return {
+        "status": "ML API running",
+        "ingredient_cache": ingredient_cache.stats(),
+        "micro_batching": model_batcher.stats(),
+        "coalescing": analyze_flights.stats(),
+        "condition_profiles": condition_profiles.stats(),
+        "product_store": product_store.stats(),
+        "deadline_stage_costs": stage_costs.snapshot(),
+        "catalog": knn.stats() if isinstance(knn, ShardedNeighbors) else {"shards": 1},
+        "worker": memory_usage()
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of per-stage latency, counters and gauges"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/admin/drift")
+def feature_drift(histograms: bool = False):
+    """Live feature statistics compared with the scaler's training statistics"""
+    if drift_monitor is None:
+        return {"status": "disabled"}
+    return drift_monitor.report(histograms)
+
+
+@app.post("/admin/drift/reset")
+def reset_feature_drift():
+    """Start the live statistics over, e.g. after deploying a retrained model"""
+    if drift_monitor is not None:
+        drift_monitor.reset()
+    return {"status": "reset"}
+
+
+@app.get("/admin/shadow")
+def shadow_report(recent: int = 20):
+    """Candidate vs. production scores and latency on sampled traffic"""
+    if shadow is None:
+        return {"status": "disabled"}
+    return shadow.report(recent)
+
+
+@app.post("/admin/shadow/reset")
+def reset_shadow():
+    """Clear the shadow log, e.g. after switching candidate bundles"""
+    if shadow is not None:
+        shadow.reset()
+    return {"status": "reset"}
+
+
+@app.get("/admin/imports")
+def import_times(limit: int = 25):
+    """Per-module import times (IMPORT_TIME_REPORT=1) and heavy modules in memory"""
+    return import_report.report(limit)
+
+
+@app.get("/admin/profiles")
+def list_profiles():
+    """Stored request profiles, newest first"""
+    return profiler.list()
+
+
+@app.get("/admin/profiles/{name}")
+def get_profile(name: str, format: str = "raw"):
+    """Download a profile; format=text renders a pstats dump as a table"""
+    path = profiler.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text" and path.suffix == ".pstats":
+        return PlainTextResponse(pstats_text(path))
+    return FileResponse(path, filename=name)
 
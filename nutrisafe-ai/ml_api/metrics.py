@@ -0,0 +1,352 @@
+# file name: metrics.py
+"""Low-overhead in-process metrics with Prometheus text exposition
+
+Counters, gauges and fixed-bucket histograms; each observation is a lock,
+a bisect and two additions. Metrics are per process, so with pre-forked
+workers (serve.py) every worker exposes its own series.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Seconds; covers ~50µs feature building up to multi-second tail requests
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _CounterValue:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def track(self):
+        """Context manager counting in-flight work"""
+        return _InFlight(self)
+
+
+class _InFlight:
+    __slots__ = ("gauge",)
+
+    def __init__(self, gauge: _GaugeValue):
+        self.gauge = gauge
+
+    def __enter__(self):
+        self.gauge.inc()
+
+    def __exit__(self, *exc):
+        self.gauge.dec()
+
+
+class _HistogramValue:
+    __slots__ = ("_lock", "buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager observing the elapsed wall time in seconds"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: _HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class _Family:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """Child series for one label combination (cache the result on hot paths)"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Family):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def track(self):
+        return self._default.track()
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _render_child(self, values, child) -> List[str]:
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        label_str = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+        lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class FunctionMetric(_Family):
+    """Counter or gauge whose samples are read from a callback at scrape time
+
+    `fn` returns {label_values_tuple: value}; use it to export stats that a
+    component already keeps (cache hits, queue depth) without double counting.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Dict[Tuple[str, ...], float]],
+                 labelnames: Sequence[str] = (), kind: str = "gauge"):
+        self.fns = [fn]
+        self.kind = kind
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        samples = {}
+        for fn in self.fns:
+            samples.update(fn())
+        for values, value in sorted(samples.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, _Family] = {}
+
+    def _register(self, family: _Family) -> _Family:
+        with self._lock:
+            # Re-registering (module reloads, two apps in one process) reuses the series
+            existing = self._families.setdefault(family.name, family)
+            if existing is not family and isinstance(existing, FunctionMetric):
+                existing.fns.extend(family.fns)
+            return existing
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def function(self, name: str, help: str, fn, labelnames: Sequence[str] = (),
+                 kind: str = "gauge") -> FunctionMetric:
+        return self._register(FunctionMetric(name, help, fn, labelnames, kind))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _RequestScope:
+    __slots__ = ("metrics", "started")
+
+    def __init__(self, metrics: "RequestMetrics"):
+        self.metrics = metrics
+
+    def __enter__(self):
+        self.metrics.in_flight.inc()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics = self.metrics
+        metrics.latency.observe(time.perf_counter() - self.started)
+        metrics.in_flight.dec()
+        (metrics.errors if exc_type is not None else metrics.ok).inc()
+
+
+class RequestMetrics:
+    """Latency histogram, outcome counters and in-flight gauge for one endpoint"""
+
+    def __init__(self, app: str, endpoint: str, registry: Registry = REGISTRY):
+        latency = registry.histogram(
+            "nutrisafe_request_duration_seconds", "End-to-end request latency", ("app", "endpoint")
+        )
+        requests = registry.counter(
+            "nutrisafe_requests_total", "Requests handled", ("app", "endpoint", "outcome")
+        )
+        in_flight = registry.gauge(
+            "nutrisafe_requests_in_flight", "Requests currently being processed", ("app", "endpoint")
+        )
+        self.latency = latency.labels(app, endpoint)
+        self.ok = requests.labels(app, endpoint, "ok")
+        self.errors = requests.labels(app, endpoint, "error")
+        self.in_flight = in_flight.labels(app, endpoint)
+
+    def track(self) -> _RequestScope:
+        return _RequestScope(self)
+
+
+class StageTimers:
+    """Per-stage latency histograms for one app, e.g. stages.time("kneighbors")"""
+
+    def __init__(self, app: str, registry: Registry = REGISTRY):
+        self._histogram = registry.histogram(
+            "nutrisafe_stage_duration_seconds",
+            "Time spent in each analysis stage",
+            ("app", "stage")
+        )
+        self._app = app
+        self._children: Dict[str, _HistogramValue] = {}
+
+    def __getitem__(self, stage: str) -> _HistogramValue:
+        child = self._children.get(stage)
+        if child is None:
+            child = self._children[stage] = self._histogram.labels(self._app, stage)
+        return child
+
+    def time(self, stage: str) -> _Timer:
+        return _Timer(self[stage])
+
+    def clock(self) -> "_StageClock":
+        """Checkpoint timer: clock.mark("stage") records the time since the last mark"""
+        return _StageClock(self)
+
+
+class _StageClock:
+    __slots__ = ("timers", "last")
+
+    def __init__(self, timers: StageTimers):
+        self.timers = timers
+        self.last = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.timers[stage].observe(now - self.last)
+        self.last = now
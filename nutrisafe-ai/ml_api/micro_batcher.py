@@ -0,0 +1,117 @@
+# file name: micro_batcher.py
+import os
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _Slot:
+    """One submitted item; `done` is set with its result or to make it lead"""
+    __slots__ = ("item", "done", "result", "error", "lead")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.lead = False
+
+
+class MicroBatcher:
+    """Gather concurrent single-item calls into one vectorized batch call
+
+    The first caller to find the batcher idle runs `batch_fn` itself, in its
+    own thread. Callers arriving meanwhile queue up and block; when the batch
+    finishes, the oldest of them runs everything queued (up to `max_batch`
+    items) as the next batch, and so on until the queue is empty. Nothing
+    ever waits for arrivals: a lone caller pays no hand-off, and under load
+    each batch holds the calls that came in while the previous one ran.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch: int = 32, name: str = "batcher",
+                 on_batch: Optional[Callable[[int], None]] = None):
+        self.batch_fn = batch_fn
+        self.on_batch = on_batch
+        self.max_batch = max_batch
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._items: List[_Slot] = []
+        self._running = False
+        self._pid = os.getpid()
+
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = Counter()
+
+    def submit(self, item: Any) -> Any:
+        """Process one item as part of the next batch and return its result"""
+        if self.max_batch <= 1:
+            self._record(1)
+            return self.batch_fn([item])[0]
+
+        slot = _Slot(item)
+        with self._lock:
+            if self._pid != os.getpid():
+                # A batch running in the parent at fork time never finishes here
+                self._items, self._running, self._pid = [], False, os.getpid()
+            self._items.append(slot)
+            slot.lead = not self._running
+            self._running = True
+
+        while True:
+            if slot.lead:
+                # Our item is the oldest queued, so this batch includes it
+                slot.lead = False
+                self._run_batch()
+                continue
+            slot.done.wait()
+            if not slot.lead:
+                break
+            slot.done.clear()
+
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _run_batch(self):
+        with self._lock:
+            batch = self._items[:self.max_batch]
+            del self._items[:self.max_batch]
+
+        self._record(len(batch))
+        error = None
+        try:
+            results = self.batch_fn([slot.item for slot in batch])
+        except BaseException as e:
+            results, error = [None] * len(batch), e
+
+        with self._lock:
+            successor = self._items[0] if self._items else None
+            if successor is None:
+                self._running = False
+            else:
+                successor.lead = True
+
+        for slot, result in zip(batch, results):
+            slot.result, slot.error = result, error
+            slot.done.set()
+        if successor is not None:
+            successor.done.set()
+
+    def _record(self, size: int):
+        self.batches += 1
+        self.items += size
+        self.batch_sizes[size] += 1
+        if self.on_batch is not None:
+            self.on_batch(size)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "queued": len(self._items)
+        }
@@ -0,0 +1,129 @@
+# file name: ndjson_client.py
+"""Full-duplex client for /analyze/stream
+
+The endpoint only reads more input as results are consumed, so the client
+has to upload and download at the same time. Clients that send the whole
+body before reading (requests, httpx) stall once the socket buffers fill.
+This one speaks HTTP/1.1 chunked encoding over asyncio streams with a writer
+and a reader running concurrently. Usage:
+
+    python ndjson_client.py http://localhost:8000 products.ndjson > results.ndjson
+    python ndjson_client.py http://localhost:8000 products.ndjson \\
+        --profile diabetes,hypertension --profile celiac_disease
+"""
+import argparse
+import asyncio
+import sys
+from typing import Callable, Iterable, List
+from urllib.parse import urlencode, urlsplit
+
+WRITE_BATCH_BYTES = 64 * 1024
+
+
+async def _write_body(writer: asyncio.StreamWriter, lines: Iterable[bytes]):
+    batch = []
+    size = 0
+    for line in lines:
+        if not line.endswith(b"\n"):
+            line += b"\n"
+        batch.append(line)
+        size += len(line)
+        if size >= WRITE_BATCH_BYTES:
+            data = b"".join(batch)
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()  # blocks while the server isn't reading
+            batch, size = [], 0
+    if batch:
+        data = b"".join(batch)
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+async def _read_chunks(reader: asyncio.StreamReader, chunked: bool):
+    if not chunked:
+        while True:
+            data = await reader.read(WRITE_BATCH_BYTES)
+            if not data:
+                return
+            yield data
+    while True:
+        size = int((await reader.readline()).split(b";")[0].strip(), 16)
+        if size == 0:
+            await reader.readline()
+            return
+        yield await reader.readexactly(size)
+        await reader.readline()
+
+
+async def _read_response(reader: asyncio.StreamReader, on_line: Callable[[bytes], None]) -> int:
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).strip()
+        if not line:
+            break
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower()] = value.strip().lower()
+    chunked = headers.get(b"transfer-encoding") == b"chunked"
+
+    buffer = b""
+    async for data in _read_chunks(reader, chunked):
+        if status != 200:
+            buffer += data
+            continue
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line:
+                on_line(line)
+    if status != 200:
+        raise RuntimeError(f"HTTP {status}: {buffer.decode('utf-8', 'replace')[:500]}")
+    if buffer.strip():
+        on_line(buffer)
+    return status
+
+
+async def stream_ndjson(url: str, lines: Iterable[bytes], on_line: Callable[[bytes], None],
+                        profiles: List[str] = (), chunk_size: int = None):
+    """POST NDJSON lines to `url`/analyze/stream, calling on_line for each result line"""
+    parts = urlsplit(url)
+    params = [("profile", p) for p in profiles]
+    if chunk_size:
+        params.append(("chunk_size", chunk_size))
+    path = (parts.path.rstrip("/") or "") + "/analyze/stream"
+    if params:
+        path += "?" + urlencode(params)
+
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    writer.write(
+        f"POST {path} HTTP/1.1\r\n"
+        f"Host: {parts.netloc}\r\n"
+        f"Content-Type: application/x-ndjson\r\n"
+        f"Transfer-Encoding: chunked\r\n"
+        f"Connection: close\r\n\r\n".encode("latin-1")
+    )
+    try:
+        upload = asyncio.ensure_future(_write_body(writer, lines))
+        await _read_response(reader, on_line)
+        await upload
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream an NDJSON file through /analyze/stream")
+    parser.add_argument("url", help="service base URL, e.g. http://localhost:8000")
+    parser.add_argument("input", help="NDJSON file of payloads or products ('-' for stdin)")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="comma-separated conditions; repeat for several profiles")
+    parser.add_argument("--chunk-size", type=int)
+    args = parser.parse_args()
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    out = sys.stdout.buffer
+    with source:
+        asyncio.run(stream_ndjson(
+            args.url, source, lambda line: out.write(line + b"\n"), args.profile, args.chunk_size
+        ))
+    out.flush()
@@ -0,0 +1,155 @@
+# file name: ndjson_stream.py
+"""NDJSON in, NDJSON out: bulk scoring without building either side in memory
+
+The request body is read line by line only as fast as results are written
+back, so a slow reader throttles the sender through TCP flow control. Lines
+are scored in fixed-size chunks, which lets each app run one vectorized
+model pass per chunk. At most one chunk of input and one of output are held
+at a time.
+
+Each input line is either a full /analyze payload
+({"product": {...}, "userConditions": [...]} or "profileId" instead) or a
+bare product object. A bare product (or a payload without conditions) is
+scored once per condition profile passed to the endpoint. Each output
+line echoes the input line number, the optional "id" and profile index,
+and holds a "result" or an "error".
+
+Because of the backpressure, clients must read results while still
+uploading: curl and ndjson_client.py do, requests and httpx do not.
+"""
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from starlette.responses import StreamingResponse
+
+from fast_json import dumps
+
+DEFAULT_CHUNK_SIZE = 256
+MAX_LINE_BYTES = 1 << 20
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse for bodies generated while the request is still being read
+
+    The stock class listens for http.disconnect in parallel, which swallows
+    the request body messages the generator is waiting for. Here the
+    generator's own request.stream() sees the disconnect instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def parse_profiles(values: List[str]) -> List[List[str]]:
+    """["diabetes,gout", "ibs"] -> [["diabetes", "gout"], ["ibs"]]"""
+    return [[c.strip() for c in value.split(",") if c.strip()] for value in values]
+
+
+def encode(record: Dict) -> bytes:
+    return dumps(record) + b"\n"
+
+
+def expand_line(obj: Dict, profiles: List[List[str]]) -> List[Dict]:
+    """Work items (payload plus output envelope) for one parsed input line"""
+    payload = obj if "product" in obj else {"product": obj}
+    envelope = {"id": obj["id"]} if "id" in obj else {}
+
+    if "userConditions" in payload or "profileId" in payload or not profiles:
+        return [{"envelope": envelope, "payload": {**payload, "userConditions": payload.get("userConditions", [])}}]
+    return [
+        {"envelope": {**envelope, "profile": i}, "payload": {**payload, "userConditions": conditions}}
+        for i, conditions in enumerate(profiles)
+    ]
+
+
+async def ndjson_results(body: AsyncIterator[bytes],
+                         analyze_chunk: Callable[[List[Dict]], Awaitable[List[Dict]]],
+                         profiles: Optional[List[List[str]]] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         max_line_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[bytes]:
+    """Stream one encoded result line per work item
+
+    `analyze_chunk(payloads)` returns one dict per payload: the analysis, or
+    {"error": message} for an item that couldn't be scored.
+    """
+    profiles = profiles or []
+    pending: List[Dict] = []
+    buffer = b""
+    line_no = 0
+
+    async def flush() -> bytes:
+        payloads = [item["payload"] for item in pending if "payload" in item]
+        try:
+            results = iter(await analyze_chunk(payloads) if payloads else [])
+        except Exception as e:
+            results = iter([{"error": f"{type(e).__name__}: {e}"}] * len(payloads))
+
+        # Output keeps input order, unparseable lines included
+        out = []
+        for item in pending:
+            if "payload" not in item:
+                out.append(encode(item))
+                continue
+            result = next(results)
+            record = {"line": item["line"], **item["envelope"]}
+            if isinstance(result, dict) and "error" in result and len(result) == 1:
+                record["error"] = result["error"]
+            else:
+                record["result"] = result
+            out.append(encode(record))
+        pending.clear()
+        return b"".join(out)
+
+    def take_line(raw: bytes) -> List[Dict]:
+        nonlocal line_no
+        line_no += 1
+        raw = raw.strip()
+        if not raw:
+            return []
+        try:
+            obj = json.loads(raw)
+            if not isinstance(obj, dict):
+                raise ValueError("line is not a JSON object")
+        except ValueError as e:
+            return [{"line": line_no, "error": f"Invalid JSON: {e}"}]
+        return [{"line": line_no, **item} for item in expand_line(obj, profiles)]
+
+    async def chunks_from(raw: bytes):
+        for item in take_line(raw):
+            pending.append(item)
+            if len(pending) >= chunk_size:
+                yield await flush()
+
+    async def complete_lines():
+        nonlocal buffer
+        if b"\n" not in buffer:
+            return
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            async for out in chunks_from(raw):
+                yield out
+
+    async for data in body:
+        buffer += data
+        async for out in complete_lines():
+            yield out
+        if len(buffer) > max_line_bytes:
+            line_no += 1
+            pending.append({"line": line_no, "error": f"Line exceeds {max_line_bytes} bytes"})
+            # Skip to the end of the oversized line
+            buffer = b""
+            async for data in body:
+                newline = data.find(b"\n")
+                if newline >= 0:
+                    buffer = data[newline + 1:]
+                    break
+            async for out in complete_lines():
+                yield out
+
+    if buffer.strip():
+        async for out in chunks_from(buffer):
+            yield out
+    if pending:
+        yield await flush()
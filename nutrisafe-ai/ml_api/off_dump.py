@@ -0,0 +1,100 @@
+# file name: off_dump.py
+"""Chunked readers for Open Food Facts exports
+
+Handles the official CSV export (tab-separated, unquoted) or a plain CSV,
+and the JSONL dump, each optionally gzipped. Every product comes back as
+{code, product_name, ingredients_text, categories, brands, categories_tags,
+nutriments} with only the nutriments the models read. pandas is only
+imported for CSV input.
+"""
+import csv
+import gzip
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+TEXT_FIELDS = ["code", "product_name", "ingredients_text", "categories", "brands"]
+NUTRIENT_FIELDS = [
+    "sugars_100g", "carbohydrates_100g", "salt_100g", "fat_100g", "saturated-fat_100g",
+    "fiber_100g", "proteins_100g", "energy-kcal_100g"
+]
+
+
+def _open(path: Path):
+    return gzip.open(path, "rt") if path.suffix == ".gz" else open(path)
+
+
+def csv_format(path) -> Dict:
+    """csv.reader arguments for a CSV export
+
+    The official export is tab-separated and unquoted despite the .csv name.
+    """
+    with _open(Path(path)) as f:
+        tabbed = "\t" in f.readline()
+    return {"delimiter": "\t", "quoting": csv.QUOTE_NONE} if tabbed else {"delimiter": ","}
+
+
+def read_chunks(path: Path, chunk_rows: int) -> Iterator[List[Dict]]:
+    path = Path(path)
+    name = path.name.lower()
+    if name.endswith((".jsonl", ".jsonl.gz", ".ndjson", ".ndjson.gz")):
+        yield from _read_jsonl_chunks(path, chunk_rows)
+    else:
+        yield from _read_csv_chunks(path, chunk_rows)
+
+
+def with_aliases(nutriments: Dict) -> Dict:
+    """OFF spells two keys with dashes; ml_inference reads underscores"""
+    nutriments = dict(nutriments)
+    for key in ("saturated-fat_100g", "energy-kcal_100g"):
+        if key in nutriments:
+            nutriments[key.replace("-", "_")] = nutriments[key]
+    return nutriments
+
+
+def _read_csv_chunks(path: Path, chunk_rows: int) -> Iterator[List[Dict]]:
+    import numpy as np
+    import pandas as pd
+
+    wanted = set(TEXT_FIELDS + NUTRIENT_FIELDS + ["categories_tags"])
+    reader = pd.read_csv(
+        path, **csv_format(path),
+        usecols=lambda column: column in wanted, dtype=str,
+        chunksize=chunk_rows, on_bad_lines="skip"
+    )
+    for frame in reader:
+        nutrients = [c for c in NUTRIENT_FIELDS if c in frame.columns]
+        values = frame[nutrients].apply(pd.to_numeric, errors="coerce").to_numpy()
+        records = frame.reindex(columns=TEXT_FIELDS + ["categories_tags"]).fillna("").to_dict("records")
+        for record, row in zip(records, values):
+            record["categories_tags"] = [t for t in record["categories_tags"].split(",") if t]
+            record["nutriments"] = {
+                key: float(value) for key, value in zip(nutrients, row) if np.isfinite(value)
+            }
+        yield records
+
+
+def _read_jsonl_chunks(path: Path, chunk_rows: int) -> Iterator[List[Dict]]:
+    chunk = []
+    with _open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            record = {field: obj.get(field) or "" for field in TEXT_FIELDS}
+            if isinstance(record["categories"], list):
+                record["categories"] = ",".join(record["categories"])
+            record["categories_tags"] = list(obj.get("categories_tags") or [])
+            record["nutriments"] = {
+                key: float(value) for key, value in (obj.get("nutriments") or {}).items()
+                if key in NUTRIENT_FIELDS and isinstance(value, (int, float))
+            }
+            chunk.append(record)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
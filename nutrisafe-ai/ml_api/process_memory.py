@@ -0,0 +1,49 @@
+# file name: process_memory.py
+import os
+import resource
+from typing import Dict
+
+
+def memory_usage(pid="self") -> Dict:
+    """Resident and proportional memory of a process, in MB
+
+    `pss_mb` splits pages shared with other workers evenly between them, so
+    summing it across pre-forked workers gives the real footprint.
+    """
+    usage = {"pid": os.getpid() if pid == "self" else pid}
+    fields = {
+        "Rss": "rss_mb",
+        "Pss": "pss_mb",
+        "Shared_Clean": "shared_clean_mb",
+        "Shared_Dirty": "shared_dirty_mb",
+        "Private_Clean": "private_clean_mb",
+        "Private_Dirty": "private_dirty_mb"
+    }
+
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    usage[fields[key]] = int(rest.split()[0]) / 1024
+    except OSError:
+        # No /proc (macOS, Windows): peak RSS of this process is the best we get
+        if pid == "self":
+            usage["rss_mb"] = peak_rss_mb()
+
+    return usage
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process; cheap enough to poll"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024 / 1024
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Highest resident set size this process has reached"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 if os.uname().sysname != "Darwin" else maxrss / 1024 / 1024
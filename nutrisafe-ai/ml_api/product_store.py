@@ -0,0 +1,165 @@
+# file name: product_store.py
+"""Embedded barcode -> product store (SQLite), bulk-loaded from an OFF dump
+
+    python product_store.py load en.openfoodfacts.org.products.csv.gz
+    python product_store.py get 3017620422003
+
+Products live in one WITHOUT ROWID table keyed by barcode, so a lookup is a
+single B-tree descent in a read-only connection. There is no network call
+and nothing is rewritten on a miss. A load builds a new file next to the
+old one and swaps it in atomically; running workers keep reading the old
+file until their next lookup sees the new one. Each thread of each (forked)
+worker opens its own connection.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+STORE_FILE = "products.db"
+
+_SCHEMA = """
+CREATE TABLE products (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    brand TEXT NOT NULL,
+    ingredients TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    category_tags TEXT NOT NULL,
+    nutriments TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def barcode_candidates(barcode: str) -> List[str]:
+    """The scanned code plus its EAN-13 / leading-zero-stripped spellings"""
+    code = barcode.strip()
+    candidates = [code]
+    if code.isdigit():
+        for variant in (code.zfill(13), code.lstrip("0")):
+            if variant and variant not in candidates:
+                candidates.append(variant)
+    return candidates
+
+
+class ProductStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def available(self) -> bool:
+        return self.path.exists()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        inode = self.path.stat().st_ino
+        # Connections must not cross a fork; a reload swaps in a new file
+        if conn is None or self._local.pid != os.getpid() or self._local.inode != inode:
+            if conn is not None and self._local.pid == os.getpid():
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.inode = inode
+        return conn
+
+    def get(self, barcode: str) -> Optional[Dict]:
+        """Product in the shape the Node server sends to /analyze, or None"""
+        candidates = barcode_candidates(barcode)
+        placeholders = ",".join("?" * len(candidates))
+        # When several spellings are stored, the exact scan wins, then EAN-13
+        ranks = " ".join(f"WHEN ? THEN {i}" for i in range(len(candidates)))
+        row = self._connection().execute(
+            f"SELECT code, name, brand, ingredients, categories, category_tags, nutriments "
+            f"FROM products WHERE code IN ({placeholders}) ORDER BY CASE code {ranks} END LIMIT 1",
+            candidates + candidates
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        code, name, brand, ingredients, categories, category_tags, nutriments = row
+        return {
+            "code": code,
+            "name": name,
+            "product_name": name,
+            "brand": brand,
+            "ingredients": ingredients,
+            "categories": categories,
+            "category_tags": json.loads(category_tags),
+            "nutriments": json.loads(nutriments)
+        }
+
+    def stats(self) -> Dict:
+        stats = {"path": str(self.path), "available": self.available(), "hits": self.hits, "misses": self.misses}
+        if self.available():
+            stats["products"] = self._connection().execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        return stats
+
+
+def load_dump(dump: Path, db_path: Path, chunk_rows: int = 20000) -> int:
+    """Build a fresh store from an OFF export and atomically replace db_path"""
+    from off_dump import read_chunks, with_aliases
+
+    tmp = db_path.with_name(db_path.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp)
+    # Throwaway file until the rename, so skip journaling and fsyncs
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(_SCHEMA)
+
+    started = time.perf_counter()
+    read = 0
+    for chunk in read_chunks(dump, chunk_rows):
+        rows = [
+            (
+                str(record["code"]).strip(),
+                str(record["product_name"]),
+                str(record["brands"]),
+                str(record["ingredients_text"]),
+                str(record["categories"]),
+                json.dumps(record["categories_tags"]),
+                json.dumps(with_aliases(record["nutriments"]), separators=(",", ":"))
+            )
+            for record in chunk if str(record["code"]).strip()
+        ]
+        # Later duplicates of a barcode win, as in the dump's update order
+        conn.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        read += len(rows)
+        print(f"  {read} rows, {read / (time.perf_counter() - started):,.0f}/s")
+    conn.commit()
+    # Fewer than the rows read when the dump repeats barcodes
+    count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+
+    os.replace(tmp, db_path)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Barcode product store")
+    parser.add_argument("--db", type=Path, default=Path(__file__).parent / STORE_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="bulk-load an OFF CSV/JSONL export")
+    load.add_argument("dump", type=Path)
+    load.add_argument("--chunk-rows", type=int, default=20000)
+    get = commands.add_parser("get", help="look up one barcode")
+    get.add_argument("barcode")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        started = time.perf_counter()
+        count = load_dump(args.dump, args.db, args.chunk_rows)
+        print(f"✓ Loaded {count} products into {args.db} in {time.perf_counter() - started:.1f}s "
+              f"({args.db.stat().st_size / 1e6:.1f}MB)")
+    else:
+        product = ProductStore(args.db).get(args.barcode)
+        print(json.dumps(product, indent=2) if product else f"{args.barcode} not found")
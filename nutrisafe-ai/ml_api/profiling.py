@@ -0,0 +1,188 @@
+# file name: profiling.py
+"""On-demand profiling of individual requests
+
+A request is profiled when it carries `X-Profile: 1` (or `?profile=1`), or
+when it is picked by 1-in-N sampling. Output goes to a bounded on-disk ring
+of files that the admin endpoints list and serve:
+
+    stacks    collapsed stacks ("a;b;c 12"), feed to flamegraph.pl or speedscope
+    cprofile  pstats dump, open with snakeviz or pstats.Stats
+
+Both profilers see only the request's own thread. Batched model work runs
+in the thread of the request that leads the batch (micro_batcher.py), so
+a profiled request shows it only when it led its batch, shared with the
+other requests in it.
+
+Profiling is off unless REQUEST_PROFILING=1 or PROFILE_SAMPLE_EVERY is set;
+when off, the per-request cost is one attribute check.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MODES = ("stacks", "cprofile")
+EXTENSIONS = {"stacks": ".collapsed", "cprofile": ".pstats"}
+_NAME = re.compile(r"^[\w.-]+\.(collapsed|pstats)$")
+_TRUTHY = {"1", "true", "yes", "on"}
+
+
+class _StackSampler:
+    """Samples the Python stacks of a few threads every `interval` seconds"""
+
+    def __init__(self, threads: Dict[int, str], interval: float):
+        self.threads = threads
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, thread_name in self.threads.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(thread_name)
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """Decides which requests to profile, runs them under a profiler, keeps the last `keep` outputs"""
+
+    def __init__(self, app: str, directory, enabled: bool = False, sample_every: int = 0,
+                 keep: int = 50, default_mode: str = "stacks", interval: float = 0.001):
+        self.app = app
+        self.directory = Path(directory)
+        self.enabled = enabled or sample_every > 0
+        self.sample_every = sample_every
+        self.keep = keep
+        self.default_mode = default_mode if default_mode in MODES else "stacks"
+        self.interval = interval
+        self._seen = 0
+
+    def requested(self, header: Optional[str], query: Optional[str]) -> Optional[str]:
+        """Profiling mode for this request, or None to run it normally"""
+        if not self.enabled:
+            return None
+
+        flag = (header or query or "").strip().lower()
+        if flag in MODES:
+            return flag
+        if flag in _TRUTHY:
+            return self.default_mode
+
+        if self.sample_every > 0:
+            self._seen += 1
+            if self._seen % self.sample_every == 0:
+                return self.default_mode
+        return None
+
+    def run(self, mode: str, fn: Callable, *args) -> Tuple[Any, str]:
+        """Call fn(*args) under the profiler; returns (result, profile name)"""
+        started = time.perf_counter()
+        if mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                result = profile.runcall(fn, *args)
+            finally:
+                name = self._name(mode, started)
+                self.directory.mkdir(parents=True, exist_ok=True)
+                profile.dump_stats(str(self.directory / name))
+        else:
+            sampler = _StackSampler({threading.get_ident(): "request"}, self.interval)
+            try:
+                with sampler:
+                    result = fn(*args)
+            finally:
+                name = self._name(mode, started)
+                self.directory.mkdir(parents=True, exist_ok=True)
+                (self.directory / name).write_text(sampler.collapsed(), encoding="utf-8")
+
+        self._prune()
+        return result, name
+
+    def _name(self, mode: str, started: float) -> str:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        return f"{stamp}-{os.getpid()}-{time.time_ns() % 1000000:06d}-{self.app}-{elapsed_ms:.1f}ms{EXTENSIONS[mode]}"
+
+    def _files(self) -> List[Path]:
+        if not self.directory.is_dir():
+            return []
+        files = [p for p in self.directory.iterdir() if _NAME.match(p.name)]
+        return sorted(files, key=lambda p: p.stat().st_mtime, reverse=True)
+
+    def _prune(self):
+        for path in self._files()[self.keep:]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass  # another worker pruned it first
+
+    def list(self) -> Dict:
+        profiles = []
+        for path in self._files():
+            stat = path.stat()
+            profiles.append({
+                "name": path.name,
+                "mode": "cprofile" if path.suffix == ".pstats" else "stacks",
+                "bytes": stat.st_size,
+                "created": stat.st_mtime
+            })
+        return {
+            "enabled": self.enabled,
+            "sample_every": self.sample_every,
+            "keep": self.keep,
+            "profiles": profiles
+        }
+
+    def path(self, name: str) -> Optional[Path]:
+        """Path of a stored profile, or None for unknown / unsafe names"""
+        if not _NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+
+def pstats_text(path: Path, limit: int = 40) -> str:
+    """Top functions by cumulative time from a pstats dump"""
+    out = io.StringIO()
+    stats = pstats.Stats(str(path), stream=out)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def profiler_from_env(app: str, default_dir) -> RequestProfiler:
+    return RequestProfiler(
+        app,
+        os.environ.get("PROFILE_DIR", default_dir),
+        enabled=os.environ.get("REQUEST_PROFILING", "").lower() in _TRUTHY,
+        sample_every=int(os.environ.get("PROFILE_SAMPLE_EVERY", 0)),
+        keep=int(os.environ.get("PROFILE_KEEP", 50)),
+        default_mode=os.environ.get("PROFILE_MODE", "stacks"),
+        interval=float(os.environ.get("PROFILE_INTERVAL_MS", 1)) / 1000
+    )
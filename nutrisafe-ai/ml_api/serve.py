@@ -0,0 +1,127 @@
+# file name: serve.py
+"""Pre-fork server for the ML API
+
+Models and catalog arrays are loaded once in the parent process, then N
+uvicorn workers are forked and share those pages copy-on-write instead of
+each holding its own copy. Usage:
+
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from process_memory import memory_usage
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, log_level: str):
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+        signal.signal(sig, signal.SIG_DFL)
+
+    config = uvicorn.Config(app, log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def report_memory(workers):
+    """Print per-worker RSS and PSS (PSS sums to the true total)"""
+    rows = [memory_usage(pid) for pid in sorted(workers)]
+    total_pss = sum(row.get("pss_mb", 0.0) for row in rows)
+    parent = memory_usage()
+    print(f"parent pid={parent['pid']} rss={parent.get('rss_mb', 0):.1f}MB")
+    for row in rows:
+        print(f"worker pid={row['pid']} rss={row.get('rss_mb', 0):.1f}MB "
+              f"pss={row.get('pss_mb', 0):.1f}MB "
+              f"private={row.get('private_dirty_mb', 0):.1f}MB")
+    print(f"workers total pss={total_pss:.1f}MB")
+
+
+def serve(host: str, port: int, workers: int, log_level: str = "info"):
+    sock = bind_socket(host, port)
+
+    # Load models, catalog arrays and lookup tables once, before forking
+    import main as service
+
+    # Move everything allocated so far out of the GC's reach: collections would
+    # otherwise write to every object header and un-share the pages
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    shutting_down = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(service.app, sock, log_level)
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: report_memory(children))
+
+    for _ in range(workers):
+        spawn()
+    print(f"✓ Serving on {host}:{port} with {workers} pre-forked workers "
+          f"(kill -USR1 {os.getpid()} for a memory report)")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except InterruptedError:
+            continue
+        except ChildProcessError:
+            break
+
+        started = children.pop(pid, None)
+        if started is None or shutting_down:
+            continue
+
+        print(f"Worker {pid} exited with status {status}, restarting")
+        if time.monotonic() - started < 1.0:
+            time.sleep(1.0)  # don't spin on a worker that dies at startup
+        spawn()
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-fork NutriSafe ML API server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("Pre-fork serving needs os.fork(); use uvicorn main:app on this platform")
+
+    serve(args.host, args.port, args.workers, args.log_level)
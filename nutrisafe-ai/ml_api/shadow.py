@@ -0,0 +1,173 @@
+# file name: shadow.py
+"""Shadow scoring of a candidate model bundle on sampled live traffic
+
+    NUTRISAFE_TRAIN_OUTPUT_DIR=models_candidate python train_model.py
+    NUTRISAFE_SHADOW_MODEL_DIR=models_candidate SHADOW_SAMPLE_RATE=0.1 uvicorn ...
+
+For a sampled fraction of /analyze requests the handler hands the request's
+feature rows and its score aggregation to ShadowEvaluator.offer(), which
+only enqueues them. A daemon thread scores each item with both the
+production and the candidate scaler + risk model. It times both on the same
+rows and appends score delta, risk-level flip and latencies to a bounded
+log. The response never waits on the shadow. When the queue is full, items
+are dropped and counted rather than held.
+"""
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+SAMPLE_RATE = float(os.environ.get("SHADOW_SAMPLE_RATE", 0.05))
+LOG_SIZE = int(os.environ.get("SHADOW_LOG_SIZE", 1000))
+QUEUE_SIZE = int(os.environ.get("SHADOW_QUEUE_SIZE", 64))
+
+
+class ShadowEvaluator:
+    def __init__(self, model_dir: Path, production: Dict, candidate: Dict,
+                 level: Callable[[float], str], sample_rate: float = SAMPLE_RATE,
+                 log_size: int = LOG_SIZE, queue_size: int = QUEUE_SIZE):
+        self.model_dir = Path(model_dir)
+        self.production = production
+        self.candidate = candidate
+        self.level = level
+        self.sample_rate = sample_rate
+        self.log = deque(maxlen=log_size)
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self.reset()
+        self._start()
+
+    def _start(self):
+        # Threads don't survive a fork: process-pool workers start their own
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        threading.Thread(target=self._run, args=(self._queue,), name="shadow-scorer", daemon=True).start()
+
+    def reset(self):
+        with self._lock:
+            self.log.clear()
+            self.scored = 0
+            self.dropped = 0
+            self.errors = 0
+            self.last_error = None
+
+    def sampled(self) -> bool:
+        """Whether to shadow this request (checked before any extra work)"""
+        return random.random() < self.sample_rate
+
+    def offer(self, X: np.ndarray, aggregate: Callable[[np.ndarray], float]):
+        """Queue feature rows and their score aggregation; never blocks"""
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait((np.array(X, dtype=float), aggregate))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _score(self, models: Dict, X: np.ndarray):
+        started = time.perf_counter()
+        predictions = models["risk_model"].predict(models["scaler"].transform(X))
+        return predictions, (time.perf_counter() - started) * 1000
+
+    def _run(self, work: queue.Queue):
+        while True:
+            X, aggregate = work.get()
+            try:
+                production, production_ms = self._score(self.production, X)
+                candidate, candidate_ms = self._score(self.candidate, X)
+                production_score = float(aggregate(production))
+                candidate_score = float(aggregate(candidate))
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    self.last_error = f"{type(e).__name__}: {e}"
+                continue
+            entry = {
+                "time": time.time(),
+                "rows": len(X),
+                "production_score": production_score,
+                "shadow_score": candidate_score,
+                "delta": candidate_score - production_score,
+                "production_level": self.level(production_score),
+                "shadow_level": self.level(candidate_score),
+                "production_ms": production_ms,
+                "shadow_ms": candidate_ms
+            }
+            with self._lock:
+                self.log.append(entry)
+                self.scored += 1
+
+    def report(self, recent: int = 20) -> Dict:
+        """Lifetime counters plus accuracy and cost over the logged window"""
+        with self._lock:
+            log = list(self.log)
+            report = {
+                "status": "enabled",
+                "model_dir": str(self.model_dir),
+                "sample_rate": self.sample_rate,
+                "scored": self.scored,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "queue_depth": self._queue.qsize(),
+                "window": len(log)
+            }
+        if not log:
+            return report
+
+        deltas = np.array([e["delta"] for e in log])
+        flips = Counter(
+            f"{e['production_level']}->{e['shadow_level']}"
+            for e in log if e["production_level"] != e["shadow_level"]
+        )
+
+        def latency(key):
+            values = np.array([e[key] for e in log])
+            return {"mean": float(values.mean()), "p50": float(np.percentile(values, 50)),
+                    "p99": float(np.percentile(values, 99))}
+
+        production_ms = latency("production_ms")
+        shadow_ms = latency("shadow_ms")
+        report.update({
+            "delta": {
+                "mean": float(deltas.mean()),
+                "mean_abs": float(np.abs(deltas).mean()),
+                "p99_abs": float(np.percentile(np.abs(deltas), 99)),
+                "max_abs": float(np.abs(deltas).max())
+            },
+            "level_flips": sum(flips.values()),
+            "level_flip_rate": sum(flips.values()) / len(log),
+            "flips": dict(flips),
+            "latency_ms": {"production": production_ms, "shadow": shadow_ms},
+            "cost_ratio": shadow_ms["mean"] / production_ms["mean"] if production_ms["mean"] else None,
+            "recent": log[-recent:] if recent > 0 else []
+        })
+        return report
+
+
+def shadow_from_env(production: Dict, level: Callable[[float], str]) -> Optional[ShadowEvaluator]:
+    """ShadowEvaluator for NUTRISAFE_SHADOW_MODEL_DIR, or None when unset or unusable"""
+    model_dir = os.environ.get("NUTRISAFE_SHADOW_MODEL_DIR")
+    if not model_dir:
+        return None
+    from fast_models import load_serving_models
+
+    try:
+        candidate = load_serving_models(Path(model_dir))
+    except (OSError, ValueError) as e:
+        print(f"⚠ Shadow model bundle {model_dir} not loaded ({e}); shadow mode off")
+        return None
+    expected = production["scaler"].n_features_in_
+    if candidate["scaler"].n_features_in_ != expected:
+        print(f"⚠ Shadow scaler takes {candidate['scaler'].n_features_in_} features, "
+              f"production takes {expected}; shadow mode off")
+        return None
+    print(f"✓ Shadow-scoring {SAMPLE_RATE:.0%} of traffic with {model_dir}")
+    return ShadowEvaluator(model_dir, production, candidate, level)
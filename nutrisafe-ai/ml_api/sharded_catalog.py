@@ -0,0 +1,202 @@
+# file name: sharded_catalog.py
+"""Recommendation catalog split across local shard processes
+
+    python sharded_catalog.py build --shards 4     # or NUTRISAFE_CATALOG_SHARDS=4 at training
+
+The build splits product_vectors.npy into equally sized contiguous shards
+(catalog_shards/shard_<i>.npy plus a manifest with each shard's global
+offset), rebalancing whatever layout was there before. At serving time
+ShardedNeighbors starts one process per shard holding only that slice and
+answers kneighbors() like the single in-process index: every query batch is
+sent to all shards at once, each returns its local top-k, and the merge keeps
+the k globally nearest. The result is exact, and the category/energy/risk
+filters downstream see the same candidates as before.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SHARD_DIR = "catalog_shards"
+MANIFEST_FILE = "manifest.json"
+
+
+def build_shards(model_dir: Path, vectors: np.ndarray, n_shards: int) -> Dict:
+    """Write `vectors` as n_shards balanced shards, replacing any previous layout"""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    n_shards = max(1, min(n_shards, len(vectors)))
+    shard_dir = Path(model_dir) / SHARD_DIR
+    tmp = shard_dir.with_name(SHARD_DIR + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    offsets = []
+    offset = 0
+    for i, part in enumerate(np.array_split(vectors, n_shards)):
+        np.save(tmp / f"shard_{i}.npy", part)
+        offsets.append(offset)
+        offset += len(part)
+    manifest = {
+        "n_shards": n_shards,
+        "n_products": len(vectors),
+        "dim": vectors.shape[1],
+        "offsets": offsets,
+        "sizes": [int(n) for n in np.diff(offsets + [offset])]
+    }
+    with open(tmp / MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.replace(tmp, shard_dir)
+    return manifest
+
+
+def _serve_shard(path: str, offset: int, conn):
+    """Shard process: answer (queries, k) with (distances, global indices)"""
+    from fast_models import ArrayNeighbors
+
+    # Ctrl-C goes to the whole process group; the parent shuts shards down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    index = ArrayNeighbors(np.load(path), n_neighbors=1)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        queries, k = message
+        distances, indices = index.kneighbors(queries, n_neighbors=k)
+        conn.send((distances, indices + offset))
+
+
+class ShardedNeighbors:
+    """kneighbors() over the shard processes, with ArrayNeighbors' interface"""
+
+    def __init__(self, shard_dir: Path, manifest: Dict, n_neighbors: int):
+        self.shard_dir = Path(shard_dir)
+        self.manifest = manifest
+        self.n_neighbors = n_neighbors
+        self.queries = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._shards = []
+
+    @classmethod
+    def load(cls, model_dir: Path, n_shards: int, n_neighbors: int) -> Optional["ShardedNeighbors"]:
+        """None (single in-process index) when the shard layout is missing or stale"""
+        shard_dir = Path(model_dir) / SHARD_DIR
+        if not (shard_dir / MANIFEST_FILE).exists():
+            print(f"⚠ No {SHARD_DIR} in {model_dir} (sharded_catalog.py build --shards {n_shards}); "
+                  f"using a single catalog index")
+            return None
+        with open(shard_dir / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+        n_products = len(np.load(Path(model_dir) / "product_vectors.npy", mmap_mode="r"))
+        if manifest["n_products"] != n_products:
+            print(f"⚠ {SHARD_DIR} holds {manifest['n_products']} products, catalog has {n_products}; "
+                  f"using a single catalog index")
+            return None
+        if manifest["n_shards"] != n_shards:
+            print(f"⚠ {SHARD_DIR} was built with {manifest['n_shards']} shards, not {n_shards}; "
+                  f"serving the built layout (rebuild to rebalance)")
+        return cls(shard_dir, manifest, n_neighbors)
+
+    def _start(self):
+        """Shard processes for this (possibly forked) worker"""
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        self._shards = []
+        for i, offset in enumerate(self.manifest["offsets"]):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_serve_shard, args=(str(self.shard_dir / f"shard_{i}.npy"), offset, child),
+                name=f"catalog-shard-{i}", daemon=True
+            )
+            process.start()
+            child.close()
+            self._shards.append((process, parent))
+        self._pid = os.getpid()
+
+    def kneighbors(self, X, n_neighbors: int = None, return_distance: bool = True):
+        X = np.asarray(X, dtype=np.float64)
+        k = min(n_neighbors or self.n_neighbors, self.manifest["n_products"])
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            try:
+                parts = self._scatter_gather(X, k)
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                # A shard died; restart the set once and retry
+                self.close()
+                self._start()
+                parts = self._scatter_gather(X, k)
+            self.queries += len(X)
+
+        distances = np.hstack([d for d, _ in parts])
+        indices = np.hstack([i for _, i in parts])
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        return (distances, indices) if return_distance else indices
+
+    def _scatter_gather(self, X: np.ndarray, k: int) -> List:
+        # Every shard works on the batch in parallel before any answer is read
+        for (_, conn), size in zip(self._shards, self.manifest["sizes"]):
+            conn.send((X, min(k, size)))
+        return [conn.recv() for _, conn in self._shards]
+
+    def stats(self) -> Dict:
+        return {
+            "shards": self.manifest["n_shards"],
+            "sizes": self.manifest["sizes"],
+            "alive": sum(p.is_alive() for p, _ in self._shards) if self._pid == os.getpid() else 0,
+            "queries": self.queries
+        }
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        for process, conn in self._shards:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self._shards = []
+        self._pid = None
+
+
+def catalog_from_env(model_dir: Path, recommender):
+    """ShardedNeighbors with NUTRISAFE_CATALOG_SHARDS > 1, else `recommender`"""
+    n_shards = int(os.environ.get("NUTRISAFE_CATALOG_SHARDS", 0))
+    if n_shards <= 1:
+        return recommender
+    sharded = ShardedNeighbors.load(model_dir, n_shards, recommender.n_neighbors)
+    if sharded is None:
+        return recommender
+    print(f"✓ Catalog served by {sharded.manifest['n_shards']} shard processes")
+    return sharded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded recommendation catalog")
+    parser.add_argument("--model-dir", type=Path, default=Path(__file__).parent / "models")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="split product_vectors.npy into balanced shards")
+    build.add_argument("--shards", type=int, default=int(os.environ.get("NUTRISAFE_CATALOG_SHARDS", 4)))
+    args = parser.parse_args()
+
+    manifest = build_shards(args.model_dir, np.load(args.model_dir / "product_vectors.npy"), args.shards)
+    print(f"✓ {manifest['n_products']} products in {manifest['n_shards']} shards "
+          f"of {min(manifest['sizes'])}-{max(manifest['sizes'])} under {args.model_dir / SHARD_DIR}")
@@ -0,0 +1,72 @@
+# file name: singleflight.py
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from deadline import Deadline, SharedDeadline, run_until
+
+
+def payload_key(payload: Any) -> str:
+    """Canonical hash of a request payload (key order and spacing don't matter)"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls so a burst of duplicates costs one computation
+
+    Concurrent callers with the same key wait on the first caller's
+    computation and all receive its result (or its exception). Nothing is
+    cached once the computation finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Tuple[asyncio.Future, SharedDeadline]] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do_until(self, key: str, deadline: Deadline, request, fn: Callable[..., Awaitable], *args) -> Any:
+        """Await fn(*args, shared_deadline), shared with identical concurrent calls
+
+        The shared work runs as its own task under a SharedDeadline joined by
+        every caller, so it lasts as long as the most patient one still
+        waiting. Each caller waits via run_until within its own deadline;
+        one leaving (timeout or disconnect) doesn't cancel it for the others.
+        """
+        with self._lock:
+            entry = self._tasks.get(key)
+            if entry is not None and not entry[1].cancelled:
+                task, shared = entry
+                self.coalesced += 1
+            else:
+                # Work everyone has left may still be winding down; start afresh
+                shared = SharedDeadline()
+                task = asyncio.ensure_future(fn(*args, shared))
+                self._tasks[key] = (task, shared)
+                task.add_done_callback(lambda done: self._forget(key, done))
+                self.executions += 1
+            shared.join(deadline)
+
+        try:
+            return await run_until(deadline, asyncio.shield(task), request)
+        finally:
+            shared.leave()
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if not task.cancelled():
+            # Retrieved here in case every caller left before it finished
+            task.exception()
+        with self._lock:
+            if key in self._tasks and self._tasks[key][0] is task:
+                del self._tasks[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._tasks)
+            }
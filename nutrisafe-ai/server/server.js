@@ -3,7 +3,12 @@ const cors = require('cors');
 const fs = require('fs');
 const path = require('path');
 const axios = require('axios');
-const ML_SERVICE_URL = "https://safebite-ml-service.onrender.com";
+const ML_SERVICE_URL = process.env.ML_SERVICE_URL || "https://safebite-ml-service.onrender.com";
+// Point at a local stand-in (benchmarks/load_test.py off-server) to run offline
+const OFF_BASE_URL = process.env.OFF_BASE_URL || "https://world.openfoodfacts.org";
+const ML_TIMEOUT_MS = 8000;
+// Budget the ML service plans its optional stages around; it cancels work once we hang up
+const ML_DEADLINE_HEADERS = { 'X-Deadline-Ms': String(ML_TIMEOUT_MS - 500) };
 
 const app = express();
 app.use(cors());
@@ -875,6 +880,42 @@ function saveCache() {
     }
 }
 
+// --- LOCAL PRODUCT STORE (ML service) ---
+// Barcodes loaded into the ML service's product store are answered from an
+// indexed local read: no Open Food Facts call and no cache file rewrite
+function productFromStore(stored) {
+    return {
+        name: stored.name || 'Unknown Product',
+        brand: stored.brand || 'Unknown',
+        ingredients: stored.ingredients || 'Ingredients not specified',
+        image: `https://source.unsplash.com/400x400/?${encodeURIComponent(stored.name || 'food')}`,
+        categories: stored.categories || 'General Food',
+        nutriments: stored.nutriments || {},
+        category_tags: stored.category_tags || [],
+        allergens: '',
+        nutrition_grades: 'unknown'
+    };
+}
+
+async function analyzeStoredBarcode(barcode, userConditions) {
+    try {
+        const response = await axios.post(`${ML_SERVICE_URL}/analyze/barcode`, {
+            barcode,
+            userConditions: userConditions ? userConditions.map(c => c.name || c) : []
+        }, { timeout: ML_TIMEOUT_MS, headers: ML_DEADLINE_HEADERS });
+        console.log(`🗄️ Analyzed from product store: ${barcode}`);
+        return response.data;
+    } catch (error) {
+        // 404: not in the store, 503: no store loaded -> regular lookup.
+        // Anything else failed the analysis itself; repeating it via
+        // /analyze would only double the wait, so the caller handles it
+        if ([404, 503].includes(error.response?.status)) {
+            return null;
+        }
+        throw error;
+    }
+}
+
 // --- FETCH PRODUCT ---
 async function fetchProduct(productName, barcode = null) {
     const cacheKey = barcode || productName.toLowerCase();
@@ -884,18 +925,30 @@ async function fetchProduct(productName, barcode = null) {
         return productCache[cacheKey];
     }
     
+    if (barcode) {
+        try {
+            const stored = await axios.get(`${ML_SERVICE_URL}/products/${encodeURIComponent(barcode)}`, { timeout: 3000 });
+            console.log(`🗄️ Product store hit: ${barcode}`);
+            return productFromStore(stored.data);
+        } catch (error) {
+            if (![404, 503].includes(error.response?.status)) {
+                console.warn('Product store lookup failed:', error.message);
+            }
+        }
+    }
+    
     try {
         let url;
         let apiProduct;
         
         if (barcode) {
             console.log(`🔍 Fetching barcode: ${barcode}`);
-            url = `https://world.openfoodfacts.org/api/v0/product/${barcode}.json`;
+            url = `${OFF_BASE_URL}/api/v0/product/${barcode}.json`;
             const response = await axios.get(url, { timeout: 8000 });
             apiProduct = response.data.product;
         } else {
             console.log(`🔍 Searching product: ${productName}`);
-            url = `https://world.openfoodfacts.org/cgi/search.pl?search_terms=${encodeURIComponent(productName)}&json=1&page_size=1`;
+            url = `${OFF_BASE_URL}/cgi/search.pl?search_terms=${encodeURIComponent(productName)}&json=1&page_size=1`;
             const response = await axios.get(url, { timeout: 8000 });
             apiProduct = response.data.products?.[0];
         }
@@ -1067,7 +1120,7 @@ app.get('/api/search-products', async (req, res) => {
         
         // Fetch from API
         const response = await axios.get(
-            `https://world.openfoodfacts.org/cgi/search.pl?search_terms=${encodeURIComponent(query)}&json=1&page_size=8`
+            `${OFF_BASE_URL}/cgi/search.pl?search_terms=${encodeURIComponent(query)}&json=1&page_size=8`
         );
         
         const results = [...cachedResults];
@@ -1388,8 +1441,19 @@ app.post('/api/analyze', async (req, res) => {
         console.log(`🎯 Analyzing: ${productName || barcode}`);
         console.log(`👤 User conditions: ${JSON.stringify(userConditions, null, 2)}`);
         
-        // Get product
-        const product = await fetchProduct(productName, barcode);
+        // Get product: stored barcodes come back already analyzed in one call
+        let storeResult = null;
+        let storeError = null;
+        if (barcode) {
+            try {
+                storeResult = await analyzeStoredBarcode(barcode, userConditions);
+            } catch (error) {
+                storeError = error;
+            }
+        }
+        const product = storeResult
+            ? productFromStore(storeResult.product)
+            : await fetchProduct(productName, barcode);
         
         // Initialize ML result variables
         let mlResult = null;
@@ -1400,6 +1464,10 @@ app.post('/api/analyze', async (req, res) => {
         
         // ---- ML INFERENCE ----
         try {
+            if (storeError) {
+                // The store analysis was this request's ML call
+                throw storeError;
+            }
             console.log("🤖 Calling ML service...");
             
           const mlPayload = {
@@ -1408,16 +1476,17 @@ app.post('/api/analyze', async (req, res) => {
         product_name: product.name || productName || "Unknown Product",
         ingredients: product.ingredients || "",
         ingredients_text: product.ingredients || "",
-        nutriments: product.nutriments || {}
+        nutriments: product.nutriments || {},
+        category_tags: product.category_tags || []
     },
     userConditions: userConditions ? userConditions.map(c => c.name || c) : []
 };
             console.log("📤 ML Payload:", JSON.stringify(mlPayload, null, 2));
 
-            const mlResponse = await axios.post(
+            const mlResponse = storeResult ? { data: storeResult } : await axios.post(
                `${ML_SERVICE_URL}/analyze`,  // ✅ CORRECT - backtick at both ends!,
                 mlPayload,
-                { timeout: 8000 }
+                { timeout: ML_TIMEOUT_MS, headers: ML_DEADLINE_HEADERS }
             );
 
             console.log("✅ ML Response received!");
@@ -0,0 +1,6 @@
+# file name: conftest.py
+import sys
+from pathlib import Path
+
+# The services import their helpers as top-level modules
+sys.path.insert(0, str(Path(__file__).parent.parent / "ml_api"))
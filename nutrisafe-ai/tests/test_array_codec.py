@@ -0,0 +1,75 @@
+# file name: test_array_codec.py
+import asyncio
+import struct
+
+import numpy as np
+import pytest
+
+from array_codec import (
+    FrameTooLarge, decode_array, encode_array, feature_columns, gather_columns, read_frame
+)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_round_trip_is_an_aligned_view(dtype):
+    matrix = np.arange(12, dtype=dtype).reshape(3, 4)
+    body = encode_array(matrix, features=["a", "b", "c", "d"])
+    header, decoded = decode_array(body)
+    assert header["features"] == ["a", "b", "c", "d"]
+    assert header["shape"] == [3, 4]
+    np.testing.assert_array_equal(decoded, matrix)
+    assert decoded.dtype == dtype
+    assert not decoded.flags.writeable
+    assert (len(body) - decoded.nbytes) % 8 == 0
+
+
+def test_empty_matrix_round_trips():
+    header, decoded = decode_array(encode_array(np.zeros((0, 9), dtype=np.float32)))
+    assert decoded.shape == (0, 9)
+
+
+def test_unsupported_dtype_is_rejected():
+    with pytest.raises(ValueError):
+        encode_array(np.zeros((2, 2), dtype=np.int64))
+
+
+@pytest.mark.parametrize("body", [
+    b"NSA",
+    b"XXXX" + encode_array(np.zeros((1, 1)))[4:],
+    encode_array(np.zeros((2, 2)))[:-1],
+    encode_array(np.zeros(3)),
+    struct.pack("<4sI", b"NSA1", 4) + b"nope",
+])
+def test_malformed_frames_raise_value_error(body):
+    with pytest.raises(ValueError):
+        decode_array(body)
+
+
+def test_feature_columns_fold_dashes_and_leave_gaps():
+    wanted = ["sugars_100g", "saturated_fat_100g", "salt_100g"]
+    columns = feature_columns(["salt_100g", "saturated-fat_100g"], wanted, 2)
+    assert columns == [None, 1, 0]
+
+    matrix = np.array([[1.0, np.nan], [2.0, 3.0]])
+    np.testing.assert_array_equal(gather_columns(matrix, columns), [[0, 0, 1], [0, 3, 2]])
+
+
+@pytest.mark.parametrize("features, width", [
+    (["sugars_100g"], 2),
+    (["sugars_100g", "sugars-100g"], 2),
+    (["sugars_100g", "colour"], 2),
+    ("sugars_100g", 1),
+])
+def test_bad_feature_schemas_are_rejected(features, width):
+    with pytest.raises(ValueError):
+        feature_columns(features, ["sugars_100g", "salt_100g"], width)
+
+
+def test_read_frame_stops_at_the_limit():
+    async def chunks():
+        for _ in range(10):
+            yield b"x" * 100
+
+    assert len(asyncio.run(read_frame(chunks(), 1000))) == 1000
+    with pytest.raises(FrameTooLarge):
+        asyncio.run(read_frame(chunks(), 999))
@@ -0,0 +1,65 @@
+# file name: test_condition_profiles.py
+import pytest
+
+from condition_profiles import (
+    MAX_CONDITIONS, ConditionProfiles, InvalidProfile, conditions_from_id, normalize_conditions, profile_id
+)
+
+
+def test_id_round_trips():
+    conditions = ["Diabetes", "maladie cœliaque"]
+    value = profile_id(conditions)
+    assert value.startswith("cp1.") and "=" not in value
+    assert conditions_from_id(value) == conditions
+
+
+def test_normalize_strips_and_drops_empty():
+    assert normalize_conditions([" Diabetes ", "", "  "]) == ["Diabetes"]
+    with pytest.raises(InvalidProfile):
+        normalize_conditions("Diabetes")
+    with pytest.raises(InvalidProfile):
+        normalize_conditions(["x"] * (MAX_CONDITIONS + 1))
+
+
+@pytest.mark.parametrize("value", [
+    "Diabetes",
+    "cp1.!!!",
+    "cp1." + "A" * 5000,
+    profile_id([" Diabetes"]),  # not normalized, so not the canonical ID
+    profile_id(["Diabetes"]) + "A",
+])
+def test_non_canonical_ids_are_rejected(value):
+    with pytest.raises(InvalidProfile):
+        conditions_from_id(value)
+
+
+def test_profiles_compile_once_per_id():
+    compiled = []
+
+    def compile(conditions):
+        compiled.append(conditions)
+        return tuple(c.lower() for c in conditions)
+
+    profiles = ConditionProfiles(compile, maxsize=2)
+    value, profile = profiles.register([" Diabetes ", "Hypertension"])
+    assert profile == ("diabetes", "hypertension")
+    assert profiles.get(value) is profile
+    assert compiled == [["Diabetes", "Hypertension"]]
+
+    stats = profiles.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+@pytest.mark.parametrize("value", [None, 42, ["cp1.x"], {"id": "cp1.x"}])
+def test_non_string_ids_are_invalid_not_type_errors(value):
+    profiles = ConditionProfiles(lambda conditions: conditions)
+    with pytest.raises(InvalidProfile):
+        profiles.get(value)
+
+
+def test_failed_lookups_are_not_cached():
+    profiles = ConditionProfiles(lambda conditions: conditions)
+    with pytest.raises(InvalidProfile):
+        profiles.get("cp1.!!!")
+    assert profiles.stats()["size"] == 0
@@ -0,0 +1,56 @@
+# file name: test_ingredient_parser.py
+from ingredient_parser import ingredient_names, nest_spans, parse_ingredients
+
+
+def names(text):
+    return [text[s.start:s.end] for s in parse_ingredients(text)]
+
+
+def test_commas_and_semicolons_separate():
+    assert names("sugar, wheat flour; salt.") == ["sugar", "wheat flour", "salt"]
+
+
+def test_nested_group_and_percent():
+    text = "chocolate 30% (sugar, cocoa butter), milk"
+    spans = parse_ingredients(text)
+    assert names(text) == ["chocolate", "sugar", "cocoa butter", "milk"]
+    assert [(s.depth, s.percent, s.parent) for s in spans] == [
+        (0, 30.0, -1), (1, None, 0), (1, None, 0), (0, None, -1)
+    ]
+    roots = nest_spans(spans)
+    assert [len(node["children"]) for node in roots] == [2, 0]
+
+
+def test_bare_percent_annotates_enclosing_span():
+    spans = parse_ingredients("sugar (45%), salt")
+    assert [s.percent for s in spans] == [45.0, None]
+
+
+def test_trailing_percent_after_group():
+    spans = parse_ingredients("sugar (cane) 40%, salt")
+    assert spans[0].percent == 40.0
+    assert names("sugar (cane) 40%, salt") == ["sugar", "cane", "salt"]
+
+
+def test_comma_between_digits_does_not_split():
+    text = "cocoa 4,5%, 1,2-propanediol"
+    assert names(text) == ["cocoa", "1,2-propanediol"]
+    assert parse_ingredients(text)[0].percent == 4.5
+
+
+def test_label_and_value_are_both_kept():
+    assert names("emulsifier: lecithin, salt") == ["emulsifier", "lecithin", "salt"]
+
+
+def test_ingredients_heading_is_dropped():
+    assert names("Ingredients: sugar, salt") == ["sugar", "salt"]
+    assert names("Zutaten: Zucker") == ["Zucker"]
+
+
+def test_unbalanced_closer_keeps_top_level():
+    spans = parse_ingredients("sugar), salt (sea salt)")
+    assert [(s.depth, s.parent) for s in spans] == [(0, -1), (0, -1), (1, 1)]
+
+
+def test_ingredient_names_min_length():
+    assert ingredient_names("e1, sugar, oil", min_length=3) == ["sugar", "oil"]
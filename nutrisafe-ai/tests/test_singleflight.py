@@ -0,0 +1,139 @@
+# file name: test_singleflight.py
+import asyncio
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded, SharedDeadline, StageCosts, run_until
+from singleflight import SingleFlight, payload_key
+
+
+def test_payload_key_ignores_key_order():
+    assert payload_key({"a": 1, "b": [1, 2]}) == payload_key({"b": [1, 2], "a": 1})
+    assert payload_key({"a": 1}) != payload_key({"a": 2})
+
+
+def test_shared_deadline_takes_the_latest_expiry():
+    early, late = Deadline(0.1), Deadline(5.0)
+    shared = SharedDeadline()
+    shared.join(late)
+    shared.join(early)
+    assert shared.expires == late.expires
+
+    shared.join(Deadline())
+    assert not shared.bounded
+
+
+def test_shared_deadline_is_cancelled_when_the_last_caller_leaves():
+    shared = SharedDeadline()
+    shared.join(Deadline(1.0))
+    shared.join(Deadline(1.0))
+    shared.leave()
+    assert not shared.cancelled
+    shared.leave()
+    assert shared.cancelled
+
+
+def test_fit_records_the_dropped_tail():
+    costs = StageCosts({"ingredient_analysis": 0.01})
+    deadline = Deadline(0.0)
+    assert deadline.fit(costs, "ingredient_analysis", 5) == 0
+    assert Deadline().fit(costs, "ingredient_analysis", 5) == 5
+    assert deadline.omitted == ["ingredient_analysis"]
+
+
+def test_run_until_cancels_the_deadline_on_expiry():
+    async def main():
+        deadline = Deadline(0.05)
+        with pytest.raises(DeadlineExceeded):
+            await run_until(deadline, asyncio.sleep(1))
+        return deadline
+
+    assert asyncio.run(main()).cancelled
+
+
+async def staged_work(shared, steps=10, step=0.02):
+    """Stands in for analyze_payload: checks the deadline between stages"""
+    for i in range(steps):
+        shared.check(f"stage {i}")
+        await asyncio.sleep(step)
+    return {"score": 42}
+
+
+def test_identical_concurrent_calls_run_once():
+    async def main():
+        flights = SingleFlight()
+        results = await asyncio.gather(*[
+            flights.do_until("key", Deadline(), None, staged_work) for _ in range(3)
+        ])
+        return flights, results
+
+    flights, results = asyncio.run(main())
+    assert results == [{"score": 42}] * 3
+    assert flights.stats() == {"executions": 1, "coalesced": 2, "in_flight": 0}
+
+
+def test_merged_requests_keep_their_own_budgets():
+    """The first caller timing out must not cancel the work for a more patient one"""
+    async def main():
+        flights = SingleFlight()
+        shared_deadlines = []
+
+        async def work(shared):
+            shared_deadlines.append(shared)
+            return await staged_work(shared)
+
+        leader = asyncio.ensure_future(flights.do_until("key", Deadline(0.1), None, work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flights.do_until("key", Deadline(5.0), None, work))
+
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        assert not shared_deadlines[0].cancelled
+        assert await follower == {"score": 42}
+        return flights, shared_deadlines
+
+    flights, shared_deadlines = asyncio.run(main())
+    assert flights.stats()["executions"] == 1
+    assert flights.stats()["coalesced"] == 1
+    assert shared_deadlines[0].cancelled  # once the follower left too
+
+
+def test_abandoned_work_stops_and_is_not_reused():
+    async def main():
+        flights = SingleFlight()
+        stages = []
+
+        async def work(shared):
+            for i in range(50):
+                shared.check(f"stage {i}")
+                stages.append(i)
+                await asyncio.sleep(0.01)
+            return "late"
+
+        with pytest.raises(DeadlineExceeded):
+            await flights.do_until("key", Deadline(0.05), None, work)
+        ran = len(stages)
+        # A new caller starts fresh work instead of joining the cancelled one
+        assert await flights.do_until("key", Deadline(), None, staged_work) == {"score": 42}
+        await asyncio.sleep(0.05)
+        return flights, ran, len(stages)
+
+    flights, ran, finally_ran = asyncio.run(main())
+    assert ran < 50 and finally_ran <= ran + 1
+    assert flights.stats()["executions"] == 2
+
+
+def test_errors_reach_every_caller():
+    async def main():
+        flights = SingleFlight()
+
+        async def fail(shared):
+            await asyncio.sleep(0.01)
+            raise ValueError("bad payload")
+
+        return await asyncio.gather(
+            *[flights.do_until("key", Deadline(), None, fail) for _ in range(2)],
+            return_exceptions=True
+        )
+
+    assert [type(e) for e in asyncio.run(main())] == [ValueError, ValueError]